@@ -1,22 +1,46 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.security import HTTPBearer
+import time
+_DEBUT_IMPORTS = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from prometheus_client import CONTENT_TYPE_LATEST
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+import asyncio
+import contextvars
 import uuid
-import csv
+import secrets
+import json
+from collections import Counter
+import threading
 from contextlib import asynccontextmanager
 from pathlib import Path
 import os
-from langdetect import detect
 from langdetect.lang_detect_exception import LangDetectException
 # Importez votre classe existante
-from app import PremiumFiscalAssistant  # Remplacez par le bon import
-from elasticsearch import Elasticsearch
+from app import PremiumFiscalAssistant, ES_TIMEOUT_RECHERCHE, MESSAGE_HORS_DOMAINE, PREFIXE_REPONSE_GENERALE, SUFFIXE_REPONSE_GENERALE
+import es_client
+import metrics
+from circuit_breaker import CircuitOuvert
+from coalescing import Coalesceur
+from conversation_logger import JournalConversations
+from conversation_store import StoreConversations
+from text_utils import normaliser_question
+from worker_pool import PoolBorne, PoolSaturee, DelaiFileDepasse, Place
+
+# Durées (s) du démarrage: imports, connexion Elasticsearch, assistant, modèles
+temps_demarrage: Dict[str, float] = {"imports": round(time.perf_counter() - _DEBUT_IMPORTS, 3)}
+# Chargement des modèles en arrière-plan dès le démarrage (sinon au premier usage)
+PRECHAUFFAGE = os.getenv("PRECHAUFFAGE", "1") == "1"
 
 
 # Configuration de l'API
 security = HTTPBearer()
+# Jeton des endpoints /api/admin (désactivés s'il n'est pas défini)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 app = FastAPI(title="API Assistant Fiscal Premium")
 
 
@@ -31,8 +55,32 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def tracer_requetes(request: Request, call_next):
+    """Trace chaque requête: durée par endpoint, étapes du pipeline (en-tête Server-Timing)"""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    # Chemins inconnus regroupés: pas une série Prometheus par URL
+    endpoint = request.url.path if request.url.path in chemins_connus() else "autre"
+    statut = 500
+    with metrics.tracer_requete(endpoint) as trace:
+        try:
+            response = await call_next(request)
+            statut = response.status_code
+        finally:
+            metrics.DUREE_REQUETE.labels(endpoint, str(statut)).observe(time.perf_counter() - trace.debut)
+    if trace.etapes:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+def chemins_connus() -> set:
+    if not hasattr(app.state, "chemins"):
+        app.state.chemins = {route.path for route in app.routes}
+    return app.state.chemins
+
+
 # 1. Chemin corrigé et isolé dans un sous-répertoire
-CONVERSATION_DB = Path(__file__).parent / "conversation_data"  # Crée un sous-dossier dédié
+CONVERSATION_DB = Path(os.getenv("CONVERSATION_DIR", Path(__file__).parent / "conversation_data"))  # Crée un sous-dossier dédié
 
 # 2. Création sécurisée du répertoire
 try:
@@ -47,68 +95,146 @@ except Exception as e:
 if not os.access(CONVERSATION_DB, os.W_OK):
     raise RuntimeError(f"Pas d'accès en écriture à {CONVERSATION_DB}")
 
+# 4. Historique consultable en SQLite
+store = StoreConversations(CONVERSATION_DB / "conversations.sqlite3")
+
+# 5. Journal écrit en arrière-plan par lots (format: csv, csv.gz ou parquet), qui alimente aussi SQLite
+journal = JournalConversations(
+    CONVERSATION_DB,
+    format=os.getenv("CONVERSATION_FORMAT", "csv"),
+    taille_max=int(float(os.getenv("CONVERSATION_MAX_MO", "50")) * 1024 * 1024),
+    taille_lot=int(os.getenv("CONVERSATION_TAILLE_LOT", "100")),
+    intervalle=float(os.getenv("CONVERSATION_FLUSH_SECONDES", "2")),
+    sur_lot=store.enregistrer_lot
+)
+
+# Utilisateur de la requête en cours (suit le pipeline dans les threads du pool)
+utilisateur_courant: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("utilisateur_courant", default=None)
+
 # Modèles Pydantic
 class QuestionRequest(BaseModel):
     question: str
     user_id: Optional[str] = None  # Optionnel pour suivre les utilisateurs
+    session_id: Optional[str] = None  # Conversation en cours (par défaut: user_id)
 
 class QAItem(BaseModel):
     question: str
     answer: str
     timestamp: datetime
     conversation_id: str
+    source: Optional[str] = None  # Chemin ayant servi la réponse (base, cache, agent, llm, ...)
+    user_id: Optional[str] = None
+
+class ConversationsPage(BaseModel):
+    items: List[QAItem]
+    next_cursor: Optional[str] = None  # À repasser en `cursor` pour la page suivante
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    user_id: Optional[str] = None
+
+class BatchItem(BaseModel):
+    index: int
+    status: str  # ok, invalid, rejected (pool saturé), error
+    item: Optional[QAItem] = None
+    detail: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+    stats: Dict[str, int]
+
+class CompletionEntry(BaseModel):
+    cle: str
+    modele: str
+    empreinte_prompt: str
+    question: str
+    taille: int
+    cree: datetime
+    dernier_acces: datetime
+    expire: datetime
+    hits: int
+
+class CompletionsPage(BaseModel):
+    items: List[CompletionEntry]
+    stats: Dict[str, float]
 
 class HealthCheck(BaseModel):
     status: str
     details: Dict[str, str]
 
 # Variables globales
-assistant = None
-conversation_history = []
+_assistant_lock = threading.Lock()
+# Nombre de réponses servies par chemin (mesure des appels LLM évités)
+route_stats = Counter()
 
+# Lots de questions (/api/ask/batch)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_PARALLELISME_LLM = int(os.getenv("BATCH_PARALLELISME_LLM", "2"))
+
+# Questions identiques simultanées calculées une seule fois (single-flight)
+COALESCENCE = os.getenv("COALESCENCE", "1") == "1"
+coalesceur = Coalesceur()
+
+# Pool borné pour le pipeline de l'assistant (appels bloquants Groq / Elasticsearch)
+pool = PoolBorne(
+    max_concurrence=int(os.getenv("API_MAX_CONCURRENCE", "4")),
+    max_file=int(os.getenv("API_MAX_FILE", "16")),
+    delai_file=float(os.getenv("API_DELAI_FILE", "10"))
+)
 
-# Initialisation Elasticsearch
-@app.on_event("startup")
-async def startup():
-    try:
-        app.state.es =  Elasticsearch(
-                os.getenv(
-                    "ELASTICSEARCH_URL", 
-                    "https://my-elasticsearch-project-beb3d2.es.us-east-1.aws.elastic.cloud:443"
-                ),
-                api_key=os.getenv("ELASTIC_API_KEY"),
-                verify_certs=True,
-                ssl_show_warn=True,
-                timeout=30,
-                max_retries=2
-        )
-        if not app.state.es.ping():
-            raise RuntimeError("Connexion Elasticsearch échouée")
-        print("✅ Elasticsearch connecté")
-    except Exception as e:
-        print(f"❌ Erreur Elasticsearch: {str(e)}")
-        raise
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Gestion du cycle de vie de l'API"""
-    global assistant
-    # Initialisation de l'assistant
+    """Gestion du cycle de vie de l'API.
+
+    Seuls les composants légers sont prêts avant d'accepter du trafic
+    (filtres, client Elasticsearch, moteur local); les modèles se chargent
+    au premier usage ou par le préchauffage en arrière-plan.
+    """
+    debut = time.perf_counter()
+    # Client Elasticsearch unique du processus, lié à la boucle d'uvicorn
+    es = await es_client.ouvrir()
+    temps_demarrage["elasticsearch"] = round(time.perf_counter() - debut, 3)
+    # Initialisation de l'assistant (hors de la boucle)
     try:
-        assistant = PremiumFiscalAssistant()
+        app.assistant = await asyncio.to_thread(PremiumFiscalAssistant, es)
+        temps_demarrage["assistant"] = round(time.perf_counter() - debut - temps_demarrage["elasticsearch"], 3)
         print("✅ Assistant fiscal initialisé avec succès")
     except Exception as e:
         print(f"❌ Erreur d'initialisation: {str(e)}")
         raise
+    print("⏱️ Démarrage: " + ", ".join(f"{k}={v:.2f}s" for k, v in rapport_demarrage().items()))
+
+    # Journaux CSV des jours passés indexés dans SQLite (une seule fois par fichier)
+    app.state.import_journaux = asyncio.create_task(asyncio.to_thread(importer_journaux))
+    if PRECHAUFFAGE:
+        app.state.prechauffage = asyncio.create_task(asyncio.to_thread(app.assistant.prechauffer))
     yield
     # Nettoyage
-    assistant = None
-    conversation_history.clear()
+    pool.fermer()
+    # Les échanges encore en file sont écrits avant l'arrêt
+    await asyncio.to_thread(journal.fermer)
+    await es_client.fermer()
+    del app.assistant
+
+def importer_journaux():
+    try:
+        importes = store.importer_journaux(CONVERSATION_DB)
+        if importes:
+            print(f"📥 {importes} conversations importées des journaux dans l'historique")
+    except Exception as e:
+        print(f"⚠️ Erreur d'import des journaux de conversations: {e}")
+
+def rapport_demarrage() -> Dict[str, float]:
+    """Durées de démarrage de l'API et de l'assistant (modèles chargés compris)"""
+    rapport = dict(temps_demarrage)
+    assistant = getattr(app, 'assistant', None)
+    if assistant is not None:
+        rapport.update({f"assistant.{k}": v for k, v in assistant.temps_demarrage.items()})
+    return rapport
 
 app.router.lifespan_context = lifespan
 
-# Stockage des conversations (à remplacer par une base de données en production)
-conversation_history = []
 @app.get("/")
 async def root():
     return {
@@ -116,102 +242,403 @@ async def root():
         "endpoints": {
             "documentation": "/docs",
             "ask": "/api/ask",
-            "health": "/api/health"
+            "ask_stream": "/api/ask/stream",
+            "ask_batch": "/api/ask/batch",
+            "health": "/api/health",
+            "ready": "/api/ready",
+            "metrics": "/metrics"
         }
     }
+async def executer_dans_pool(fonction, *args):
+    """Exécute `fonction` dans le pool borné en traduisant la saturation en 429/503"""
+    try:
+        return await pool.executer(fonction, *args)
+    except (PoolSaturee, DelaiFileDepasse) as e:
+        raise refus_pool(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+
+async def reserver_place() -> Place:
+    """Place du pool pour un flux LLM, avec la même saturation 429/503 qu'executer_dans_pool"""
+    try:
+        return await pool.reserver()
+    except (PoolSaturee, DelaiFileDepasse) as e:
+        raise refus_pool(e)
+
+def refus_pool(e) -> HTTPException:
+    statut = 429 if isinstance(e, PoolSaturee) else 503
+    return HTTPException(status_code=statut, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 @app.post("/api/ask", response_model=QAItem)
-async def ask_question(request: QuestionRequest):
+async def ask_question(request: QuestionRequest, response: Response):
+    """
+    Endpoint strictement fiscal avec toutes les validations du CLI.
+    Le pipeline s'exécute dans le pool borné pour ne jamais bloquer la boucle asyncio.
+    """
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question vide")
+
+    utilisateur_courant.set(request.user_id)
+    session_id = request.session_id or request.user_id
+    if not COALESCENCE:
+        qa_item, attente_ms = await executer_dans_pool(traiter_question, question, session_id)
+    else:
+        async def calculer():
+            return await executer_dans_pool(traiter_question, question, session_id), session_id
+
+        ((qa_item, attente_ms), session_calcul), partage = await coalesceur.executer(
+            cle_coalescence(question, session_id), calculer
+        )
+        if partage:
+            qa_item = reponse_partagee(question, qa_item, session_id, session_calcul)
+            response.headers["X-Coalesced"] = "1"
+    response.headers["X-Queue-Wait-Ms"] = f"{attente_ms:.1f}"
+    return qa_item
+
+def avec_historique(session_id: Optional[str]) -> bool:
+    """Vrai si l'historique de la session peut changer la réponse (réponse propre à cette session)"""
+    assistant = getattr(app, 'assistant', None)
+    return bool(session_id and assistant and assistant.sessions.a_historique(session_id))
+
+def cle_coalescence(question: str, session_id: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Clé de regroupement: la question normalisée, et la session si son historique peut changer la réponse"""
+    return normaliser_question(question), session_id if avec_historique(session_id) else None
+
+def reponse_partagee(question: str, calcul: QAItem, session_id: Optional[str],
+                     session_calcul: Optional[str]) -> QAItem:
+    """QAItem propre à une requête servie par le calcul d'une autre (conversation_id, utilisateur)"""
+    metrics.COALESCEES.inc()
+    if calcul.source == "agent" and session_id and session_id != session_calcul:
+        # L'échange entre aussi dans la mémoire de la session de cette requête
+        app.assistant.sessions.obtenir(session_id).ajouter_echange(question, calcul.answer)
+    return create_response(question, calcul.answer, source=calcul.source)
+
+@app.post("/api/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
     """
-    Endpoint strictement fiscal avec toutes les validations du CLI
+    Variante Server-Sent Events de /api/ask.
+
+    Événements: `answer` (réponse complète immédiate: salutation, filtre,
+    cache ou base de connaissances), `token` (fragment généré par le LLM),
+    `done` (métadonnées QAItem finales, avec `replaced` si la réponse
+    validée diffère du texte diffusé), `error`.
+
+    La génération en flux ne tient pas compte de l'historique de la session
+    et ne l'alimente pas (réponses partagées par le cache sémantique).
+    """
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question vide")
+
+    utilisateur_courant.set(request.user_id)
+    session_id = request.session_id or request.user_id
+    qa_item, attente_ms = await executer_dans_pool(traiter_flux_sans_llm, question, session_id)
+    place = None
+    if qa_item is None and not app.assistant.disjoncteur_llm.est_ouvert():
+        # La génération occupe une place du pool pendant toute la diffusion, comme l'agent de /api/ask
+        place = await reserver_place()
+        attente_ms += place.attente_ms
+    return StreamingResponse(
+        flux_reponse(question, qa_item, place),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Pas de mise en tampon par un proxy
+            "X-Queue-Wait-Ms": f"{attente_ms:.1f}"
+        },
+        # Place rendue même si le flux n'a jamais démarré (client parti)
+        background=BackgroundTask(place.liberer) if place else None
+    )
+
+@app.post("/api/ask/batch", response_model=BatchResponse)
+async def ask_batch(request: BatchRequest):
+    """
+    Traitement d'un lot de questions (partenaires, tests de non-régression).
+
+    Filtres en un passage, un seul encode et un seul msearch pour tout le
+    lot; seules les questions restantes passent par l'agent, au plus
+    BATCH_PARALLELISME_LLM à la fois. Les résultats suivent l'ordre des
+    questions, avec un statut par élément.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Lot vide")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"Au plus {BATCH_MAX_QUESTIONS} questions par lot")
+
+    utilisateur_courant.set(request.user_id)
+    questions = [q.strip() for q in request.questions]
+    valides = [i for i, q in enumerate(questions) if q]
+    items, _ = await executer_dans_pool(traiter_lot_sans_llm, [questions[i] for i in valides])
+
+    results = [BatchItem(index=i, status="invalid", detail="Question vide") for i in range(len(questions))]
+    for i, item in zip(valides, items):
+        if item is not None:
+            results[i] = BatchItem(index=i, status="ok", item=item)
+
+    places = asyncio.Semaphore(BATCH_PARALLELISME_LLM)
+    coalescees = 0
+
+    async def avec_agent(i: int):
+        nonlocal coalescees
+        async with places:
+            try:
+                if not COALESCENCE:
+                    item, _ = await pool.executer(traiter_avec_agent, questions[i], None)
+                else:
+                    (item, _), partage = await coalesceur.executer(
+                        ("agent", normaliser_question(questions[i])),
+                        lambda: pool.executer(traiter_avec_agent, questions[i], None)
+                    )
+                    if partage:
+                        item = reponse_partagee(questions[i], item, None, None)
+                        coalescees += 1
+                results[i] = BatchItem(index=i, status="ok", item=item)
+            except (PoolSaturee, DelaiFileDepasse) as e:
+                results[i] = BatchItem(index=i, status="rejected", detail=str(e))
+            except Exception as e:
+                results[i] = BatchItem(index=i, status="error", detail=str(e))
+
+    await asyncio.gather(*(avec_agent(i) for i, item in zip(valides, items) if item is None))
+
+    stats = Counter(r.status for r in results)
+    stats.update(f"source:{r.item.source}" for r in results if r.item is not None)
+    if coalescees:
+        stats["coalesced"] = coalescees
+    return BatchResponse(results=results, stats=dict(stats))
+
+def evenement_sse(nom: str, donnees: dict) -> str:
+    return f"event: {nom}\ndata: {json.dumps(donnees, ensure_ascii=False, default=str)}\n\n"
+
+async def flux_reponse(question: str, qa_item: Optional[QAItem], place: Optional[Place] = None):
+    """Diffuse la réponse: immédiate si connue sans LLM, sinon fragment par fragment.
+
+    `place`: place du pool réservée pour la génération, rendue à la fin du flux.
     """
     try:
-        # Initialisation et vérifications de base
+        async for evenement in _flux_reponse(question, qa_item):
+            yield evenement
+    finally:
+        if place is not None:
+            place.liberer()
+
+async def _flux_reponse(question: str, qa_item: Optional[QAItem]):
+    if qa_item is not None:
+        yield evenement_sse("answer", {"text": qa_item.answer, "source": qa_item.source})
+        yield evenement_sse("done", {**qa_item.model_dump(mode="json"), "replaced": False})
+        return
+    if app.assistant.disjoncteur_llm.est_ouvert():
+        # LLM coupé: réponse dégradée depuis la base, sans ouvrir de flux de génération
+        answer = await asyncio.to_thread(app.assistant.repondre_sans_llm, question)
+        qa_item = create_response(question, answer, source="base_degradee")
+        yield evenement_sse("answer", {"text": answer, "source": qa_item.source})
+        yield evenement_sse("done", {**qa_item.model_dump(mode="json"), "replaced": False})
+        return
+
+    diffuse = PREFIXE_REPONSE_GENERALE
+    yield evenement_sse("token", {"text": PREFIXE_REPONSE_GENERALE})
+    try:
+        fragments = []
+        if not app.assistant.est_charge("llm"):
+            # Premier usage: chargement du LLM hors de la boucle asyncio
+            await asyncio.to_thread(lambda: app.assistant.llm)
+        async for fragment in app.assistant.astream_reponse_fiscale(question):
+            fragments.append(fragment)
+            yield evenement_sse("token", {"text": fragment})
+        yield evenement_sse("token", {"text": SUFFIXE_REPONSE_GENERALE})
+        generee = "".join(fragments)
+        diffuse += generee + SUFFIXE_REPONSE_GENERALE
+        # Validation et cache (embedding) hors de la boucle asyncio
+        answer, source = await asyncio.to_thread(finaliser_reponse_llm, question, generee)
+    except CircuitOuvert:
+        answer, source = await asyncio.to_thread(app.assistant.repondre_sans_llm, question), "base_degradee"
+    except Exception as e:
+        print(f"Erreur de traitement (flux): {str(e)}")
+        yield evenement_sse("error", {"detail": "Erreur pendant la génération"})
+        answer, source = ("⚠️ Désolé, je rencontre une difficulté technique. "
+                          "Veuillez reformuler votre question ou consulter www.dgid.sn"), "erreur"
+
+    qa_item = create_response(question, answer, source=source)
+    yield evenement_sse("done", {**qa_item.model_dump(mode="json"), "replaced": answer != diffuse})
+
+def finaliser_reponse_llm(question: str, generee: str) -> Tuple[str, str]:
+    """Valide une réponse générée en flux; retourne (réponse finale, source).
+
+    Le prompt du flux ne contient pas l'historique: l'échange n'entre pas dans
+    la mémoire de session, sans quoi la session perdrait le cache partagé et
+    le regroupement des questions identiques pour des réponses qui n'en dépendent pas.
+    """
+    if should_reject_response(generee):
+        answer, source = ("⛔ [Réponse bloquée] Cette question semble hors domaine fiscal. "
+                          "Veuillez poser une question clairement liée à la fiscalité sénégalaise."), "rejet"
+    else:
+        answer, source = PREFIXE_REPONSE_GENERALE + generee + SUFFIXE_REPONSE_GENERALE, "llm"
+        app.assistant.mettre_en_cache(question, answer)
+    return answer, source
+
+def get_assistant() -> PremiumFiscalAssistant:
+    """Assistant partagé par les requêtes (créé au premier appel)"""
+    with _assistant_lock:
         if not hasattr(app, 'assistant'):
             app.assistant = PremiumFiscalAssistant()
-            
-        question = request.question.strip()
-        if not question:
-            raise HTTPException(status_code=400, detail="Question vide")
-
-        # 1. Gestion PRIORITAIRE des salutations (avant la détection de langue)
-        question_lower = question.lower()
-        if any(salut in question_lower for salut in app.assistant.salutations):
-            # Cas spécial pour les salutations simples (1-2 mots)
-            if len(question.split()) <= 2:
-                return create_response(
-                    question,
-                    "💼 Bonjour ! Assistant fiscal sénégalais à votre service. Posez-moi vos questions sur les impôts et taxes."
-                )
-            # Cas des salutations + question (ex: "Bonjour, comment payer la TVA ?")
-            # => On continue le traitement normal
-
-        # 2. Vérification linguistique (sauf pour les salutations simples)
-        try:
-            if detect(question) != "fr" :
-                return create_response(
-                    question,
-                    "⛔ Veuillez poser votre question en français uniquement."
-                )
-        except LangDetectException:
-            # On accepte les salutations même si la détection échoue
-            if not any(salut in question_lower for salut in app.assistant.salutations):
-                return create_response(
-                    question,
-                    "⚠️ Impossible de détecter la langue de votre question."
-                )
-
-        # Traitement par l'agent avec gestion d'erreur
-        try:
-            response = app.assistant.agent.invoke({"input": question})
-            answer = response['output']
-            
-            # Validation finale de la réponse
-            if should_reject_response(answer):
-                answer = ("⛔ [Réponse bloquée] Cette question semble hors domaine fiscal. "
-                          "Veuillez poser une question clairement liée à la fiscalité sénégalaise.")
-            
-                qa_item = create_response(question, answer)
-                save_conversation(qa_item)
-            return create_response(question, answer)
-            
-        except Exception as e:
-            print(f"Erreur de traitement: {str(e)}")
-            return create_response(question,
-                "⚠️ Désolé, je rencontre une difficulté technique. "
-                "Veuillez reformuler votre question ou consulter www.dgid.sn")
+    return app.assistant
+
+def filtrer_question(question: str) -> Optional[QAItem]:
+    """Salutations et filtre de langue; retourne la réponse si la question s'arrête là"""
+    # 1. Gestion PRIORITAIRE des salutations (avant la détection de langue)
+    with metrics.etape("classification"):
+        matches = app.assistant.classifieur.analyser(question)
+    if matches["salutation"]:
+        # Cas spécial pour les salutations simples (1-2 mots)
+        if len(question.split()) <= 2:
+            return create_response(
+                question,
+                "💼 Bonjour ! Assistant fiscal sénégalais à votre service. Posez-moi vos questions sur les impôts et taxes.",
+                source="salutation"
+            )
+        # Cas des salutations + question (ex: "Bonjour, comment payer la TVA ?")
+        # => On continue le traitement normal
+
+    # 2. Vérification linguistique (sauf pour les salutations simples)
+    try:
+        with metrics.etape("detect_langue"):
+            francais = app.assistant.filtre_langue.est_francais(question)
+        if not francais:
+            return create_response(
+                question,
+                "⛔ Veuillez poser votre question en français uniquement.",
+                source="filtre"
+            )
+    except LangDetectException:
+        # On accepte les salutations même si la détection échoue
+        if not matches["salutation"]:
+            return create_response(
+                question,
+                "⚠️ Impossible de détecter la langue de votre question.",
+                source="filtre"
+            )
+    return None
+
+def traiter_sans_llm(question: str, session_id: Optional[str] = None) -> Optional[QAItem]:
+    """Étapes du pipeline sans appel LLM (filtres, cache, base certifiée).
+
+    Retourne None si la question doit être confiée au LLM. Le cache global
+    n'est pas consulté pour une session qui a un historique: la même
+    question peut y appeler une autre réponse.
+    """
+    get_assistant()
+    qa_item = filtrer_question(question)
+    if qa_item is not None:
+        return qa_item
+
+    # Réponse déjà servie pour une question équivalente (cache sémantique)
+    cached_answer = None if avec_historique(session_id) else app.assistant.chercher_en_cache(question)
+    if cached_answer:
+        return create_response(question, cached_answer, source="cache")
+
+    # 3. Routeur: réponse certifiée directe si la base de connaissances est confiante
+    answer = app.assistant.repondre_depuis_base(question)
+    if answer:
+        app.assistant.mettre_en_cache(question, answer)
+        return create_response(question, answer, source="base")
+    return None
+
+def traiter_flux_sans_llm(question: str, session_id: Optional[str] = None) -> Optional[QAItem]:
+    """traiter_sans_llm pour le flux, qui n'a pas d'agent: le filtre de domaine de son outil est appliqué ici"""
+    qa_item = traiter_sans_llm(question, session_id)
+    if qa_item is None and not app.assistant._est_question_fiscale(question):
+        return create_response(question, MESSAGE_HORS_DOMAINE, source="filtre")
+    return qa_item
+
+def traiter_lot_sans_llm(questions: List[str]) -> List[Optional[QAItem]]:
+    """traiter_sans_llm pour un lot: un seul encode, une seule recherche (msearch)"""
+    get_assistant()
+    resultats = [filtrer_question(q) for q in questions]
+    restantes = [i for i, item in enumerate(resultats) if item is None]
+    if not restantes:
+        return resultats
+
+    textes = [questions[i] for i in restantes]
+    vecteurs = app.assistant.vecteurs_questions(textes)
+
+    # Cache sémantique avec les embeddings déjà calculés
+    a_chercher = []
+    for j, i in enumerate(restantes):
+        cached_answer = app.assistant.chercher_en_cache(
+            questions[i], vecteurs[j] if vecteurs is not None else None
+        )
+        if cached_answer:
+            resultats[i] = create_response(questions[i], cached_answer, source="cache")
+        else:
+            a_chercher.append(j)
 
+    # Routeur par lot sur la base de connaissances
+    reponses = app.assistant.repondre_depuis_base_lot(
+        [textes[j] for j in a_chercher],
+        vecteurs[a_chercher] if vecteurs is not None else None
+    )
+    for j, answer in zip(a_chercher, reponses):
+        if answer:
+            i = restantes[j]
+            app.assistant.mettre_en_cache(questions[i], answer, vecteurs[j] if vecteurs is not None else None)
+            resultats[i] = create_response(questions[i], answer, source="base")
+    return resultats
+
+def traiter_avec_agent(question: str, session_id: Optional[str] = None) -> QAItem:
+    """Étape LLM du pipeline: agent, validation finale et mise en cache"""
+    # Réponse fondée sur l'historique de la session: propre à cette session, hors du cache global
+    historique = avec_historique(session_id)
+    # 4. Cas peu confiants: agent LLM, avec gestion d'erreur
+    try:
+        answer = app.assistant.repondre_avec_agent(question, session_id)
+        
+        # Validation finale de la réponse
+        if should_reject_response(answer):
+            answer = ("⛔ [Réponse bloquée] Cette question semble hors domaine fiscal. "
+                      "Veuillez poser une question clairement liée à la fiscalité sénégalaise.")
+        
+            return create_response(question, answer, source="rejet")
+        if not historique:
+            app.assistant.mettre_en_cache(question, answer)
+        return create_response(question, answer, source="agent")
+        
+    except CircuitOuvert:
+        # LLM coupé par son disjoncteur: réponse depuis la base seule, sans attendre Groq
+        return create_response(question, app.assistant.repondre_sans_llm(question), source="base_degradee")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
+        print(f"Erreur de traitement: {str(e)}")
+        return create_response(question,
+            "⚠️ Désolé, je rencontre une difficulté technique. "
+            "Veuillez reformuler votre question ou consulter www.dgid.sn",
+            source="erreur")
+
+def traiter_question(question: str, session_id: Optional[str] = None) -> QAItem:
+    """Pipeline synchrone complet (filtres, cache, base, agent), exécuté dans le pool"""
+    qa_item = traiter_sans_llm(question, session_id)
+    if qa_item is not None:
+        return qa_item
+    return traiter_avec_agent(question, session_id)
 
 # Fonctions utilitaires
-def create_response(question: str, answer: str) -> QAItem:
+def create_response(question: str, answer: str, source: Optional[str] = None) -> QAItem:
     """Crée une réponse standardisée avec suivi de conversation"""
     item = QAItem(
         question=question,
         answer=answer,
         timestamp=datetime.now(),
-        conversation_id=str(uuid.uuid4())
+        conversation_id=str(uuid.uuid4()),
+        source=source,
+        user_id=utilisateur_courant.get()
     )
-    conversation_history.append(item)
+    save_conversation(item)
+    if source:
+        route_stats[source] += 1
+        metrics.compter_reponse(source)
     return item
 
 def save_conversation(qa_item: QAItem):
-    """Sauvegarde dans un fichier CSV avec date"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    filepath = CONVERSATION_DB / f"conversations_{today}.csv"
-    
-    file_exists = filepath.exists()
-    
-    with open(filepath, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f, delimiter='|')
-        if not file_exists:
-            writer.writerow(["timestamp", "question", "answer", "conversation_id"])
-        writer.writerow([
-            qa_item.timestamp.isoformat(),
-            qa_item.question,
-            qa_item.answer,
-            qa_item.conversation_id
-        ])
+    """Journalise l'échange (écriture différée par le thread du journal)"""
+    journal.enregistrer(qa_item.model_dump())
 
 def is_question_fiscale_strict(question: str) -> bool:
     """Version renforcée de la validation des questions"""
@@ -219,43 +646,47 @@ def is_question_fiscale_strict(question: str) -> bool:
     if not assistant:
         return False
     
-    # Vérification standard
-    if not assistant._est_question_fiscale(question):
+    # Vérification standard et liste noire de sujets non fiscaux, en une seule analyse
+    matches = assistant.classifieur.analyser(question)
+    if not assistant._est_question_fiscale(question, matches):
         return False
     
-    # Liste noire de sujets non fiscaux
-    non_fiscal_keywords = {
-        "président", "premier ministre", "ministre", "gouvernement",
-        "fifa", "politique", "élection", "parti", "sport", "football",
-        "biographie", "histoire", "culture", "religion","nourriture",
-        "voyage", "tourisme", "santé", "médecine", "éducation",
-        "loisirs", "cinéma", "musique", "art", "littérature",
-        "sciences", "technologie", "informatique", "programmation",
-        "environnement", "écologie", "climat", "nature", "animaux",
-        "philosophie", "psychologie", "sociologie", "anthropologie",
-        "carrière", "emploi", "recrutement", "formation", "stage",
-        "capitale", "monnaie", "économie", "marché"
-    }
-    
-    return not any(keyword in question.lower() for keyword in non_fiscal_keywords)
+    return not matches["hors_domaine"]
 
 def should_reject_response(answer: str) -> bool:
     """Détecte les réponses inappropriées qui auraient pu passer"""
-    rejection_phrases = {
-        "je ne sais pas", "je ne connais pas", "premier ministre",
-        "président de", "ministre de", "dans le domaine", "hors sujet"
-    }
+    matches = app.assistant.classifieur.analyser(answer)
+    return (bool(matches["rejet"])
+            or not app.assistant._est_question_fiscale(answer, matches))
     
-    answer_lower = answer.lower()
-    return (any(phrase in answer_lower for phrase in rejection_phrases) 
-            or not app.assistant._est_question_fiscale(answer))
-    
-@app.get("/api/conversations", response_model=List[QAItem])
-async def get_conversations(limit: int = 10):
+@app.get("/api/conversations", response_model=ConversationsPage)
+async def get_conversations(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    source: Optional[str] = None
+):
     """
-    Endpoint pour récupérer l'historique des conversations
+    Historique des conversations (tous workers confondus), du plus récent au plus ancien.
+
+    Pagination par curseur: `next_cursor` de la réponse donne la page
+    suivante. Filtres: `user_id`, période [`since`, `until`[ et type de
+    réponse (`source`: base, cache, agent, rejet...). Les échanges
+    apparaissent après l'écriture du lot du journal (quelques secondes).
     """
-    return conversation_history[-limit:]
+    try:
+        curseur = int(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+    elements, suivant = await asyncio.to_thread(
+        store.rechercher, limit, curseur, user_id, since, until, source
+    )
+    return ConversationsPage(
+        items=[QAItem(**element) for element in elements],
+        next_cursor=str(suivant) if suivant is not None else None
+    )
 
 @app.get("/api/health", response_model=HealthCheck)
 async def health_check():
@@ -263,18 +694,106 @@ async def health_check():
     Endpoint de vérification de l'état de l'API
     """
     status = "healthy"
+    assistant = getattr(app, 'assistant', None)
+    # Disjoncteur ouvert: pas de ping, qui attendrait un cluster déjà jugé défaillant
+    es_coupe = bool(assistant and assistant.disjoncteur_es.est_ouvert())
+    try:
+        # Sonde de vie: délai d'une recherche, sans nouvelle tentative
+        es_ok = bool(assistant and assistant.es is not None and not es_coupe and await assistant.es.options(
+            request_timeout=ES_TIMEOUT_RECHERCHE, max_retries=0
+        ).ping())
+    except Exception:
+        es_ok = False
     details = {
-        "elasticsearch": "connected" if assistant and assistant.es.ping() else "disconnected",
-        "llm": "ready" if assistant and assistant.llm else "unavailable",
-        "conversations_stored": len(conversation_history),
+        "elasticsearch": "circuit_open" if es_coupe else "connected" if es_ok else "disconnected",
+        "local_search": "ready" if assistant and assistant.moteur_local else "unavailable",
+        "llm": "ready" if assistant and assistant.est_charge("llm") else "not_loaded",
+        "conversations": ", ".join(f"{k}={v}" for k, v in store.stats().items()),
+        "routes": ", ".join(f"{k}={v}" for k, v in sorted(route_stats.items())),
+        "sessions": ", ".join(f"{k}={v}" for k, v in app.assistant.sessions.stats().items())
+                    if hasattr(app, 'assistant') else "0",
+        "worker_pool": ", ".join(f"{k}={v}" for k, v in pool.stats().items()),
+        "coalescing": ", ".join(f"{k}={v}" for k, v in coalesceur.stats().items()),
+        "conversation_log": ", ".join(f"{k}={v}" for k, v in journal.stats().items()),
+        "completions_cache": ", ".join(f"{k}={v}" for k, v in assistant.cache_completions.stats().items())
+                             if assistant and assistant.cache_completions else "disabled",
+        "embeddings_cache": ", ".join(f"{k}={v}" for k, v in assistant.store_embeddings.stats().items())
+                            if assistant and assistant.store_embeddings else "disabled",
+        "breaker_elasticsearch": ", ".join(f"{k}={v}" for k, v in assistant.disjoncteur_es.stats().items())
+                                 if assistant else "n/a",
+        "breaker_llm": ", ".join(f"{k}={v}" for k, v in assistant.disjoncteur_llm.stats().items())
+                       if assistant else "n/a",
         "last_updated": datetime.now().isoformat()
     }
     
-    if not assistant or not assistant.es.ping():
+    if not es_ok or (assistant and (assistant.disjoncteur_es.est_ouvert() or assistant.disjoncteur_llm.est_ouvert())):
         status = "degraded"
     
     return {"status": status, "details": details}
 
+@app.get("/api/ready", response_model=HealthCheck)
+async def readiness_check(response: Response):
+    """
+    Sonde de disponibilité (distincte de /api/health, la sonde de vie).
+
+    503 tant que les modèles ne sont pas chargés: l'instance sert déjà les
+    salutations et les refus, mais une question complète paierait encore
+    le chargement des modèles.
+    """
+    assistant = getattr(app, 'assistant', None)
+    pret = assistant is not None and (assistant.est_pret() or not PRECHAUFFAGE)
+    if not pret:
+        response.status_code = 503
+    details = {
+        "assistant": "ready" if assistant else "starting",
+        **({nom: "loaded" if assistant.est_charge(nom) else "loading"
+            for nom in ("embedder", "llm", "agent")} if assistant else {}),
+        **{f"startup_s.{k}": f"{v:.3f}" for k, v in rapport_demarrage().items()},
+    }
+    return {"status": "ready" if pret else "warming_up", "details": details}
+
+def verifier_admin(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Jeton Bearer des endpoints d'administration (ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Administration désactivée (ADMIN_TOKEN non défini)")
+    if not secrets.compare_digest(credentials.credentials.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Jeton d'administration invalide")
+
+def cache_completions():
+    cache = getattr(getattr(app, 'assistant', None), 'cache_completions', None)
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Cache des réponses LLM désactivé")
+    return cache
+
+@app.get("/api/admin/completions", response_model=CompletionsPage, dependencies=[Depends(verifier_admin)])
+async def lister_completions(
+    limit: int = Query(50, ge=1, le=500),
+    question: Optional[str] = Query(None, description="Filtre (sous-chaîne de la question normalisée)")
+):
+    """Réponses LLM mémorisées, des plus récemment servies aux plus anciennes"""
+    cache = cache_completions()
+    filtre = normaliser_question(question) if question else None
+    items = await asyncio.to_thread(cache.lister, limit, filtre)
+    return {"items": items, "stats": await asyncio.to_thread(cache.stats)}
+
+@app.delete("/api/admin/completions", dependencies=[Depends(verifier_admin)])
+async def purger_completions(
+    cle: Optional[str] = None,
+    question: Optional[str] = Query(None, description="Question (normalisée avant comparaison)")
+):
+    """Supprime une entrée (`cle`), les réponses d'une question, ou tout le cache sans paramètre"""
+    cache = cache_completions()
+    supprimees = await asyncio.to_thread(
+        cache.purger, cle, normaliser_question(question) if question else None
+    )
+    print(f"🗑️ {supprimees} réponses LLM retirées du cache")
+    return {"deleted": supprimees}
+
+@app.get("/metrics")
+async def metrics_prometheus():
+    """Métriques au format Prometheus (latence par étape, scores, appels LLM, cache, chemins)"""
+    return Response(metrics.exporter(), media_type=CONTENT_TYPE_LATEST)
+
 # Fonction utilitaire pour les tests
 def _get_test_client():
     from fastapi.testclient import TestClient
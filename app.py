@@ -1,192 +1,539 @@
+import asyncio
+import math
 import os
+import threading
+import time
 import warnings
 import urllib3
-from typing import List, Tuple, Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Tuple, Optional
 
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-from langchain.agents import Tool, initialize_agent, AgentType
-from langchain.memory import ConversationBufferMemory
-from langchain_groq import ChatGroq
-from langchain_core.messages import SystemMessage
-
-from langdetect import detect
+
 from langdetect.lang_detect_exception import LangDetectException
 
+import es_client
+from circuit_breaker import CircuitOuvert, Disjoncteur
+import metrics
+from completion_cache import CacheCompletions, empreinte
+from embeddings import RepliBackend, charger_embedder, ouvrir_store, verifier_backend
+from language_gate import FiltreLangue
+from matcher import MOTS_CLES_FISCAUX, SALUTATIONS, classifieur_fiscal, sigles_fiscaux
+from retrieval import MoteurLocal, fusion_hybride, requete_bm25, requete_knn, sujet_document
+from semantic_cache import SemanticCache
+from sessions import StoreSessions
+from text_utils import nettoyer_question, normaliser_question
+
 # Désactivation des avertissements
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 warnings.filterwarnings("ignore")
 load_dotenv()
 
+# Confiance minimale (cosinus kNN, ou recouvrement lexical sans embedding) pour servir une réponse de la base.
+# Réglés sur benchmarks/bench_api.py: paraphrases servies, questions hors sujet et voisines écartées
+SEUIL_CONFIANCE = float(os.getenv("SEUIL_CONFIANCE", "0.7"))
+# Confiance à partir de laquelle la réponse certifiée est servie sans passer par l'agent LLM
+SEUIL_ROUTAGE = float(os.getenv("SEUIL_ROUTAGE", "0.75"))
+# "template" ajoute un en-tête et le lien DGID à la réponse certifiée, "brut" la renvoie telle quelle
+FORMAT_REPONSE_BASE = os.getenv("FORMAT_REPONSE_BASE", "template")
+# Mémoire de conversation par session (budget de tokens, éviction des sessions inactives)
+SESSIONS_MAX = int(os.getenv("SESSIONS_MAX", "1000"))
+SESSION_TTL_SECONDES = float(os.getenv("SESSION_TTL_SECONDES", "1800"))
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "1000"))
+# Encadrement des réponses générées par le LLM faute de réponse dans la base
+PREFIXE_REPONSE_GENERALE = "⚠️ Information non trouvée dans nos bases. Voici une réponse générale:\n\n"
+SUFFIXE_REPONSE_GENERALE = "\n\nPour confirmation: https://www.dgid.sn"
+MESSAGE_HORS_DOMAINE = ("⛔ Je suis strictement limité aux questions fiscales sénégalaises. "
+                        "Domaines couverts: impôts, taxes, déclarations, code fiscal.")
+# Délai (s) d'une recherche ES, sans nouvel essai: au-delà le moteur local prend le relais
+ES_TIMEOUT_RECHERCHE = float(os.getenv("ES_TIMEOUT_RECHERCHE", "2"))
+# Questions par msearch d'un lot (deux sous-requêtes chacune: BM25 et kNN) et msearch envoyés en parallèle
+ES_MSEARCH_QUESTIONS = int(os.getenv("ES_MSEARCH_QUESTIONS", "25"))
+ES_MSEARCH_PARALLELES = int(os.getenv("ES_MSEARCH_PARALLELES", "4"))
+# Durée (s) pendant laquelle un disjoncteur ouvert coupe sa dépendance avant une sonde
+ES_PAUSE_SECONDES = float(os.getenv("ES_PAUSE_SECONDES", "30"))
+LLM_PAUSE_SECONDES = float(os.getenv("LLM_PAUSE_SECONDES", "60"))
+# Délai (s) et nouveaux essais d'un appel Groq; durée totale maximale d'une exécution de l'agent
+LLM_TIMEOUT_SECONDES = float(os.getenv("LLM_TIMEOUT_SECONDES", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+AGENT_TIMEOUT_SECONDES = float(os.getenv("AGENT_TIMEOUT_SECONDES", "45"))
+# Appel LLM (ou exécution de l'agent) considéré lent par son disjoncteur
+LLM_SEUIL_LENTEUR_SECONDES = float(os.getenv("LLM_SEUIL_LENTEUR_SECONDES", "30"))
+# Fenêtre glissante des disjoncteurs: ouverture dès DISJONCTEUR_TAUX_MAX d'appels en échec ou lents
+DISJONCTEUR_FENETRE_SECONDES = float(os.getenv("DISJONCTEUR_FENETRE_SECONDES", "60"))
+DISJONCTEUR_MIN_APPELS = int(os.getenv("DISJONCTEUR_MIN_APPELS", "5"))
+DISJONCTEUR_TAUX_MAX = float(os.getenv("DISJONCTEUR_TAUX_MAX", "0.5"))
+
+# Paramètres du cache sémantique des réponses
+CACHE_SEUIL_SIMILARITE = float(os.getenv("CACHE_SEUIL_SIMILARITE", "0.92"))
+CACHE_TTL_SECONDES = float(os.getenv("CACHE_TTL_SECONDES", "86400"))
+CACHE_MAX_ENTREES = int(os.getenv("CACHE_MAX_ENTREES", "2000"))
+CACHE_MAX_MO = float(os.getenv("CACHE_MAX_MO", "64"))
+# Fréquence de vérification d'une reconstruction de l'index 'fiscality'
+CACHE_VERIF_INDEX_SECONDES = float(os.getenv("CACHE_VERIF_INDEX_SECONDES", "60"))
+
+# Modèle Groq des réponses générées
+LLM_MODELE = os.getenv("LLM_MODELE", "llama3-70b-8192")
+# Cache disque des réponses générées par le LLM hors base (partagé par les workers)
+COMPLETIONS_CACHE = os.getenv("COMPLETIONS_CACHE", "1") == "1"
+COMPLETIONS_CACHE_DB = Path(os.getenv("COMPLETIONS_CACHE_DB", Path(__file__).parent / "completions_cache.sqlite3"))
+COMPLETIONS_TTL_SECONDES = float(os.getenv("COMPLETIONS_TTL_SECONDES", str(7 * 86400)))
+COMPLETIONS_MAX_ENTREES = int(os.getenv("COMPLETIONS_MAX_ENTREES", "5000"))
+COMPLETIONS_MAX_MO = float(os.getenv("COMPLETIONS_MAX_MO", "50"))
+
 class PremiumFiscalAssistant:
-    def __init__(self):
-        self.mots_cles_fiscaux = {
-            "impôt", "impot", "taxe", "réglementations", "tva", "TVA", "CFPNB", "etax","imposable", "imposition", "dgi", "dgid", "droit fiscal",
-            "cfpnb", "PV", "pv", "PME", "quitus", "PCF", "fiscalité", "déclaration", "TOEM",
-            "CGU", "Patente", "récapitulatifs", "exonération", "remboursement", 
-            "trop perçu", "délai", "quitus fiscal", "délai de paiement", "quittance", 
-            "récépissé", "revenus", "formalisation", "contribution", "taxation", 
-            "cadastre", "redevance", "contribution foncière", "taxe sur les véhicules", 
-            "taxe sur les biens", "taxe sur les opérations", "taxe sur les produits", 
-            "taxe sur les services", "droit d'enregistrement", "droits d'enregistrement", 
-            "taxes d'enregistrement", "entreprise", "changement de statuts", 
-            "taxes sur les salaires", "taxe sur les salaires", "taxe foncière", 
-            "taxe professionnelle", "NINEA", "direct", "indirect", "réouverture",
-            "taxe sur la valeur ajoutée", "passeport", "taxe sur les boissons", 
-            "réductions", "immatriculation", "propriétaire", "compte", "duplicata", 
-            "IR", "IS", "patente", "douane", "régime fiscal", "code général des impôts", 
-            "procédure", "acte administratif", "exonérations", "obligation fiscale", 
-            "pénalité", "penalite", "amende", "contrôle fiscal", "démarrage des activités", 
-            "homologation", "acte", "titre", "SIGTAS", "imposition", "bail", 
-            "foncier bâti", "foncier non bâti", "TEOM", "vérification", "versement", 
-            "trésor", "TVA déductible", "TVA collectée", "TVA non récupérable", 
-            "non-assujetti", "assujetti", "centre des impôts", "régularisation", 
-            "déductibilité", "déclaration mensuelle", "déclaration annuelle", 
-            "numéro fiscal", "avis d'imposition", "bordereau de paiement", "numéro IFU", 
-            "COFI", "fiscale", "fiscaux", "fiscal", "DGID", "impotsetdomaines", "dgi", 
-            "direction générale des impôts","article", "articles", "code des impôts",
-            "code fiscal", "loi fiscale", "réglementation fiscale"
-        }
-        
-        self.salutations = {"bonjour", "salut", "hello", "bonsoir", "coucou", "hi", "salam", "yo", "bjr", "allo", "good morning", "good afternoon"}
-        self.salutations = {s.lower() for s in self.salutations}
-        self.salutations = {s for s in self.salutations if len(s.split()) <= 3}
+    def __init__(self, es=None):
+        # Durée (s) de chaque étape d'initialisation, y compris les modèles chargés plus tard
+        self.temps_demarrage: Dict[str, float] = {}
+        # Modèles (torch, transformers, langchain) chargés au premier usage ou par prechauffer()
+        self._ressources = {}
+        self._lock_ressources = threading.RLock()
+
+        self.mots_cles_fiscaux = MOTS_CLES_FISCAUX
+        self.salutations = {s.lower() for s in SALUTATIONS if len(s.split()) <= 3}
+        self.classifieur = self._chronometrer("classifieur", classifieur_fiscal)
+        self.filtre_langue = self._chronometrer("filtre_langue", FiltreLangue, self.classifieur)
         
-        self.es = self._init_elasticsearch()
-        self.embedder = self._init_embedder()
-        self.llm = self._init_llm()
-        self.agent = self._init_agent()
-        self.response_cache = {}
+        self.es = self._chronometrer("elasticsearch", self._init_elasticsearch, es)
+        # Dépendances coupées en cas d'erreurs ou de lenteurs répétées (moteur local / base seule)
+        self.disjoncteur_es = self._init_disjoncteur("elasticsearch", ES_TIMEOUT_RECHERCHE, ES_PAUSE_SECONDES)
+        self.disjoncteur_llm = self._init_disjoncteur("groq", LLM_SEUIL_LENTEUR_SECONDES, LLM_PAUSE_SECONDES)
+        self.moteur_local = self._chronometrer("moteur_local", self._init_moteur_local)
+        self.sessions = StoreSessions(
+            max_sessions=SESSIONS_MAX,
+            ttl_inactivite=SESSION_TTL_SECONDES,
+            max_tokens_session=SESSION_MAX_TOKENS
+        )
+        self.response_cache = SemanticCache(
+            seuil=CACHE_SEUIL_SIMILARITE,
+            max_entrees=CACHE_MAX_ENTREES,
+            ttl=CACHE_TTL_SECONDES,
+            max_octets=int(CACHE_MAX_MO * 1024 * 1024)
+        )
+        self.cache_completions = self._chronometrer("cache_completions", self._init_cache_completions)
+        # Le gabarit fait partie de la clé: le modifier invalide les réponses mémorisées
+        self.empreinte_prompt = empreinte(self._prompt_reponse_fiscale("{question}"))
+        # Vecteurs déjà calculés, persistés entre redémarrages et partagés avec l'indexation
+        self.store_embeddings = self._chronometrer("store_embeddings", ouvrir_store)
+        self._vecteur_question = lru_cache(maxsize=256)(self._encoder_question)
+        self._derniere_verif_index = 0.0
         self.last_query = None
-    def _init_elasticsearch(self):
-        """Initialise et retourne une connexion Elasticsearch sécurisée"""
-        try:
-            # Configuration avec valeurs par défaut sécurisées
-            es = Elasticsearch(
-                os.getenv(
-                    "ELASTICSEARCH_URL", 
-                    "https://my-elasticsearch-project-beb3d2.es.us-east-1.aws.elastic.cloud:443"
-                ),
-                api_key=os.getenv("ELASTIC_API_KEY"),
-                verify_certs=True,
-                ssl_show_warn=True,
-                timeout=30,
-                max_retries=2
-)
-
-            # Vérification immédiate de la connexion
-            if not es.ping():
-                raise ConnectionError("Échec de la connexion Elasticsearch")
-            
-            print("✅ Connexion Elasticsearch établie avec succès")
-            return es
 
+    @property
+    def embedder(self):
+        return self._ressource("embedder", self._init_embedder)
+
+    @property
+    def llm(self):
+        return self._ressource("llm", self._init_llm)
+
+    @property
+    def agent(self):
+        return self._ressource("agent", self._init_agent)
+
+    def est_charge(self, nom: str) -> bool:
+        """Indique si un modèle ("embedder", "llm", "agent") est déjà en mémoire"""
+        return nom in self._ressources
+
+    def est_pret(self) -> bool:
+        return all(self.est_charge(nom) for nom in ("embedder", "llm", "agent"))
+
+    def prechauffer(self):
+        """Charge les modèles et exécute un premier encodage, hors du chemin des requêtes"""
+        debut = time.perf_counter()
+        try:
+            self.embedder.encode("préchauffage", normalize_embeddings=True)
+            self.agent  # Charge aussi le LLM
         except Exception as e:
-            error_msg = f"❌ Erreur d'initialisation Elasticsearch: {str(e)}"
-            
-            # Suggestions spécifiques selon l'erreur
-            if "SSL" in str(e):
-                error_msg += "\n💡 Conseil: Vérifiez votre certificat SSL ou utilisez verify_certs=False en développement"
-            elif "authentication" in str(e):
-                error_msg += "\n💡 Conseil: Vérifiez votre clé API dans .env"
-            
-            print(error_msg)
-            return None
+            print(f"⚠️ Préchauffage incomplet: {e}")
+            return
+        self.temps_demarrage["prechauffage"] = round(time.perf_counter() - debut, 3)
+        print(f"🔥 Modèles préchauffés en {self.temps_demarrage['prechauffage']:.1f}s")
+
+    def _ressource(self, nom: str, init: Callable):
+        ressource = self._ressources.get(nom)
+        if ressource is None:
+            with self._lock_ressources:
+                ressource = self._ressources.get(nom)
+                if ressource is None:
+                    ressource = self._chronometrer(nom, init)
+                    self._ressources[nom] = ressource
+        return ressource
+
+    def _chronometrer(self, etape: str, fonction: Callable, *args):
+        debut = time.perf_counter()
+        resultat = fonction(*args)
+        self.temps_demarrage[etape] = round(time.perf_counter() - debut, 3)
+        return resultat
+
+    def _init_disjoncteur(self, nom: str, seuil_lenteur: float, duree_ouverture: float) -> Disjoncteur:
+        metrics.etat_disjoncteur(nom, "ferme")
+        return Disjoncteur(
+            nom,
+            fenetre=DISJONCTEUR_FENETRE_SECONDES,
+            min_appels=DISJONCTEUR_MIN_APPELS,
+            taux_max=DISJONCTEUR_TAUX_MAX,
+            seuil_lenteur=seuil_lenteur,
+            duree_ouverture=duree_ouverture,
+            sur_transition=metrics.etat_disjoncteur
+        )
+
+    def _init_elasticsearch(self, es=None):
+        """Client Elasticsearch partagé du processus (None si indisponible)"""
+        return es if es is not None else es_client.obtenir_client()
 
     def _init_embedder(self):
-        """Chargement du modèle d'embedding"""
-        return SentenceTransformer("dangvantuan/sentence-camembert-base")
+        """Chargement du modèle d'embedding (backend torch ou onnx, voir EMBEDDING_BACKEND)"""
+        return charger_embedder()
     
-    def _est_question_fiscale(self, query: str) -> bool:
-        """Version améliorée pour mieux gérer les sigles et acronymes"""
-        query_lower = query.lower()
-        
-        # Vérification des salutations simples
-        if any(salut in query_lower for salut in self.salutations if len(query_lower.split()) <= 3):
-            return False
-            
-        # Vérification des sigles (même seuls)
-        sigles = {mot for mot in self.mots_cles_fiscaux if mot.isupper() and len(mot) >= 3}
-        if any(sigle in query_lower for sigle in (s.lower() for s in sigles)):
-            return True
-        
-        # Vérification standard des mots-clés
-        return any(mot.lower() in query_lower for mot in self.mots_cles_fiscaux)
+    def _encoder_question(self, question_nettoyee: str):
+        """Embedding normalisé d'une question (mis en mémoire par _vecteur_question)"""
+        if self.store_embeddings is None:
+            return self.embedder.encode(question_nettoyee, normalize_embeddings=True)
+        return self._encoder_en_cache([question_nettoyee])[0]
+
+    def _encoder_en_cache(self, questions: List[str]):
+        """Embeddings via le cache persistant du backend réellement chargé"""
+        store = self.store_embeddings
+        if store is None:
+            return self._calculer_embeddings(questions)
+        try:
+            return store.encoder(questions, lambda manquantes: self._calculer_embeddings(manquantes, store))
+        except RepliBackend as e:
+            print(f"⚠️ {e}: cache d'embeddings {e.backend} utilisé")
+            self.store_embeddings = ouvrir_store(e.backend)
+            return self._encoder_en_cache(questions)
+
+    def _calculer_embeddings(self, questions: List[str], store=None):
+        """Encodage par le modèle (chargé seulement si le cache persistant ne suffit pas)"""
+        if store is not None:
+            verifier_backend(store, self.embedder)
+        return self.embedder.encode(questions, batch_size=32, normalize_embeddings=True)
+
+    def _generation_index(self) -> Optional[str]:
+        """Version de l'index 'fiscality' courant.
+
+        Change à chaque reconstruction (uuid de l'index derrière l'alias) et
+        à chaque écriture d'une synchronisation incrémentale (compteurs
+        d'indexation et de suppression).
+        """
+        if not self._es_disponible():
+            return None
+        try:
+            with self.disjoncteur_es.appel():
+                stats = es_client.executer(
+                    self.es.indices.stats(index="fiscality", metric="indexing"), timeout=ES_TIMEOUT_RECHERCHE * 2
+                )
+            return ",".join(sorted(
+                f"{s.get('uuid', nom)}:{s['primaries']['indexing']['index_total']}"
+                f":{s['primaries']['indexing']['delete_total']}"
+                for nom, s in stats["indices"].items()
+            ))
+        except Exception as e:
+            print(f"⚠️ Impossible de lire la version de l'index: {e}")
+            return None
+
+    def _verifier_index_cache(self):
+        """Invalide le cache si l'index a été reconstruit ou modifié (vérification périodique)"""
+        maintenant = time.monotonic()
+        if maintenant - self._derniere_verif_index < CACHE_VERIF_INDEX_SECONDES:
+            return
+        self._derniere_verif_index = maintenant
+        generation = self._generation_index()
+        if generation and self.response_cache.verifier_generation(generation):
+            print("♻️ Index 'fiscality' modifié: cache des réponses invalidé")
+
+    def vecteurs_questions(self, queries: List[str]):
+        """Embeddings de plusieurs questions en un seul appel encode (None si indisponible)"""
+        questions = [nettoyer_question(q) for q in queries]
+        try:
+            with metrics.etape("embedding"):
+                return self._encoder_en_cache(questions)
+        except Exception as e:
+            print(f"⚠️ Embedding indisponible: {e}")
+            return None
+
+    def chercher_en_cache(self, query: str, vecteur=None) -> Optional[str]:
+        """Retourne une réponse déjà servie pour cette question ou une paraphrase proche"""
+        self._verifier_index_cache()
+        cle = normaliser_question(query)
+        try:
+            if vecteur is None:
+                with metrics.etape("embedding"):
+                    vecteur = self._vecteur_question(nettoyer_question(query))
+            with metrics.etape("cache"):
+                reponse = self.response_cache.rechercher(cle, vecteur, frozenset(sigles_fiscaux(query)))
+            metrics.compter_cache(reponse is not None)
+            return reponse
+        except Exception as e:
+            print(f"⚠️ Erreur cache sémantique: {e}")
+            return None
+
+    def mettre_en_cache(self, query: str, reponse: str, vecteur=None):
+        """Mémorise la réponse finale servie pour cette question"""
+        cle = normaliser_question(query)
+        try:
+            if vecteur is None:
+                vecteur = self._vecteur_question(nettoyer_question(query))
+            self.response_cache.ajouter(cle, vecteur, reponse, frozenset(sigles_fiscaux(query)))
+        except Exception as e:
+            print(f"⚠️ Erreur cache sémantique: {e}")
+
+    def _init_cache_completions(self) -> Optional[CacheCompletions]:
+        """Cache disque des réponses du LLM (None si désactivé ou indisponible)"""
+        if not COMPLETIONS_CACHE:
+            return None
+        try:
+            return CacheCompletions(
+                COMPLETIONS_CACHE_DB,
+                ttl=COMPLETIONS_TTL_SECONDES,
+                max_entrees=COMPLETIONS_MAX_ENTREES,
+                max_octets=int(COMPLETIONS_MAX_MO * 1024 * 1024)
+            )
+        except Exception as e:
+            print(f"⚠️ Cache des réponses LLM indisponible: {e}")
+            return None
 
+    def completion_en_cache(self, question: str) -> Optional[str]:
+        """Réponse générée déjà mémorisée pour cette question (même modèle, même prompt)"""
+        if self.cache_completions is None:
+            return None
+        try:
+            reponse = self.cache_completions.obtenir(LLM_MODELE, self.empreinte_prompt, normaliser_question(question))
+        except Exception as e:
+            print(f"⚠️ Erreur cache des réponses LLM: {e}")
+            return None
+        metrics.compter_cache(reponse is not None, "completions")
+        return reponse
+
+    def memoriser_completion(self, question: str, reponse: str):
+        """Mémorise une réponse générée, si elle a passé la validation"""
+        if self.cache_completions is None or self._valider_reponse_fiscale(reponse) != reponse:
+            return
+        try:
+            self.cache_completions.enregistrer(LLM_MODELE, self.empreinte_prompt, normaliser_question(question), reponse)
+        except Exception as e:
+            print(f"⚠️ Erreur cache des réponses LLM: {e}")
 
     def _init_llm(self):
         """Configuration du LLM"""
+        from langchain_groq import ChatGroq
         return ChatGroq(
             api_key=os.getenv("GROQ_API_KEY"),
-            model_name="llama3-70b-8192",
+            model_name=LLM_MODELE,
+            timeout=LLM_TIMEOUT_SECONDES,
+            max_retries=LLM_MAX_RETRIES,
             temperature=0.2,
             max_tokens=1500
         )
 
+    def _init_moteur_local(self) -> Optional[MoteurLocal]:
+        """Chargement du moteur embarqué depuis le snapshot exporté par index.py"""
+        try:
+            moteur = MoteurLocal.charger()
+            if moteur is None:
+                print("ℹ️ Aucun snapshot local: pas de repli sans Elasticsearch")
+            else:
+                print(f"✅ Moteur local chargé ({len(moteur)} documents)")
+            return moteur
+        except Exception as e:
+            print(f"⚠️ Erreur chargement du snapshot local: {e}")
+            return None
+
+    def _es_disponible(self) -> bool:
+        return self.es is not None and not self.disjoncteur_es.est_ouvert()
+
+    def _rechercher_es(self, queries: List[str], vecteurs) -> List[Tuple[List[dict], List[dict]]]:
+        """Version bloquante de _arechercher_es, pour le pipeline exécuté dans un thread"""
+        # Un délai de recherche par vague de msearch parallèles, plus une marge
+        vagues = math.ceil(len(queries) / (ES_MSEARCH_QUESTIONS * ES_MSEARCH_PARALLELES))
+        return es_client.executer(self._arechercher_es(queries, vecteurs), timeout=ES_TIMEOUT_RECHERCHE * (vagues + 1))
+
+    async def _arechercher_es(self, queries: List[str], vecteurs) -> List[Tuple[List[dict], List[dict]]]:
+        """Requêtes BM25 et kNN des questions, par msearch de ES_MSEARCH_QUESTIONS questions.
+
+        Chaque msearch garde le délai d'une recherche (ES_TIMEOUT_RECHERCHE),
+        quelle que soit la taille du lot; au plus ES_MSEARCH_PARALLELES sont
+        en cours à la fois.
+        """
+        limite = asyncio.Semaphore(ES_MSEARCH_PARALLELES)
+
+        async def morceau(debut: int):
+            fin = debut + ES_MSEARCH_QUESTIONS
+            async with limite:
+                return await self._msearch(queries[debut:fin], vecteurs[debut:fin] if vecteurs is not None else None)
+
+        morceaux = await asyncio.gather(*(morceau(debut) for debut in range(0, len(queries), ES_MSEARCH_QUESTIONS)))
+        return [resultat for resultats in morceaux for resultat in resultats]
+
+    async def _msearch(self, queries: List[str], vecteurs) -> List[Tuple[List[dict], List[dict]]]:
+        """Requêtes BM25 et kNN de quelques questions en un seul msearch"""
+        recherches = []
+        for i, query in enumerate(queries):
+            recherches += [{"index": "fiscality"}, requete_bm25(query)]
+            if vecteurs is not None:
+                recherches += [{"index": "fiscality"}, requete_knn(vecteurs[i].tolist())]
+
+        # Pas de nouvel essai sur le chemin des requêtes: le disjoncteur et le moteur local s'en chargent
+        res = await self.es.options(request_timeout=ES_TIMEOUT_RECHERCHE, max_retries=0).msearch(
+            searches=recherches
+        )
+
+        listes = []
+        for reponse in res["responses"]:
+            if "error" in reponse:
+                print(f"⚠️ Sous-requête en erreur: {reponse['error']}")
+                listes.append([])
+            else:
+                listes.append(reponse.get('hits', {}).get('hits', []))
+        if vecteurs is None:
+            return [(hits, []) for hits in listes]
+        return list(zip(listes[0::2], listes[1::2]))
+
     def _get_contextual_results(self, query: str) -> Tuple[List[str], float]:
-        """Recherche optimisée dans Elasticsearch"""
+        """Recherche hybride BM25 + kNN, ordonnée par RRF.
+
+        Interroge Elasticsearch, ou le moteur local si ES est absent, en
+        erreur ou coupé par son disjoncteur. Le score retourné est la
+        confiance absolue du premier résultat dans [0, 1] (voir
+        `fusion_hybride`).
+        """
         try:
-            res = self.es.search(
-                index="fiscality",
-                body={
-                    "query": {
-                        "bool": {
-                            "must": [
-                                {
-                                    "multi_match": {
-                                        "query": query,
-                                        "fields": ["question^3", "reponse^2", "tags"],
-                                        "type": "best_fields"
-                                    }
-                                }
-                            ]
-                        }
-                    },
-                    "size": 3
-                }
-            )
+            with metrics.etape("embedding"):
+                vecteurs = [self._vecteur_question(nettoyer_question(query))]
+        except Exception as e:
+            print(f"⚠️ Embedding indisponible, recherche lexicale seule: {e}")
+            vecteurs = None
+        return self._get_contextual_results_lot([query], vecteurs)[0]
+
+    @metrics.chronometre("recherche_hybride")
+    def _get_contextual_results_lot(self, queries: List[str], vecteurs=None) -> List[Tuple[List[str], float]]:
+        """Recherche hybride de plusieurs questions en quelques msearch (voir _arechercher_es).
+
+        `vecteurs`: embeddings des questions, dans le même ordre (None: BM25 seul).
+        """
+        if not queries:
+            return []
+        source = "elasticsearch"
+        try:
+            if self.es is None:
+                raise ConnectionError("indisponible")
+            with metrics.etape("es_recherche"), self.disjoncteur_es.appel():
+                resultats_bruts = self._rechercher_es(queries, vecteurs)
+        except Exception as e:
+            if self.es is not None and not isinstance(e, CircuitOuvert):
+                print(f"⚠️ Erreur recherche Elasticsearch: {e}")
+            if self.moteur_local is None:
+                return [([], 0)] * len(queries)
+            with metrics.etape("recherche_locale"):
+                resultats_bruts = [
+                    self.moteur_local.rechercher(query, vecteurs[i] if vecteurs is not None else None)
+                    for i, query in enumerate(queries)
+                ]
+            source = "local"
 
-            hits = res.get('hits', {}).get('hits', [])
+        resultats = []
+        for query, (hits_bm25, hits_knn) in zip(queries, resultats_bruts):
+            hits = self._ecarter_hors_sujet(query, fusion_hybride(hits_bm25, hits_knn, query))
             if not hits:
-                return [], 0
+                resultats.append(([], 0))
+                continue
 
-            best_score = hits[0]['_score']
-            responses = [hit['_source']['reponse'] for hit in hits]
+            best_score = hits[0]['confiance']
+            metrics.observer_score(source, best_score)
+            responses = [hit['_source']['reponse'] for hit in hits[:3]]
             
-            print("\n🔍 Résultats de recherche :")
+            print(f"\n🔍 Résultats de recherche ({source}) pour : {query}")
             for i, hit in enumerate(hits[:3]):
-                print(f"{i+1}. Score: {hit['_score']:.2f} | Question: {hit['_source']['question']}")
+                print(f"{i+1}. Confiance: {hit['confiance']:.2f} | Question: {hit['_source']['question']}")
             
-            return responses, best_score
+            resultats.append((responses, best_score))
+        return resultats
 
-        except Exception as e:
-            print(f"⚠️ Erreur recherche Elasticsearch: {e}")
-            return [], 0
+    @staticmethod
+    def _ecarter_hors_sujet(query: str, hits: List[dict]) -> List[dict]:
+        """Confiance nulle pour les documents qui ne citent pas les impôts de la question.
+
+        Une question sur la TEOM ressemble à une question sur la TVA (même
+        formulation, même vocabulaire): seul le sigle les distingue. Les
+        documents écartés passent après les autres, dans l'ordre RRF.
+        """
+        sigles = sigles_fiscaux(query)
+        if not sigles:
+            return hits
+        for hit in hits:
+            if not sigles <= sigles_fiscaux(sujet_document(hit["_source"])):
+                hit["confiance"] = 0.0
+        return sorted(hits, key=lambda hit: hit["confiance"] > 0, reverse=True)
+
+    def formater_reponse_certifiee(self, reponse: str) -> str:
+        """Mise en forme sans LLM d'une réponse issue de la base de connaissances"""
+        if FORMAT_REPONSE_BASE != "template":
+            return reponse
+        return ("📌 Réponse certifiée (base de connaissances fiscale) :\n\n"
+                f"{reponse.strip()}\n\n"
+                "🔗 Pour plus d'informations : https://www.dgid.sn")
+
+    def repondre_depuis_base(self, query: str) -> Optional[str]:
+        """Routeur placé avant l'agent: réponse certifiée directe si la base est confiante.
+
+        Retourne None quand la question doit passer par l'agent (question sans
+        vocabulaire fiscal, confiance inférieure à SEUIL_ROUTAGE, ou document
+        ne citant pas les impôts de la question: voir `_ecarter_hors_sujet`).
+        """
+        if not self._est_question_fiscale(query):
+            return None
+        responses, score = self._get_contextual_results(query)
+        if responses and score >= SEUIL_ROUTAGE:
+            return self.formater_reponse_certifiee(responses[0])
+        return None
+
+    def repondre_depuis_base_lot(self, queries: List[str], vecteurs=None) -> List[Optional[str]]:
+        """Version par lot de repondre_depuis_base (une seule recherche pour toutes les questions)"""
+        fiscales = [i for i, q in enumerate(queries) if self._est_question_fiscale(q)]
+        resultats = self._get_contextual_results_lot(
+            [queries[i] for i in fiscales],
+            vecteurs[fiscales] if vecteurs is not None else None
+        )
+        reponses: List[Optional[str]] = [None] * len(queries)
+        for i, (responses, score) in zip(fiscales, resultats):
+            if responses and score >= SEUIL_ROUTAGE:
+                reponses[i] = self.formater_reponse_certifiee(responses[0])
+        return reponses
+
+    def repondre_sans_llm(self, query: str) -> str:
+        """Réponse dégradée quand le LLM est indisponible: base certifiée seule, au seuil de confiance habituel"""
+        if self._est_question_fiscale(query):
+            responses, score = self._get_contextual_results(query)
+            if responses and score >= SEUIL_CONFIANCE:
+                return self.formater_reponse_certifiee(responses[0])
+        return ("⚠️ Le service de génération de réponses est momentanément indisponible et cette question "
+                "n'est pas couverte par notre base certifiée. Consultez https://www.dgid.sn")
 
     def _gerer_salutation(self):
         """Gestion simplifiée des salutations"""
         return "💼 Bonjour ! Assistant fiscal sénégalais à votre service. Posez-moi vos questions sur les impôts et taxes."
 
-    def _est_question_fiscale(self, query: str) -> bool:
-        """Version améliorée pour mieux gérer les sigles et acronymes"""
-        query_lower = query.lower()
+    @metrics.chronometre("classification")
+    def _est_question_fiscale(self, query: str, correspondances=None) -> bool:
+        """Vérifie la présence de vocabulaire fiscal (sigles compris) en un seul passage.
+
+        `correspondances` permet de réutiliser une analyse déjà faite par
+        `self.classifieur.analyser`.
+        """
+        if correspondances is None:
+            correspondances = self.classifieur.analyser(query)
         
         # Vérification des salutations simples
-        if any(salut in query_lower for salut in self.salutations if len(query_lower.split()) <= 3):
+        if correspondances["salutation"] and len(query.split()) <= 3:
             return False
-            
-        # Vérification des sigles (même seuls)
-        sigles = {mot for mot in self.mots_cles_fiscaux if mot.isupper() and len(mot) >= 3}
-        if any(sigle in query_lower for sigle in (s.lower() for s in sigles)):
-            return True
         
-        # Vérification standard des mots-clés
-        return any(mot.lower() in query_lower for mot in self.mots_cles_fiscaux)
+        return bool(correspondances["fiscal"])
 
-    def _generer_reponse_fiscale(self, question: str) -> str:
-        """Génère une réponse fiscale via LLM avec des garde-fous"""
-        prompt = f"""
+    def _prompt_reponse_fiscale(self, question: str) -> str:
+        """Prompt de réponse directe du LLM (hors agent) avec ses garde-fous"""
+        return f"""
         En tant qu'expert fiscal sénégalais, répondez STRICTEMENT en français à cette question:
         "{question}"
 
@@ -205,15 +552,46 @@ d'une demande de définition fiscale. Répondez comme à une question classique,
         7. POUR LES QUESTIONS NON FISCALES:
    "⛔ Je ne traite que les questions fiscales et il NE FAUT jamais répondre a une question non fiscal."
                 """
+
+    def _generer_reponse_fiscale(self, question: str) -> str:
+        """Génère une réponse fiscale via LLM avec des garde-fous"""
+        reponse = self.completion_en_cache(question)
+        if reponse is not None:
+            return reponse
+        prompt = self._prompt_reponse_fiscale(question)
         
         try:
-            reponse = self.llm.invoke(prompt).content
-            return self._valider_reponse_fiscale(reponse)
+            with metrics.etape("llm"), self.disjoncteur_llm.appel():
+                message = self.llm.invoke(prompt)
+            metrics.compter_llm("completion", message)
+            self.memoriser_completion(question, message.content)
+            return self._valider_reponse_fiscale(message.content)
         except Exception as e:
             print(f"⚠️ Erreur LLM: {str(e)}")
             return ("ℹ️ Je rencontre des difficultés techniques. "
                     "Veuillez consulter directement: https://www.dgid.sn")
 
+    async def astream_reponse_fiscale(self, question: str) -> AsyncIterator[str]:
+        """Version en flux de _generer_reponse_fiscale: fragments de texte au fil de la génération.
+
+        La validation se fait sur le texte complet, par l'appelant. Une
+        réponse déjà mémorisée est renvoyée d'un seul fragment.
+        """
+        reponse = await asyncio.to_thread(self.completion_en_cache, question)
+        if reponse is not None:
+            yield reponse
+            return
+        usage, fragments = {}, []
+        with self.disjoncteur_llm.appel():
+            async for fragment in self.llm.astream(self._prompt_reponse_fiscale(question)):
+                # Avec Groq, l'usage en tokens arrive dans le dernier fragment
+                usage = getattr(fragment, "usage_metadata", None) or usage
+                if fragment.content:
+                    fragments.append(fragment.content)
+                    yield fragment.content
+        metrics.compter_llm("flux", usage=usage)
+        await asyncio.to_thread(self.memoriser_completion, question, "".join(fragments))
+
     def _valider_reponse_fiscale(self, reponse: str) -> str:
         """Valide que la réponse reste dans le domaine fiscal"""
         if not isinstance(reponse, str) or not reponse.strip():
@@ -225,43 +603,48 @@ d'une demande de définition fiscale. Répondez comme à une question classique,
                     
         return reponse
 
+    @metrics.chronometre("recherche_fiscale")
     def recherche_fiscale(self, query: str) -> str:
         """Version améliorée avec contrôle strict du domaine fiscal"""
         print(f"🎯 Appel à recherche_fiscale avec : {query}")
 
         # Étape 1 : Vérification de la langue
         try:
-            if detect(query) != "fr":
+            with metrics.etape("detect_langue"):
+                francais = self.filtre_langue.est_francais(query)
+            if not francais:
                 return "⛔ Veuillez poser votre question en français uniquement."
         except LangDetectException:
             return "⚠️ Impossible de détecter la langue de votre question."
 
         # Étape 2 : Filtrage des questions non fiscales
         if not self._est_question_fiscale(query):
-            return (
-                "⛔ Je suis strictement limité aux questions fiscales sénégalaises. "
-                "Domaines couverts: impôts, taxes, déclarations, code fiscal."
-            )
+            return MESSAGE_HORS_DOMAINE
 
         # Étape 3 : Recherche dans la base de connaissances
         responses, score = self._get_contextual_results(query)
         
         # Étape 4 : Gestion des réponses
-        if responses and score > 1.0:  # Seuil de pertinence
+        if responses and score >= SEUIL_CONFIANCE:  # Seuil de pertinence
             return responses[0]
         else:
             # Fallback contrôlé vers le LLM
-            return ("⚠️ Information non trouvée dans nos bases. Voici une réponse générale:\n\n"
-                   f"{self._generer_reponse_fiscale(query)}\n\n"
-                   "Pour confirmation: https://www.dgid.sn")
+            return (PREFIXE_REPONSE_GENERALE
+                    + self._generer_reponse_fiscale(query)
+                    + SUFFIXE_REPONSE_GENERALE)
 
     def vider_cache(self):
         """Vide le cache des réponses"""
         self.response_cache.clear()
+        self._vecteur_question.cache_clear()
         print("🗑️ Cache vidé avec succès !")
 
     def _init_agent(self):
         """Initialisation de l'agent avec contrôle strict"""
+        from langchain.agents import Tool, initialize_agent, AgentType
+        from langchain_core.messages import SystemMessage
+        from langchain_core.prompts import MessagesPlaceholder
+
         fiscal_tool = Tool(
             name="BaseFiscalePremium",
             func=self.recherche_fiscale,
@@ -277,16 +660,15 @@ d'une demande de définition fiscale. Répondez comme à une question classique,
             tools=[fiscal_tool],
             llm=self.llm,
             agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-            memory=ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True,
-                output_key='output'
-            ),
+            # Pas de mémoire partagée: l'historique de la session est passé à chaque appel
             verbose=False,
             max_iterations=3,
+            max_execution_time=AGENT_TIMEOUT_SECONDES,
             early_stopping_method="generate",
             handle_parsing_errors=True,  # <-- Ajout crucial
             agent_kwargs={
+                "input_variables": ["input", "agent_scratchpad", "chat_history"],
+                "memory_prompts": [MessagesPlaceholder(variable_name="chat_history")],
                 "system_message": SystemMessage(content="""
 🎓 Règles absolues :
 on utilise le llm seulement pour structurer les réponses venant de notre base de connaissance fiscale en respectant les règles suivantes :
@@ -314,6 +696,18 @@ d'une demande de définition fiscale. Répondez comme à une question classique,
             }
         )
 
+    def repondre_avec_agent(self, query: str, session_id: Optional[str] = None) -> str:
+        """Appelle l'agent avec l'historique borné de la session (aucun historique sans session)"""
+        memoire = self.sessions.obtenir(session_id) if session_id else None
+        with metrics.etape("agent"), self.disjoncteur_llm.appel(), metrics.suivi_agent() as suivi:
+            response = self.agent.invoke({
+                "input": query,
+                "chat_history": memoire.messages() if memoire else []
+            }, config={"callbacks": [suivi]})
+        if memoire:
+            memoire.ajouter_echange(query, response['output'])
+        return response['output']
+
     def run(self):
         print("\n" + "="*50)
         print("ASSISTANT FISCAL PREMIUM - SÉNÉGAL ".center(50))
@@ -351,17 +745,35 @@ d'une demande de définition fiscale. Répondez comme à une question classique,
                     print("Exemple : 'Quelles sont les démarches pour un quitus fiscal ?'")
                     continue
 
-                # Traitement de la question fiscale
+                # Avec un historique, l'agent répond pour cette session: ni lecture ni écriture du cache global
+                historique = self.sessions.a_historique("cli")
+
+                # Réponse déjà servie pour une question équivalente
+                reponse_cache = None if historique else self.chercher_en_cache(user_input)
+                if reponse_cache:
+                    print("\n📌 Réponse (cache) :", reponse_cache)
+                    continue
+
+                # Réponse certifiée directe si la base est confiante
                 print("\n🔍 Consultation de la base fiscale...")
-                response = self.agent.invoke({"input": user_input})
+                reponse_base = self.repondre_depuis_base(user_input)
+                if reponse_base:
+                    self.mettre_en_cache(user_input, reponse_base)
+                    print("\n📌 Réponse :", reponse_base)
+                    continue
+
+                # Traitement de la question fiscale par l'agent
+                output = self.repondre_avec_agent(user_input, session_id="cli")
                 
                 # Vérification que la réponse est bien fiscale
-                if any(phrase in response['output'].lower() for phrase in ["hors domaine fiscal", "non fiscal"]):
+                if any(phrase in output.lower() for phrase in ["hors domaine fiscal", "non fiscal"]):
                     print("\n⚠️ La réponse semble hors domaine :")
-                    print(response['output'])
+                    print(output)
                     print("\nVeuillez reformuler votre question en termes fiscaux.")
                 else:
-                    print("\n📌 Réponse :", response['output'])
+                    if not historique:
+                        self.mettre_en_cache(user_input, output)
+                    print("\n📌 Réponse :", output)
                     
             except KeyboardInterrupt:
                 print("\n\nMerci d'avoir utilisé l'Assistant Fiscal Premium. Au revoir !")
@@ -0,0 +1,342 @@
+"""Test de charge hors ligne de /api/ask: débit et latences sous concurrence croissante.
+
+L'application FastAPI est exercée en mémoire (httpx + ASGITransport), avec
+son cycle de vie, son pool et son journal, mais sans service externe:
+- Elasticsearch est remplacé par ElasticsearchLocal, qui sert un corpus
+  de test (corpus_fiscal.ndjson, ou `--corpus`) avec le moteur BM25/kNN
+  embarqué;
+- le modèle d'embedding par un encodeur déterministe (n-grammes hachés);
+- ChatGroq et l'agent LangChain par un LLM factice déterministe, de
+  latence réglable, qui compte ses appels. L'agent factice reproduit le
+  schéma ReAct: un appel pour choisir l'outil, l'outil recherche_fiscale,
+  un appel pour rédiger la réponse.
+
+La charge (questions de conversation_data/*.csv et du corpus, plus des
+paraphrases synthétiques) est tirée avec une graine fixe; `--enregistrer`
+/ `--rejouer` la figent dans un fichier pour comparer deux versions sur
+exactement les mêmes requêtes. Avant les paliers, le routeur base/LLM est
+contrôlé sur CAS_ROUTAGE (paraphrases, questions hors sujet et voisines):
+code 1 si une réponse certifiée est servie à tort.
+
+Usage: python benchmarks/bench_api.py [--concurrence 1,4,16,64] [--requetes 200]
+       [--latence-llm-ms 800] [--latence-es-ms 20] [--max-p95-ms 2000] [--json resultats.json]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+
+# Aucun effet de bord hors du banc: journaux et caches temporaires, pas de préchauffage
+os.environ["CONVERSATION_DIR"] = tempfile.mkdtemp(prefix="bench_api_")
+os.environ["PRECHAUFFAGE"] = "0"
+os.environ["EMBEDDINGS_CACHE"] = "0"
+os.environ["COMPLETIONS_CACHE_DB"] = os.path.join(os.environ["CONVERSATION_DIR"], "completions.sqlite3")
+
+import httpx
+import numpy as np
+
+import api
+import es_client
+from jsonstream import lire_documents
+from retrieval import EMBEDDING_DIMS, MoteurLocal
+from text_utils import nettoyer_question
+
+PREFIXES_PARAPHRASE = ["", "Bonjour, ", "Dites-moi ", "Pouvez-vous m'expliquer ", "Je voudrais savoir ",
+                       "Svp ", "Question: "]
+SUFFIXES_PARAPHRASE = ["", " ?", " svp", " au Sénégal", " en 2025", " merci"]
+# Questions/réponses servies par le faux Elasticsearch (remplaçable par --corpus)
+CORPUS_TEST = Path(__file__).resolve().parent / "corpus_fiscal.ndjson"
+# Contrôle du routage sur le corpus de test: (question, question du corpus attendue, ou None si
+# aucune réponse certifiée ne doit être servie: hors sujet, ou sujet fiscal absent du corpus)
+CAS_ROUTAGE = [
+    ("Dites-moi quel est le taux normal de la TVA au Sénégal en 2025", "Quel est le taux normal de la TVA au Sénégal ?"),
+    ("Comment obtenir un NINEA svp", "Comment obtenir un NINEA ?"),
+    ("Bonjour, comment payer ses impôts en ligne merci", "Comment payer ses impôts en ligne ?"),
+    ("Quel est le prix du pain ?", None),
+    ("Quel temps fait-il à Dakar ?", None),
+    ("Comment obtenir un passeport ?", None),
+    ("C'est quoi la TEOM au juste", None),
+    ("Qui doit payer la TEOM ?", None),
+    ("Taux de la patente", None),
+    ("Quelle est la date limite de déclaration de la TVA ?", None),
+    ("Quel est le taux de la CFPNB ?", None),
+]
+REPONSE_LLM = ("📌 Contexte fiscal : selon le Code général des impôts du Sénégal, la démarche suit ces étapes. "
+               "🔢 Points clés : 1. déclaration auprès de la DGID ; 2. paiement de l'impôt dans les délais ; "
+               "3. pénalités en cas de retard. 📚 Référence légale : CGI. 🔗 https://www.dgid.sn")
+
+
+class EmbedderDeterministe:
+    """Remplace SentenceTransformer: n-grammes de caractères hachés, vecteurs normalisés"""
+
+    def __init__(self, dims: int = EMBEDDING_DIMS, latence: float = 0.0):
+        self.dims = dims
+        self.latence = latence
+
+    def encode(self, textes, batch_size: int = 32, normalize_embeddings: bool = True, show_progress_bar=False):
+        seul = isinstance(textes, str)
+        liste = [textes] if seul else list(textes)
+        if self.latence:
+            time.sleep(self.latence * max(1, len(liste) / batch_size))
+        vecteurs = np.zeros((len(liste), self.dims), dtype=np.float32)
+        for i, texte in enumerate(liste):
+            texte = f"  {nettoyer_question(texte)}  "
+            for j in range(len(texte) - 2):
+                vecteurs[i, zlib.crc32(texte[j:j + 3].encode("utf-8")) % self.dims] += 1.0
+        normes = np.linalg.norm(vecteurs, axis=1, keepdims=True)
+        vecteurs /= np.where(normes == 0, 1, normes)
+        return vecteurs[0] if seul else vecteurs
+
+
+class FauxLLM:
+    """Remplace ChatGroq: réponse fiscale déterministe après `latence` secondes"""
+
+    def __init__(self, latence: float):
+        self.latence = latence
+        self.appels = 0
+        self._lock = threading.Lock()
+
+    def _compter(self):
+        with self._lock:
+            self.appels += 1
+
+    def invoke(self, prompt):
+        self._compter()
+        time.sleep(self.latence)
+        return SimpleNamespace(content=REPONSE_LLM)
+
+    async def astream(self, prompt):
+        self._compter()
+        mots = REPONSE_LLM.split(" ")
+        for mot in mots:
+            await asyncio.sleep(self.latence / len(mots))
+            yield SimpleNamespace(content=f"{mot} ")
+
+
+class FauxAgent:
+    """Remplace l'agent LangChain: choix de l'outil, recherche_fiscale, rédaction"""
+
+    def __init__(self, assistant, llm: FauxLLM):
+        self.assistant = assistant
+        self.llm = llm
+
+    def invoke(self, entree: Dict, config=None):
+        self.llm.invoke(entree["input"])
+        observation = self.assistant.recherche_fiscale(entree["input"])
+        return {"output": self.llm.invoke(observation).content}
+
+
+class ElasticsearchLocal:
+    """Remplace AsyncElasticsearch pour msearch/ping/indices.stats, sur un MoteurLocal"""
+
+    def __init__(self, moteur: MoteurLocal, latence: float):
+        self.moteur = moteur
+        self.latence = latence
+        self.indices = SimpleNamespace(stats=self._stats)
+        self.requetes = 0
+
+    def options(self, **kwargs):
+        return self
+
+    async def ping(self) -> bool:
+        return True
+
+    async def msearch(self, searches: List[Dict], request_timeout=None, **kwargs):
+        await asyncio.sleep(self.latence)
+        reponses = []
+        for corps in searches[1::2]:
+            self.requetes += 1
+            taille = corps.get("size", 10)
+            if "knn" in corps:
+                hits = self.moteur.rechercher("", np.asarray(corps["knn"]["query_vector"]), taille)[1]
+            else:
+                texte = corps["query"]["bool"]["must"][0]["multi_match"]["query"]
+                hits = self.moteur.rechercher(texte, size=taille)[0]
+            reponses.append({"hits": {"hits": hits}})
+        return {"responses": reponses}
+
+    async def _stats(self, index=None, metric=None, **kwargs):
+        indexing = {"index_total": len(self.moteur), "delete_total": 0}
+        return {"indices": {"fiscality-bench": {"uuid": "bench", "primaries": {"indexing": indexing}}}}
+
+    async def close(self):
+        pass
+
+
+def lire_journaux(dossier: Path = RACINE / "conversation_data") -> List[Dict]:
+    """Échanges des journaux CSV (séparateur |)"""
+    echanges = []
+    for fichier in sorted(dossier.glob("conversations_*.csv")):
+        with open(fichier, encoding="utf-8", newline="") as f:
+            echanges += [ligne for ligne in csv.DictReader(f, delimiter="|") if ligne.get("question")]
+    return echanges
+
+def corpus_de_test(chemin: Path = CORPUS_TEST) -> List[Dict]:
+    """Corpus servi par le faux Elasticsearch (fichier QA en JSON ou NDJSON)"""
+    return [doc for doc in lire_documents(chemin) if isinstance(doc, dict) and doc.get("question")]
+
+def charge_de_travail(corpus: List[Dict], paraphrases: int, graine: int) -> List[str]:
+    """Questions des journaux et du corpus, avec des paraphrases synthétiques, tirées avec `graine`.
+
+    Les questions des journaux exercent les filtres (langue, hors domaine);
+    les paraphrases du corpus, le cache sémantique et le routage base/LLM.
+    """
+    hasard = random.Random(graine)
+    questions = list(dict.fromkeys(
+        [echange["question"].strip() for echange in lire_journaux()] + [doc["question"] for doc in corpus]
+    ))
+    charge = list(questions)
+    for question in questions:
+        for _ in range(paraphrases):
+            variante = question.rstrip(" ?")
+            variante = variante.lower() if hasard.random() < 0.5 else variante.capitalize()
+            charge.append(f"{hasard.choice(PREFIXES_PARAPHRASE)}{variante}{hasard.choice(SUFFIXES_PARAPHRASE)}")
+    hasard.shuffle(charge)
+    return charge
+
+def verifier_routage(assistant, corpus: List[Dict]) -> Dict:
+    """Rejoue CAS_ROUTAGE sur le routeur: réponses certifiées correctes, manquées, écartées et fausses"""
+    reponses = {doc["question"]: doc["reponse"].strip() for doc in corpus}
+    bilan, fausses = Counter(), []
+    for question, attendue in CAS_ROUTAGE:
+        servie = assistant.repondre_depuis_base(question)
+        if servie is None:
+            bilan["manquees" if attendue else "ecartees"] += 1
+        elif attendue and reponses[attendue] in servie:
+            bilan["correctes"] += 1
+        else:
+            bilan["fausses"] += 1
+            fausses.append(question)
+    return {**bilan, "questions_fausses": fausses}
+
+def percentile(valeurs: List[float], p: float) -> float:
+    return float(np.percentile(valeurs, p)) if valeurs else 0.0
+
+async def palier(client: httpx.AsyncClient, charge: List[str], concurrence: int, requetes: int,
+                 llm: FauxLLM) -> Dict:
+    """Envoie `requetes` questions avec `concurrence` clients simultanés"""
+    latences, statuts, sources = [], Counter(), Counter()
+    suivante = iter(range(requetes))
+    appels_avant = llm.appels
+
+    async def utilisateur(numero: int):
+        for i in suivante:
+            debut = time.perf_counter()
+            reponse = await client.post("/api/ask", json={
+                "question": charge[i % len(charge)], "user_id": f"bench-{numero}"
+            })
+            latences.append((time.perf_counter() - debut) * 1e3)
+            statuts[reponse.status_code] += 1
+            if reponse.status_code == 200:
+                sources[reponse.json().get("source")] += 1
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(utilisateur(n) for n in range(concurrence)))
+    duree = time.perf_counter() - debut
+    return {
+        "concurrence": concurrence,
+        "requetes": requetes,
+        "erreurs": requetes - statuts[200],
+        "req_s": requetes / duree,
+        "p50_ms": percentile(latences, 50),
+        "p95_ms": percentile(latences, 95),
+        "p99_ms": percentile(latences, 99),
+        "llm_par_requete": (llm.appels - appels_avant) / requetes,
+        "statuts": dict(statuts),
+        "sources": dict(sources),
+    }
+
+async def executer(args) -> List[Dict]:
+    corpus = corpus_de_test(args.corpus)
+    embedder = EmbedderDeterministe(latence=args.latence_embedding_ms / 1e3)
+    moteur = MoteurLocal(corpus, embedder.encode([doc["question"] for doc in corpus]))
+    llm = FauxLLM(args.latence_llm_ms / 1e3)
+
+    if args.rejouer:
+        charge = json.loads(Path(args.rejouer).read_text(encoding="utf-8"))
+    else:
+        charge = charge_de_travail(corpus, args.paraphrases, args.graine)
+    if args.enregistrer:
+        Path(args.enregistrer).write_text(json.dumps(charge, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"{len(corpus)} documents servis, {len(charge)} questions dans la charge\n")
+
+    # Le faux client est installé comme client partagé: le cycle de vie de l'API le reprend tel quel
+    es_client._client = ElasticsearchLocal(moteur, args.latence_es_ms / 1e3)
+    es_client._boucle = asyncio.get_running_loop()
+    es_client._initialise = True
+
+    resultats, routage = [], None
+    async with api.lifespan(api.app):
+        assistant = api.app.assistant
+        assistant.moteur_local = moteur
+        assistant._ressources.update(embedder=embedder, llm=llm, agent=FauxAgent(assistant, llm))
+        if args.corpus == CORPUS_TEST:
+            # Le routeur est synchrone (il attend le faux Elasticsearch sur cette boucle): hors de la boucle
+            routage = await asyncio.to_thread(verifier_routage, assistant, corpus)
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for concurrence in args.concurrence:
+                if not args.garder_cache:
+                    assistant.vider_cache()
+                    if assistant.cache_completions is not None:
+                        assistant.cache_completions.purger()
+                resultats.append(await palier(client, charge, concurrence, args.requetes, llm))
+    return resultats, routage
+
+def afficher(resultats: List[Dict]):
+    print(f"\n{'concurrence':>11}{'requêtes':>10}{'erreurs':>9}{'req/s':>9}{'p50 (ms)':>10}"
+          f"{'p95 (ms)':>10}{'p99 (ms)':>10}{'LLM/req':>9}  sources")
+    for r in resultats:
+        sources = ", ".join(f"{k}={v}" for k, v in sorted(r["sources"].items(), key=lambda s: -s[1]))
+        print(f"{r['concurrence']:>11}{r['requetes']:>10}{r['erreurs']:>9}{r['req_s']:>9.1f}"
+              f"{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}{r['llm_par_requete']:>9.2f}  {sources}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrence", type=lambda v: [int(n) for n in v.split(",")], default=[1, 4, 16, 64],
+                        help="Paliers de clients simultanés, séparés par des virgules")
+    parser.add_argument("--requetes", type=int, default=200, help="Requêtes par palier")
+    parser.add_argument("--paraphrases", type=int, default=3, help="Paraphrases générées par question")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--corpus", type=Path, default=CORPUS_TEST,
+                        help="Fichier QA (JSON ou NDJSON) servi par le faux Elasticsearch")
+    parser.add_argument("--latence-llm-ms", type=float, default=800)
+    parser.add_argument("--latence-es-ms", type=float, default=20)
+    parser.add_argument("--latence-embedding-ms", type=float, default=5)
+    parser.add_argument("--garder-cache", action="store_true",
+                        help="Ne pas vider les caches de réponses entre deux paliers")
+    parser.add_argument("--enregistrer", help="Écrit la charge générée dans ce fichier")
+    parser.add_argument("--rejouer", help="Rejoue une charge enregistrée avec --enregistrer")
+    parser.add_argument("--json", help="Écrit les résultats dans ce fichier")
+    parser.add_argument("--max-p95-ms", type=float, help="Échec (code 1) si un palier dépasse ce p95")
+    args = parser.parse_args()
+
+    resultats, routage = asyncio.run(executer(args))
+    afficher(resultats)
+    if routage is not None:
+        print(f"\nRoutage ({len(CAS_ROUTAGE)} cas): " + ", ".join(
+            f"{k}={routage.get(k, 0)}" for k in ("correctes", "manquees", "ecartees", "fausses")))
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultats, indent=2), encoding="utf-8")
+    if args.max_p95_ms is not None:
+        lents = [r["concurrence"] for r in resultats if r["p95_ms"] > args.max_p95_ms]
+        if lents:
+            raise SystemExit(f"❌ p95 au-dessus de {args.max_p95_ms:.0f} ms pour la concurrence {lents}")
+        print(f"\n✅ p95 sous {args.max_p95_ms:.0f} ms à tous les paliers")
+    if routage and routage["questions_fausses"]:
+        raise SystemExit(f"❌ Réponse certifiée servie à tort pour: {routage['questions_fausses']}")
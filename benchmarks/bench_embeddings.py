@@ -0,0 +1,81 @@
+"""Compare les backends d'embedding torch (fp32) et onnx (int8) sur les questions indexées.
+
+Chaque backend est mesuré dans un processus séparé pour que la mémoire
+(RSS max) ne mélange pas les deux modèles: chargement, latence d'une
+question seule (chemin des requêtes), débit par lots (indexation).
+La parité est ensuite vérifiée sur les similarités cosinus.
+
+Prérequis: snapshot exporté (python index.py --snapshot-only) et modèle
+ONNX exporté (python embeddings.py --exporter).
+
+Usage: python benchmarks/bench_embeddings.py [--questions 500] [--batch-size 32]
+"""
+import argparse
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+
+from embeddings import SEUIL_PARITE, charger_embedder, questions_indexees, verifier_parite
+from text_utils import nettoyer_question
+
+
+def mesurer(backend, questions, batch_size):
+    rss_initial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    debut = time.perf_counter()
+    modele = charger_embedder(backend, repli=False)
+    chargement = time.perf_counter() - debut
+    modele.encode(questions[0], normalize_embeddings=True)  # premier appel hors mesure
+
+    latences = []
+    for question in questions:
+        debut = time.perf_counter()
+        modele.encode(question, normalize_embeddings=True)
+        latences.append((time.perf_counter() - debut) * 1e3)
+
+    debut = time.perf_counter()
+    modele.encode(questions, batch_size=batch_size, normalize_embeddings=True)
+    debit = len(questions) / (time.perf_counter() - debut)
+
+    latences.sort()
+    return {
+        "chargement_s": chargement,
+        "p50_ms": statistics.median(latences),
+        "p95_ms": latences[int(len(latences) * 0.95) - 1],
+        "debit_qps": debit,
+        # ru_maxrss est en Ko sous Linux
+        "rss_mo": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_modele_mo": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_initial) / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    questions = [nettoyer_question(q) for q in questions_indexees()][:args.questions]
+    print(f"{len(questions)} questions indexées, lots de {args.batch_size}\n")
+
+    contexte = multiprocessing.get_context("spawn")
+    resultats = {}
+    for backend in ("torch", "onnx"):
+        with contexte.Pool(1) as processus:
+            resultats[backend] = processus.apply(mesurer, (backend, questions, args.batch_size))
+
+    print(f"{'backend':<10}{'chargement':>12}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'questions/s':>13}{'RSS (Mo)':>10}{'modèle (Mo)':>13}")
+    for backend, r in resultats.items():
+        print(f"{backend:<10}{r['chargement_s']:>11.1f}s{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['debit_qps']:>13.0f}{r['rss_mo']:>10.0f}{r['rss_modele_mo']:>13.0f}")
+
+    parite = verifier_parite(charger_embedder("torch"), charger_embedder("onnx", repli=False), questions)
+    print(f"\nParité: {', '.join(f'{k}={v:.4f}' for k, v in parite.items())}")
+    print("✅ Parité respectée" if parite["cosinus_min"] >= SEUIL_PARITE
+          else f"❌ Cosinus min sous le seuil {SEUIL_PARITE}")
@@ -0,0 +1,95 @@
+"""Compare le filtre de langue (FiltreLangue) aux appels directs à langdetect.detect.
+
+Questions: celles journalisées dans conversation_data/*.csv (toutes en français),
+complétées d'un petit jeu étiqueté en d'autres langues.
+
+Usage: python benchmarks/bench_langue.py [--tours 20]
+"""
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RACINE))
+
+from langdetect import detect
+from langdetect.lang_detect_exception import LangDetectException
+
+from language_gate import FiltreLangue
+from matcher import classifieur_fiscal
+
+QUESTIONS_ETRANGERES = [
+    "What is the VAT rate in Senegal?",
+    "How do I pay my property tax?",
+    "Who is the president of Mali?",
+    "¿Cómo pagar el impuesto sobre la renta?",
+    "Como pagar o imposto de renda?",
+    "Wie hoch ist die Mehrwertsteuer?",
+    "Naka laa wara fey sama impôt?",
+    # Vocabulaire fiscal ou mots-outils ambigus (« il », « qui »): jamais acceptés sans détection
+    "¿Cuál es la TVA?",
+    "Naka lay fey TVA",
+    "Quanto costa la patente",
+    "Come pagare la patente per il negozio",
+]
+QUESTIONS_FRANCAISES = [
+    "C'est quoi la TEOM ?",
+    "quitus fiscal",
+    "délai de paiement CFPNB",
+    "Comment obtenir un NINEA ?",
+    "Quels sont les taux de TVA au Sénégal ?",
+]
+
+
+def charger_questions():
+    questions = []
+    for fichier in sorted((RACINE / "conversation_data").glob("*.csv")):
+        with open(fichier, encoding="utf-8", newline="") as f:
+            questions += [ligne["question"] for ligne in csv.DictReader(f, delimiter="|")]
+    return questions
+
+
+def langue_ou_erreur(fonction, texte):
+    try:
+        return fonction(texte)
+    except LangDetectException:
+        return "?"
+
+
+def evaluer(nom, fonction, jeu, tours):
+    verdicts = {}
+    debut = time.perf_counter()
+    for _ in range(tours):
+        for texte, _attendu in jeu:
+            verdicts.setdefault(texte, set()).add(langue_ou_erreur(fonction, texte))
+    duree = time.perf_counter() - debut
+
+    appels = tours * len(jeu)
+    justes = sum(1 for texte, attendu in jeu
+                 if len(verdicts[texte]) == 1 and (next(iter(verdicts[texte])) == "fr") == (attendu == "fr"))
+    instables = sum(1 for v in verdicts.values() if len(v) > 1)
+    print(f"{nom:<26}{appels / duree:>12.0f}{duree / appels * 1e6:>12.0f}"
+          f"{justes / len(jeu):>12.1%}{instables:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tours", type=int, default=20)
+    args = parser.parse_args()
+
+    jeu = [(q, "fr") for q in charger_questions() + QUESTIONS_FRANCAISES]
+    jeu += [(q, "autre") for q in QUESTIONS_ETRANGERES]
+
+    debut = time.perf_counter()
+    filtre = FiltreLangue(classifieur_fiscal())
+    print(f"Construction du filtre: {(time.perf_counter() - debut) * 1e3:.0f} ms")
+    detect("initialisation")  # chargement des profils langdetect hors mesure
+    print(f"{len(jeu)} questions, {args.tours} tours\n")
+
+    print(f"{'détecteur':<26}{'appels/s':>12}{'µs/appel':>12}{'exactitude':>12}{'instables':>12}")
+    evaluer("langdetect.detect", detect, jeu, args.tours)
+    evaluer("FiltreLangue (sans memo)", lambda t: (filtre._memo.clear(), filtre.detecter(t))[1], jeu, args.tours)
+    evaluer("FiltreLangue", filtre.detecter, jeu, args.tours)
+    print(f"\nRépartition des chemins: {filtre.stats()}")
@@ -0,0 +1,71 @@
+"""Micro-benchmark du classifieur fiscal compilé contre l'ancienne détection par sous-chaînes.
+
+Usage: python benchmarks/bench_matcher.py [--repetitions 2000]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from matcher import MOTS_CLES_FISCAUX, SALUTATIONS, MOTS_HORS_DOMAINE, PHRASES_REJET, classifieur_fiscal
+
+QUESTION = "Comment obtenir un quitus fiscal pour ma PME ?"
+
+# Réponse type du LLM (structure imposée par le prompt), répétée pour atteindre ~1500 tokens
+REPONSE_LONGUE = (
+    "📌 Contexte fiscal : la contribution foncière des propriétés bâties est due chaque année "
+    "par le propriétaire au 1er janvier. 🔢 Points clés : 1. la base d'imposition est la valeur "
+    "locative ; 2. le paiement se fait auprès du centre des services fiscaux ; 3. des pénalités "
+    "s'appliquent en cas de retard ; 4. certaines exonérations temporaires existent. 📚 Référence "
+    "légale : Code général des impôts. 🔗 https://www.dgid.sn/procedures-fiscales/ "
+) * 12
+
+
+def ancienne_est_question_fiscale(query):
+    """Implémentation historique (reconstruit les sigles et parcourt chaque mot-clé)"""
+    query_lower = query.lower()
+    if any(salut in query_lower for salut in SALUTATIONS if len(query_lower.split()) <= 3):
+        return False
+    sigles = {mot for mot in MOTS_CLES_FISCAUX if mot.isupper() and len(mot) >= 3}
+    if any(sigle in query_lower for sigle in (s.lower() for s in sigles)):
+        return True
+    return any(mot.lower() in query_lower for mot in MOTS_CLES_FISCAUX)
+
+
+def ancienne_validation(answer):
+    """Ancien should_reject_response + is_question_fiscale_strict sur le même texte"""
+    answer_lower = answer.lower()
+    rejet = any(phrase in answer_lower for phrase in PHRASES_REJET)
+    hors_domaine = any(mot in answer_lower for mot in MOTS_HORS_DOMAINE)
+    return rejet, hors_domaine, ancienne_est_question_fiscale(answer)
+
+
+def nouvelle_validation(answer):
+    matches = classifieur_fiscal().analyser(answer)
+    return bool(matches["rejet"]), bool(matches["hors_domaine"]), bool(matches["fiscal"])
+
+
+def mesurer(fonction, texte, repetitions):
+    return min(timeit.repeat(lambda: fonction(texte), number=repetitions, repeat=5)) / repetitions * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repetitions", type=int, default=2000)
+    args = parser.parse_args()
+
+    construction = timeit.timeit(lambda: classifieur_fiscal.__wrapped__(), number=5) / 5 * 1e3
+    print(f"Construction du classifieur: {construction:.1f} ms (une fois par processus)")
+    print(f"Réponse longue: {len(REPONSE_LONGUE)} caractères\n")
+    print(f"{'cas':<40}{'ancien (µs)':>14}{'compilé (µs)':>14}{'gain':>8}")
+
+    cas = [
+        ("question courte", QUESTION),
+        ("réponse LLM longue", REPONSE_LONGUE),
+    ]
+    for nom, texte in cas:
+        ancien = mesurer(ancienne_validation, texte, args.repetitions)
+        nouveau = mesurer(nouvelle_validation, texte, args.repetitions)
+        print(f"{nom:<40}{ancien:>14.1f}{nouveau:>14.1f}{ancien / nouveau:>7.1f}x")
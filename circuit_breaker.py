@@ -0,0 +1,167 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+FERME, OUVERT, DEMI_OUVERT = "ferme", "ouvert", "demi_ouvert"
+
+
+class CircuitOuvert(Exception):
+    """Dépendance coupée par son disjoncteur: l'appel échoue immédiatement"""
+
+    def __init__(self, nom: str, retry_after: float):
+        super().__init__(f"{nom} indisponible (disjoncteur ouvert), nouvel essai dans {retry_after:.0f}s")
+        self.nom = nom
+        self.retry_after = retry_after
+
+
+class Disjoncteur:
+    """Disjoncteur d'une dépendance (Elasticsearch, Groq) sur une fenêtre glissante.
+
+    Fermé: les appels passent et sont mesurés sur les `fenetre` dernières
+    secondes. Dès `min_appels` appels, un taux d'erreurs ou d'appels lents
+    (plus de `seuil_lenteur` secondes) atteignant `taux_max` l'ouvre.
+    Ouvert: les appels échouent immédiatement (CircuitOuvert) pendant
+    `duree_ouverture` secondes, puis il passe demi-ouvert.
+    Demi-ouvert: au plus `sondes` appels passent à la fois; une sonde
+    réussie et rapide le referme, un échec le rouvre.
+
+    `appel()` est réentrant: un appel imbriqué dans un autre appel de la
+    même dépendance (l'outil de l'agent qui appelle le LLM pendant l'agent)
+    est compté avec l'appel englobant.
+    """
+
+    def __init__(self, nom: str, fenetre: float = 60.0, min_appels: int = 5, taux_max: float = 0.5,
+                 seuil_lenteur: Optional[float] = None, duree_ouverture: float = 30.0, sondes: int = 1,
+                 sur_transition: Optional[Callable[[str, str], None]] = None):
+        self.nom = nom
+        self.fenetre = fenetre
+        self.min_appels = min_appels
+        self.taux_max = taux_max
+        self.seuil_lenteur = seuil_lenteur
+        self.duree_ouverture = duree_ouverture
+        self.sondes = sondes
+        self.sur_transition = sur_transition
+        self._lock = threading.Lock()
+        self._etat = FERME
+        self._ouvert_jusqua = 0.0
+        self._sondes_en_cours = 0
+        # (instant, échec, lent) des appels de la fenêtre
+        self._appels: "deque[tuple]" = deque()
+        self._dans_appel: contextvars.ContextVar[bool] = contextvars.ContextVar(f"disjoncteur_{nom}", default=False)
+        self.compteurs = {"succes": 0, "echecs": 0, "lents": 0, "rejets": 0, "ouvertures": 0}
+
+    @property
+    def etat(self) -> str:
+        with self._lock:
+            if self._etat == OUVERT and time.monotonic() >= self._ouvert_jusqua:
+                return DEMI_OUVERT
+            return self._etat
+
+    def est_ouvert(self) -> bool:
+        """Vrai si un appel serait refusé maintenant (sans consommer de sonde)"""
+        with self._lock:
+            if self._etat == OUVERT:
+                return time.monotonic() < self._ouvert_jusqua
+            return self._etat == DEMI_OUVERT and self._sondes_en_cours >= self.sondes
+
+    @contextmanager
+    def appel(self):
+        """Encadre un appel à la dépendance: CircuitOuvert si refusé, sinon durée et issue enregistrées"""
+        if self._dans_appel.get():
+            yield
+            return
+        sonde = self._autoriser()
+        jeton = self._dans_appel.set(True)
+        debut = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self._enregistrer(sonde, echec=True, duree=time.monotonic() - debut)
+            raise
+        except BaseException:
+            # Annulation (client parti): ni succès ni échec, la sonde est rendue
+            if sonde:
+                with self._lock:
+                    self._sondes_en_cours -= 1
+            raise
+        else:
+            self._enregistrer(sonde, echec=False, duree=time.monotonic() - debut)
+        finally:
+            self._dans_appel.reset(jeton)
+
+    def stats(self) -> Dict[str, object]:
+        etat = self.etat
+        with self._lock:
+            self._purger(time.monotonic())
+            echecs = sum(1 for _, echec, _ in self._appels if echec)
+            lents = sum(1 for _, _, lent in self._appels if lent)
+            return {
+                "etat": etat,
+                **self.compteurs,
+                "fenetre_appels": len(self._appels),
+                "fenetre_echecs": echecs,
+                "fenetre_lents": lents,
+            }
+
+    def _autoriser(self) -> bool:
+        """Retourne vrai si l'appel est une sonde (demi-ouvert); lève CircuitOuvert si refusé"""
+        with self._lock:
+            maintenant = time.monotonic()
+            if self._etat == OUVERT:
+                if maintenant < self._ouvert_jusqua:
+                    self.compteurs["rejets"] += 1
+                    raise CircuitOuvert(self.nom, self._ouvert_jusqua - maintenant)
+                self._transition(DEMI_OUVERT)
+            if self._etat == DEMI_OUVERT:
+                if self._sondes_en_cours >= self.sondes:
+                    self.compteurs["rejets"] += 1
+                    raise CircuitOuvert(self.nom, 1)
+                self._sondes_en_cours += 1
+                return True
+            return False
+
+    def _enregistrer(self, sonde: bool, echec: bool, duree: float):
+        lent = not echec and self.seuil_lenteur is not None and duree > self.seuil_lenteur
+        with self._lock:
+            maintenant = time.monotonic()
+            self.compteurs["echecs" if echec else "lents" if lent else "succes"] += 1
+            if sonde:
+                self._sondes_en_cours -= 1
+                if self._etat == DEMI_OUVERT:
+                    if echec or lent:
+                        self._ouvrir(maintenant)
+                    else:
+                        self._appels.clear()
+                        self._transition(FERME)
+                return
+            if self._etat != FERME:
+                return  # appel commencé avant l'ouverture
+            self._appels.append((maintenant, echec, lent))
+            self._purger(maintenant)
+            n = len(self._appels)
+            if n >= self.min_appels:
+                mauvais = sum(1 for _, e, l in self._appels if e or l)
+                if mauvais / n >= self.taux_max:
+                    self._ouvrir(maintenant)
+
+    def _ouvrir(self, maintenant: float):
+        self._ouvert_jusqua = maintenant + self.duree_ouverture
+        self._appels.clear()
+        self.compteurs["ouvertures"] += 1
+        self._transition(OUVERT)
+        print(f"⚠️ Disjoncteur {self.nom} ouvert: appels coupés pendant {self.duree_ouverture:.0f}s")
+
+    def _transition(self, etat: str):
+        ancien, self._etat = self._etat, etat
+        if etat == FERME and ancien != FERME:
+            print(f"✅ Disjoncteur {self.nom} refermé")
+        if self.sur_transition is not None and ancien != etat:
+            self.sur_transition(self.nom, etat)
+
+    def _purger(self, maintenant: float):
+        limite = maintenant - self.fenetre
+        while self._appels and self._appels[0][0] < limite:
+            self._appels.popleft()
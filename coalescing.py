@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class Coalesceur:
+    """Regroupe les calculs identiques simultanés (single-flight).
+
+    Le premier appel pour une clé lance le calcul dans une tâche; les
+    appels suivants avec la même clé, tant que ce calcul est en cours,
+    attendent son résultat au lieu d'en relancer un. Le résultat (ou
+    l'exception) est partagé par tous; une fois terminé, la clé est
+    libérée et l'appel suivant recalcule. Le calcul n'est pas annulé si
+    l'appelant qui l'a lancé abandonne. Doit être utilisé depuis une
+    seule boucle asyncio.
+    """
+
+    def __init__(self):
+        self._en_vol: Dict[Hashable, asyncio.Task] = {}
+        self.compteurs = {"calculs": 0, "coalescees": 0}
+
+    async def executer(self, cle: Hashable, fabrique: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """Retourne (résultat, partagé): `partagé` est vrai si un calcul en cours a été réutilisé"""
+        tache = self._en_vol.get(cle)
+        partage = tache is not None
+        if partage:
+            self.compteurs["coalescees"] += 1
+        else:
+            self.compteurs["calculs"] += 1
+            # La tâche hérite du contexte (contextvars) de l'appelant qui l'a lancée
+            tache = asyncio.ensure_future(fabrique())
+            self._en_vol[cle] = tache
+            tache.add_done_callback(lambda t: self._terminer(cle, t))
+        return await asyncio.shield(tache), partage
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.compteurs, "en_vol": len(self._en_vol)}
+
+    def _terminer(self, cle: Hashable, tache: asyncio.Task):
+        if self._en_vol.get(cle) is tache:
+            del self._en_vol[cle]
+        # Exception consommée même si tous les appelants ont abandonné
+        if not tache.cancelled():
+            tache.exception()
@@ -0,0 +1,153 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    cle TEXT PRIMARY KEY,
+    modele TEXT NOT NULL,
+    empreinte_prompt TEXT NOT NULL,
+    question TEXT NOT NULL,
+    reponse TEXT NOT NULL,
+    taille INTEGER NOT NULL,
+    cree REAL NOT NULL,
+    dernier_acces REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS completions_acces ON completions (dernier_acces);
+CREATE INDEX IF NOT EXISTS completions_question ON completions (question);
+"""
+_COLONNES = ["cle", "modele", "empreinte_prompt", "question", "taille", "cree", "dernier_acces", "hits"]
+
+
+def empreinte(texte: str) -> str:
+    return hashlib.sha1(texte.encode("utf-8")).hexdigest()
+
+
+class CacheCompletions:
+    """Cache disque des réponses générées par le LLM, partagé par les workers (SQLite WAL).
+
+    Une entrée est identifiée par le modèle, l'empreinte du gabarit de
+    prompt et la question normalisée: changer de modèle ou de prompt
+    invalide naturellement les anciennes réponses. Les entrées expirent
+    après `ttl` secondes; au-delà de `max_entrees` ou `max_octets`, les
+    moins récemment servies sont évincées (jusqu'à 90 % des limites).
+    """
+
+    def __init__(self, chemin: Path, ttl: float = 7 * 86400, max_entrees: int = 5000,
+                 max_octets: int = 50 * 1024 * 1024):
+        self.chemin = Path(chemin)
+        self.ttl = ttl
+        self.max_entrees = max_entrees
+        self.max_octets = max_octets
+        self._lock = threading.Lock()
+        self.compteurs = {"hits": 0, "misses": 0, "ajouts": 0, "evictions": 0}
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connexion()) as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.executescript(_SCHEMA)
+
+    @staticmethod
+    def cle(modele: str, empreinte_prompt: str, question: str) -> str:
+        return empreinte(f"{modele}\0{empreinte_prompt}\0{question}")
+
+    def obtenir(self, modele: str, empreinte_prompt: str, question: str) -> Optional[str]:
+        """Réponse mémorisée pour cette question (None si absente ou expirée)"""
+        maintenant = time.time()
+        cle = self.cle(modele, empreinte_prompt, question)
+        with closing(self._connexion()) as connexion, connexion:
+            ligne = connexion.execute(
+                "SELECT reponse FROM completions WHERE cle = ? AND cree >= ?", (cle, maintenant - self.ttl)
+            ).fetchone()
+            if ligne is not None:
+                connexion.execute(
+                    "UPDATE completions SET dernier_acces = ?, hits = hits + 1 WHERE cle = ?", (maintenant, cle)
+                )
+        with self._lock:
+            self.compteurs["hits" if ligne else "misses"] += 1
+        return ligne[0] if ligne else None
+
+    def enregistrer(self, modele: str, empreinte_prompt: str, question: str, reponse: str):
+        maintenant = time.time()
+        with closing(self._connexion()) as connexion, connexion:
+            connexion.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(cle, modele, empreinte_prompt, question, reponse, taille, cree, dernier_acces) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.cle(modele, empreinte_prompt, question), modele, empreinte_prompt, question, reponse,
+                 len(reponse.encode("utf-8")), maintenant, maintenant)
+            )
+            evincees = self._evincer(connexion, maintenant)
+        with self._lock:
+            self.compteurs["ajouts"] += 1
+            self.compteurs["evictions"] += evincees
+
+    def lister(self, limite: int = 50, question: Optional[str] = None) -> List[Dict]:
+        """Entrées les plus récemment servies (filtre optionnel sur la question normalisée)"""
+        if question:
+            # % et _ du texte cherché pris littéralement, pas comme jokers
+            motif = question.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clause, parametres = "WHERE question LIKE ? ESCAPE '\\'", (f"%{motif}%",)
+        else:
+            clause, parametres = "", ()
+        with closing(self._connexion()) as connexion:
+            connexion.row_factory = sqlite3.Row
+            lignes = connexion.execute(
+                f"SELECT {', '.join(_COLONNES)} FROM completions {clause} ORDER BY dernier_acces DESC LIMIT ?",
+                (*parametres, limite)
+            ).fetchall()
+        return [{**dict(ligne), "expire": ligne["cree"] + self.ttl} for ligne in lignes]
+
+    def purger(self, cle: Optional[str] = None, question: Optional[str] = None) -> int:
+        """Supprime une entrée (`cle`), celles d'une question normalisée, ou tout le cache"""
+        if cle is not None:
+            requete, parametres = "DELETE FROM completions WHERE cle = ?", (cle,)
+        elif question is not None:
+            requete, parametres = "DELETE FROM completions WHERE question = ?", (question,)
+        else:
+            requete, parametres = "DELETE FROM completions", ()
+        with closing(self._connexion()) as connexion, connexion:
+            return connexion.execute(requete, parametres).rowcount
+
+    def stats(self) -> Dict[str, float]:
+        with closing(self._connexion()) as connexion:
+            entrees, octets = connexion.execute(
+                "SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM completions"
+            ).fetchone()
+        total = self.compteurs["hits"] + self.compteurs["misses"]
+        return {
+            **self.compteurs,
+            "taux_hits": round(self.compteurs["hits"] / total, 3) if total else 0.0,
+            "entrees": entrees,
+            "octets": octets,
+        }
+
+    def _evincer(self, connexion: sqlite3.Connection, maintenant: float) -> int:
+        """Supprime les entrées expirées puis, si une limite est dépassée, les moins récemment servies"""
+        evincees = connexion.execute("DELETE FROM completions WHERE cree < ?", (maintenant - self.ttl,)).rowcount
+        entrees, octets = connexion.execute(
+            "SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM completions"
+        ).fetchone()
+        if entrees <= self.max_entrees and octets <= self.max_octets:
+            return evincees
+
+        cibles_entrees, cibles_octets = int(self.max_entrees * 0.9), int(self.max_octets * 0.9)
+        a_supprimer = []
+        for cle, taille in connexion.execute("SELECT cle, taille FROM completions ORDER BY dernier_acces"):
+            if entrees <= cibles_entrees and octets <= cibles_octets:
+                break
+            a_supprimer.append((cle,))
+            entrees -= 1
+            octets -= taille
+        connexion.executemany("DELETE FROM completions WHERE cle = ?", a_supprimer)
+        return evincees + len(a_supprimer)
+
+    def _connexion(self) -> sqlite3.Connection:
+        # Une connexion par appel, comme StoreConversations: sûr entre threads et processus
+        connexion = sqlite3.connect(self.chemin, timeout=10)
+        connexion.execute("PRAGMA busy_timeout=10000")
+        return connexion
@@ -0,0 +1,156 @@
+import csv
+import gzip
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from verrou import VerrouFichier
+
+COLONNES = ["timestamp", "question", "answer", "conversation_id", "source", "user_id"]
+FORMATS = ("csv", "csv.gz", "parquet")
+_FIN = object()
+
+
+class JournalConversations:
+    """Journal des conversations écrit par un thread en arrière-plan.
+
+    `enregistrer` ne fait qu'ajouter l'élément à une file en mémoire: la
+    latence des requêtes ne dépend pas du disque. Le thread écrit par lots
+    (au plus `taille_lot` éléments, ou toutes les `intervalle` secondes)
+    dans `conversations_<jour>[.<n>].<format>`, avec rotation par jour et
+    au-delà de `taille_max` octets.
+
+    Plusieurs workers (processus) peuvent partager le dossier: chaque lot
+    est écrit d'un seul bloc sous un verrou fcntl du dossier. En "csv.gz",
+    chaque lot est un membre gzip ajouté au fichier du jour; en "parquet",
+    chaque lot est un fichier distinct (le format ne permet pas l'ajout).
+
+    `sur_lot` reçoit chaque lot écrit, dans le même thread (par exemple
+    pour alimenter un index des conversations).
+    """
+
+    def __init__(self, dossier: Path, format: str = "csv", taille_max: int = 50 * 1024 * 1024,
+                 taille_lot: int = 100, intervalle: float = 2.0, max_file: int = 10000,
+                 sur_lot: Optional[Callable[[List[Dict]], None]] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Format de journal inconnu: {format} (attendu: {', '.join(FORMATS)})")
+        self.dossier = Path(dossier)
+        self.format = format
+        self.taille_max = taille_max
+        self.taille_lot = taille_lot
+        self.intervalle = intervalle
+        self.sur_lot = sur_lot
+        self._file: "queue.Queue" = queue.Queue(maxsize=max_file)
+        self._sequence = 0
+        self.compteurs = {"ecrits": 0, "lots": 0, "perdus": 0, "erreurs": 0}
+        self._thread = threading.Thread(target=self._boucle, name="journal-conversations", daemon=True)
+        self._thread.start()
+
+    def enregistrer(self, element: Dict):
+        """Ajoute un échange (dict aux clés de COLONNES) sans jamais bloquer"""
+        try:
+            self._file.put_nowait(element)
+        except queue.Full:
+            self.compteurs["perdus"] += 1
+
+    def fermer(self, timeout: Optional[float] = 10.0):
+        """Écrit les éléments encore en file puis arrête le thread"""
+        if self._thread.is_alive():
+            self._file.put(_FIN)
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.compteurs, "en_file": self._file.qsize()}
+
+    def _boucle(self):
+        lot: List[Dict] = []
+        echeance = time.monotonic() + self.intervalle
+        while True:
+            try:
+                element = self._file.get(timeout=max(0.0, echeance - time.monotonic()))
+            except queue.Empty:
+                element = None
+            if element is not None and element is not _FIN:
+                lot.append(element)
+            if lot and (element is None or element is _FIN or len(lot) >= self.taille_lot):
+                self._ecrire_lot(lot)
+                lot = []
+            if element is _FIN:
+                return
+            if element is None or not lot:
+                echeance = time.monotonic() + self.intervalle
+
+    def _ecrire_lot(self, lot: List[Dict]):
+        # Un fichier par jour: le lot est réparti selon la date de chaque échange
+        par_jour: Dict[str, List[Dict]] = {}
+        for element in lot:
+            horodatage = element.get("timestamp") or datetime.now()
+            jour = horodatage.strftime("%Y-%m-%d") if isinstance(horodatage, datetime) else str(horodatage)[:10]
+            par_jour.setdefault(jour, []).append(element)
+        try:
+            self.dossier.mkdir(parents=True, exist_ok=True)
+            with self._verrou():
+                for jour, elements in par_jour.items():
+                    if self.format == "parquet":
+                        self._ecrire_parquet(jour, elements)
+                    else:
+                        self._ajouter_csv(jour, elements)
+            self.compteurs["ecrits"] += len(lot)
+            self.compteurs["lots"] += 1
+        except Exception as e:
+            self.compteurs["erreurs"] += 1
+            print(f"⚠️ Erreur d'écriture du journal des conversations: {e}")
+        if self.sur_lot is not None:
+            try:
+                self.sur_lot(lot)
+            except Exception as e:
+                print(f"⚠️ Erreur de traitement d'un lot du journal: {e}")
+
+    def _chemin(self, jour: str) -> Path:
+        """Fichier courant du jour: le premier qui n'a pas atteint taille_max"""
+        n = 0
+        while True:
+            suffixe = f".{n}" if n else ""
+            chemin = self.dossier / f"conversations_{jour}{suffixe}.{self.format}"
+            if not chemin.exists() or chemin.stat().st_size < self.taille_max:
+                return chemin
+            n += 1
+
+    def _ajouter_csv(self, jour: str, elements: List[Dict]):
+        chemin = self._chemin(jour)
+        tampon = io.StringIO()
+        writer = csv.writer(tampon, delimiter='|')
+        if not chemin.exists() or chemin.stat().st_size == 0:
+            writer.writerow(COLONNES)
+        for element in elements:
+            horodatage = element.get("timestamp")
+            writer.writerow([
+                horodatage.isoformat() if isinstance(horodatage, datetime) else horodatage,
+                *(element.get(colonne) for colonne in COLONNES[1:])
+            ])
+        donnees = tampon.getvalue().encode("utf-8")
+        if self.format == "csv.gz":
+            donnees = gzip.compress(donnees)
+        # Un seul write en mode ajout: les lots de plusieurs workers ne s'entremêlent pas
+        with open(chemin, "ab") as f:
+            f.write(donnees)
+
+    def _ecrire_parquet(self, jour: str, elements: List[Dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._sequence += 1
+        table = pa.table({
+            colonne: [element.get(colonne) for element in elements] for colonne in COLONNES
+        })
+        nom = f"conversations_{jour}_{os.getpid()}_{int(time.time())}_{self._sequence}.parquet"
+        pq.write_table(table, self.dossier / nom, compression="zstd")
+
+    def _verrou(self):
+        return VerrouFichier(self.dossier / ".conversations.lock")
+
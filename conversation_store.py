@@ -0,0 +1,111 @@
+import csv
+import gzip
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT UNIQUE NOT NULL,
+    timestamp TEXT NOT NULL,
+    question TEXT,
+    answer TEXT,
+    source TEXT,
+    user_id TEXT
+);
+CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations (timestamp, id);
+CREATE INDEX IF NOT EXISTS conversations_user ON conversations (user_id, id);
+CREATE INDEX IF NOT EXISTS conversations_source ON conversations (source, id);
+CREATE TABLE IF NOT EXISTS fichiers_importes (nom TEXT PRIMARY KEY);
+"""
+_CHAMPS = ["conversation_id", "timestamp", "question", "answer", "source", "user_id"]
+
+
+class StoreConversations:
+    """Historique des conversations: SQLite indexé sur disque.
+
+    La base (mode WAL, partagée par les workers) est alimentée par lots
+    depuis le thread du journal; la consultation est paginée par curseur
+    (id décroissant), donc à mémoire constante quelle que soit la taille
+    de l'historique.
+    """
+
+    def __init__(self, chemin: Path):
+        self.chemin = Path(chemin)
+        with closing(self._connexion()) as connexion:
+            connexion.execute("PRAGMA journal_mode=WAL")
+            connexion.executescript(_SCHEMA)
+
+    def enregistrer_lot(self, elements: List[Dict]):
+        """Insère un lot d'échanges en une transaction (doublons ignorés)"""
+        lignes = [tuple(_valeur(element.get(champ)) for champ in _CHAMPS) for element in elements]
+        with closing(self._connexion()) as connexion, connexion:
+            connexion.executemany(
+                f"INSERT OR IGNORE INTO conversations ({', '.join(_CHAMPS)}) "
+                f"VALUES ({', '.join('?' * len(_CHAMPS))})",
+                lignes
+            )
+
+    def rechercher(self, limite: int = 10, curseur: Optional[int] = None, user_id: Optional[str] = None,
+                   debut: Optional[datetime] = None, fin: Optional[datetime] = None,
+                   source: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Page d'échanges du plus récent au plus ancien.
+
+        Retourne (échanges, curseur suivant); le curseur est None sur la
+        dernière page.
+        """
+        conditions, parametres = [], []
+        for condition, valeur in (("id < ?", curseur), ("user_id = ?", user_id), ("source = ?", source),
+                                  ("timestamp >= ?", debut), ("timestamp < ?", fin)):
+            if valeur is not None:
+                conditions.append(condition)
+                parametres.append(_valeur(valeur))
+        clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with closing(self._connexion()) as connexion:
+            connexion.row_factory = sqlite3.Row
+            lignes = connexion.execute(
+                f"SELECT id, {', '.join(_CHAMPS)} FROM conversations {clause} ORDER BY id DESC LIMIT ?",
+                (*parametres, limite + 1)
+            ).fetchall()
+        suivant = lignes[limite - 1]["id"] if len(lignes) > limite else None
+        return [dict(ligne) for ligne in lignes[:limite]], suivant
+
+    def importer_journaux(self, dossier: Path) -> int:
+        """Importe les journaux CSV (csv, csv.gz) des jours passés non encore importés"""
+        aujourd_hui = date.today().isoformat()
+        total = 0
+        with closing(self._connexion()) as connexion:
+            deja = {nom for (nom,) in connexion.execute("SELECT nom FROM fichiers_importes")}
+        for fichier in sorted(Path(dossier).glob("conversations_*.csv*")):
+            jour = fichier.name[len("conversations_"):][:10]
+            if fichier.name in deja or jour >= aujourd_hui:
+                continue
+            ouvrir = gzip.open if fichier.suffix == ".gz" else open
+            with ouvrir(fichier, "rt", encoding="utf-8", newline="") as f:
+                elements = [ligne for ligne in csv.DictReader(f, delimiter="|")
+                            if ligne.get("conversation_id") and ligne.get("timestamp")]
+            self.enregistrer_lot(elements)
+            with closing(self._connexion()) as connexion, connexion:
+                connexion.execute("INSERT OR IGNORE INTO fichiers_importes VALUES (?)", (fichier.name,))
+            total += len(elements)
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        with closing(self._connexion()) as connexion:
+            (stockees,) = connexion.execute("SELECT MAX(id) FROM conversations").fetchone()
+        return {"en_base": stockees or 0}
+
+    def _connexion(self) -> sqlite3.Connection:
+        # Une connexion par appel: sûr entre threads, et peu coûteux avec SQLite
+        connexion = sqlite3.connect(self.chemin, timeout=10)
+        connexion.execute("PRAGMA busy_timeout=10000")
+        return connexion
+
+
+def _valeur(valeur):
+    return valeur.isoformat() if isinstance(valeur, datetime) else valeur
+
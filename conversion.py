@@ -1,39 +1,70 @@
+"""Conversion de l'historique des conversations en paires questions/réponses.
+
+L'export est lu conversation par conversation (jsonstream), converti par
+lots dans un pool de processus, et écrit en NDJSON (une paire par ligne,
+.gz accepté) au fil de l'eau: la mémoire ne dépend pas de la taille de
+l'export, et le fichier produit peut être indexé directement par
+`python index.py --fichier <sortie>`.
+
+Usage: python conversion.py [entree] [sortie] [--processus N] [--taille-lot N]
+"""
+import argparse
+import gzip
 import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from jsonstream import lire_documents
+from matcher import ClassifieurFiscal
+
+# Tags attribués à une paire selon les termes présents dans la question ou la réponse.
+# Mots entiers; « * » couvre les formes fléchies (fiscale, fiscalité, taxer, déclarez...)
+TAGS_FISCAUX = {
+    "impôt": ["impôt", "taxe*", "fiscal*", "fiscaux"],
+    "TVA": ["tva", "taxe sur la valeur"],
+    "IR": ["impôt sur le revenu", "irpp"],
+    "IS": ["impôt sur les sociétés", "is"],
+    "déclaration": ["déclar*"],
+    "types": ["types", "catégories", "sortes"]
+}
+TAG_PAR_DEFAUT = "fiscalité"
+# Conversations envoyées à un processus à la fois
+TAILLE_LOT_CONVERSION = int(os.getenv("TAILLE_LOT_CONVERSION", "200"))
+PROCESSUS_CONVERSION = int(os.getenv("PROCESSUS_CONVERSION", str(os.cpu_count() or 1)))
+# Intervalle (s) entre deux affichages de la progression
+INTERVALLE_PROGRESSION = 5.0
+
+
+@lru_cache(maxsize=1)
+def classifieur_tags() -> ClassifieurFiscal:
+    """Reconnaissance des tags en un passage (construite une fois par processus)"""
+    return ClassifieurFiscal(TAGS_FISCAUX)
 
 def extract_tags(question, response):
     """Extract relevant tags based on content"""
-    tags = []
-    fiscal_keywords = {
-        "impôt": ["impôt", "taxe", "fiscal"],
-        "TVA": ["tva", "taxe sur la valeur"],
-        "IR": ["impôt sur le revenu", "irpp"],
-        "IS": ["impôt sur les sociétés", "is"],
-        "déclaration": ["déclaration", "déclarer"],
-        "types": ["types", "catégories", "sortes"]
-    }
-    
-    content = question.lower() + " " + response.lower()
-    for tag, keywords in fiscal_keywords.items():
-        if any(keyword in content for keyword in keywords):
-            tags.append(tag)
-    
-    return tags if tags else ["fiscalité"]
+    trouves = classifieur_tags().analyser(f"{question} {response}")
+    tags = [tag for tag, termes in trouves.items() if termes]
+    return tags if tags else [TAG_PAR_DEFAUT]
 
 def convert_conversation_to_qa(conversation):
     """Convert a single conversation to Q/A pairs"""
     qa_pairs = []
     messages = conversation.get("messages", [])
-    
+
     current_question = None
-    question_author = None
-    
+
     for message in messages:
         role = message.get("role", "")
         content = message.get("content", "")
-        
+
         if role == "user":
             current_question = content
-            question_author = "user"
         elif role == "assistant" and current_question:
             qa_pairs.append({
                 "question": current_question,
@@ -44,36 +75,104 @@ def convert_conversation_to_qa(conversation):
                 "source": "Historique des conversations"
             })
             current_question = None
-    
+
     return qa_pairs
 
-def convert_json_structure(input_file, output_file):
-    """Main conversion function"""
+def _convertir_lot(conversations: List) -> Tuple[str, int, int, int]:
+    """Convertit un lot de conversations en lignes NDJSON (dans un processus du pool).
+
+    Retourne (lignes, conversations lues, paires, éléments ignorés).
+    """
+    lignes, paires, ignorees = [], 0, 0
+    for conversation in conversations:
+        if not isinstance(conversation, dict):
+            ignorees += 1
+            continue
+        for paire in convert_conversation_to_qa(conversation):
+            lignes.append(json.dumps(paire, ensure_ascii=False))
+            paires += 1
+    return "".join(f"{ligne}\n" for ligne in lignes), len(conversations), paires, ignorees
+
+def _lots(elements: Iterable, taille: int) -> Iterator[List]:
+    iterateur = iter(elements)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+def _convertir_en_parallele(pool, lots: Iterable[List], en_vol_max: int) -> Iterator[Tuple[str, int, int, int]]:
+    """Résultats des lots dans l'ordre, avec au plus `en_vol_max` lots lus d'avance.
+
+    (Pool.imap consommerait tout l'export d'avance et le garderait en mémoire.)
+    """
+    en_vol = deque()
+    for lot in lots:
+        en_vol.append(pool.apply_async(_convertir_lot, (lot,)))
+        if len(en_vol) >= en_vol_max:
+            yield en_vol.popleft().get()
+    while en_vol:
+        yield en_vol.popleft().get()
+
+def convertir_en_flux(input_file, output_file, processus: int = PROCESSUS_CONVERSION,
+                      taille_lot: int = TAILLE_LOT_CONVERSION) -> Dict[str, float]:
+    """Convertit l'export `input_file` (tableau JSON ou NDJSON) en NDJSON `output_file`.
+
+    Les lots sont convertis en parallèle mais écrits dans l'ordre de
+    l'export. Le fichier n'apparaît sous son nom qu'une fois complet.
+    """
+    output_file = Path(output_file)
+    temporaire = output_file.with_name(f".{output_file.name}.tmp")
+    ouvrir = gzip.open if output_file.name.endswith(".gz") else open
+    stats = {"conversations": 0, "paires": 0, "ignorees": 0}
+    debut = time.monotonic()
+    prochain_affichage = debut + INTERVALLE_PROGRESSION
+    lots = _lots(lire_documents(input_file), taille_lot)
+
+    pool = multiprocessing.Pool(processus, initializer=classifieur_tags) if processus > 1 else None
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if not isinstance(data, list):
-            raise ValueError("Le fichier JSON doit contenir une liste de conversations")
-        
-        all_qa_pairs = []
-        
-        for conversation in data:
-            qa_pairs = convert_conversation_to_qa(conversation)
-            all_qa_pairs.extend(qa_pairs)
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_qa_pairs, f, ensure_ascii=False, indent=2)
-        
-        print(f"✅ Conversion réussie ! {len(all_qa_pairs)} questions/réponses générées.")
+        resultats = (_convertir_en_parallele(pool, lots, 2 * processus) if pool
+                     else map(_convertir_lot, lots))
+        with ouvrir(temporaire, "wt", encoding="utf-8") as f:
+            for lignes, conversations, paires, ignorees in resultats:
+                f.write(lignes)
+                stats["conversations"] += conversations - ignorees
+                stats["paires"] += paires
+                stats["ignorees"] += ignorees
+                if time.monotonic() >= prochain_affichage:
+                    duree = time.monotonic() - debut
+                    print(f"⏳ {stats['conversations']} conversations, {stats['paires']} paires "
+                          f"({stats['conversations'] / duree:.0f} conversations/s)")
+                    prochain_affichage += INTERVALLE_PROGRESSION
+        os.replace(temporaire, output_file)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if temporaire.exists():
+            temporaire.unlink()
+
+    stats["duree_s"] = round(time.monotonic() - debut, 2)
+    return stats
+
+def convert_json_structure(input_file, output_file, **options):
+    """Main conversion function (options: voir convertir_en_flux)"""
+    try:
+        stats = convertir_en_flux(input_file, output_file, **options)
+        debit = stats["conversations"] / stats["duree_s"] if stats["duree_s"] else 0
+        print(f"✅ Conversion réussie ! {stats['paires']} questions/réponses générées "
+              f"depuis {stats['conversations']} conversations en {stats['duree_s']}s "
+              f"({debit:.0f} conversations/s).")
+        if stats["ignorees"]:
+            print(f"⚠️ {stats['ignorees']} éléments ignorés (pas une conversation)")
         print(f"📁 Fichier sauvegardé : {output_file}")
-    
     except Exception as e:
         print(f"❌ Erreur lors de la conversion : {str(e)}")
 
 if __name__ == "__main__":
-    input_path = "/Users/thiarakante/Documents/projet_soutenance/test_elas/data/data.json"
-    output_path = "qa_format_optimise.json"
-    
+    parser = argparse.ArgumentParser(description="Convertit l'historique des conversations en NDJSON")
+    parser.add_argument("entree", nargs="?",
+                        default="/Users/thiarakante/Documents/projet_soutenance/test_elas/data/data.json")
+    parser.add_argument("sortie", nargs="?", default="qa_format_optimise.ndjson")
+    parser.add_argument("--processus", type=int, default=PROCESSUS_CONVERSION)
+    parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT_CONVERSION)
+    args = parser.parse_args()
+
     print("🔄 Conversion en cours...")
-    convert_json_structure(input_path, output_path)
\ No newline at end of file
+    convert_json_structure(args.entree, args.sortie, processus=args.processus, taille_lot=args.taille_lot)
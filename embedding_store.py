@@ -0,0 +1,182 @@
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from verrou import VerrouFichier
+
+EMBEDDINGS_CACHE_DIR = Path(os.getenv("EMBEDDINGS_CACHE_DIR", Path(__file__).parent / "embeddings_cache"))
+
+
+class StoreEmbeddings:
+    """Cache persistant d'embeddings, adressé par le contenu (modèle + texte).
+
+    Deux fichiers par modèle dans `dossier`:
+    - `<modele>.f32`: vecteurs bout à bout (float32), lus par memory-map;
+    - `<modele>.index`: une ligne « empreinte rang » par vecteur, en ajout seul.
+
+    Le vecteur est écrit avant sa ligne d'index: un arrêt brutal laisse au
+    pire un vecteur orphelin, retiré par `compacter`. Les ajouts se font
+    sous verrou fcntl, et les entrées ajoutées par d'autres processus sont
+    relues au premier défaut de cache.
+    """
+
+    def __init__(self, modele_id: str, dims: int, dossier: Path = EMBEDDINGS_CACHE_DIR):
+        self.modele_id = modele_id
+        self.dims = dims
+        self.dossier = Path(dossier)
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        nom = re.sub(r"[^\w.-]+", "_", modele_id)
+        self._chemin_vecteurs = self.dossier / f"{nom}.f32"
+        self._chemin_index = self.dossier / f"{nom}.index"
+        self._chemin_verrou = self.dossier / f"{nom}.lock"
+        self._octets_ligne = dims * 4
+        self._lock = threading.Lock()
+        self._rangs: Dict[str, int] = {}
+        self._position_index = 0
+        self._inode_index = None
+        self._vecteurs: Optional[np.memmap] = None
+        self.compteurs = {"hits": 0, "misses": 0}
+        with self._lock:
+            self._relire_index()
+
+    def cle(self, texte: str) -> str:
+        return hashlib.sha1(f"{self.modele_id}\0{texte}".encode("utf-8")).hexdigest()
+
+    def encoder(self, textes: Sequence[str], calculer: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Embeddings de `textes`; seuls les absents du cache sont calculés, en un appel à `calculer`"""
+        cles = [self.cle(texte) for texte in textes]
+        resultat = np.empty((len(textes), self.dims), dtype=np.float32)
+        with self._lock:
+            if self._compacte_ailleurs():
+                self._relire_index()
+            manquants = self._lire(cles, resultat)
+            if manquants:
+                self._relire_index()
+                manquants = self._lire([cles[i] for i in manquants], resultat, manquants)
+            self.compteurs["hits"] += len(textes) - len(manquants)
+            self.compteurs["misses"] += len(manquants)
+        if not manquants:
+            return resultat
+
+        # Un même texte absent n'est calculé qu'une fois
+        uniques = list(dict.fromkeys(textes[i] for i in manquants))
+        calcules = np.asarray(calculer(uniques), dtype=np.float32).reshape(len(uniques), self.dims)
+        par_texte = dict(zip(uniques, calcules))
+        for i in manquants:
+            resultat[i] = par_texte[textes[i]]
+        self._ajouter({self.cle(texte): vecteur for texte, vecteur in par_texte.items()})
+        return resultat
+
+    def compacter(self, max_entrees: Optional[int] = None) -> int:
+        """Réécrit les fichiers sans vecteurs orphelins ni doublons.
+
+        Si `max_entrees` est donné, seules les entrées les plus récemment
+        ajoutées sont gardées. Retourne le nombre d'octets libérés. Les
+        autres processus ne voient la nouvelle version qu'à leur prochain
+        défaut de cache: à lancer de préférence hors trafic.
+        """
+        with self._lock, self._verrou_fichiers():
+            self._relire_index()
+            avant = self._chemin_vecteurs.stat().st_size if self._chemin_vecteurs.exists() else 0
+            entrees = sorted(self._rangs.items(), key=lambda item: item[1])
+            if max_entrees is not None:
+                entrees = entrees[-max_entrees:] if max_entrees > 0 else []
+            vecteurs = self._carte()
+            temporaire_vecteurs = self._chemin_vecteurs.with_suffix(".f32.tmp")
+            temporaire_index = self._chemin_index.with_suffix(".index.tmp")
+            with open(temporaire_vecteurs, "wb") as fv, open(temporaire_index, "w", encoding="ascii") as fi:
+                for rang, (cle, ancien_rang) in enumerate(entrees):
+                    fv.write(np.ascontiguousarray(vecteurs[ancien_rang]).tobytes())
+                    fi.write(f"{cle} {rang}\n")
+            os.replace(temporaire_vecteurs, self._chemin_vecteurs)
+            os.replace(temporaire_index, self._chemin_index)
+            self._relire_index()
+            return avant - self._chemin_vecteurs.stat().st_size
+
+    def stats(self) -> Dict[str, float]:
+        total = self.compteurs["hits"] + self.compteurs["misses"]
+        return {
+            **self.compteurs,
+            "taux_hits": round(self.compteurs["hits"] / total, 3) if total else 0.0,
+            "entrees": len(self._rangs),
+            "octets": self._chemin_vecteurs.stat().st_size if self._chemin_vecteurs.exists() else 0,
+        }
+
+    def _lire(self, cles: List[str], resultat: np.ndarray, positions: Optional[List[int]] = None) -> List[int]:
+        """Copie les vecteurs connus dans `resultat`; retourne les positions manquantes"""
+        positions = positions if positions is not None else list(range(len(cles)))
+        manquants = []
+        vecteurs = None
+        for position, cle in zip(positions, cles):
+            rang = self._rangs.get(cle)
+            if rang is None:
+                manquants.append(position)
+                continue
+            if vecteurs is None or rang >= len(vecteurs):
+                vecteurs = self._carte()
+            resultat[position] = vecteurs[rang]
+        return manquants
+
+    def _ajouter(self, nouveaux: Dict[str, np.ndarray]):
+        with self._lock, self._verrou_fichiers():
+            self._relire_index()
+            nouveaux = {cle: v for cle, v in nouveaux.items() if cle not in self._rangs}
+            if not nouveaux:
+                return
+            taille = self._chemin_vecteurs.stat().st_size if self._chemin_vecteurs.exists() else 0
+            premier = taille // self._octets_ligne
+            with open(self._chemin_vecteurs, "ab") as f:
+                # Réaligne après un vecteur tronqué (arrêt pendant une écriture)
+                f.truncate(premier * self._octets_ligne)
+                f.write(np.stack(list(nouveaux.values())).astype(np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._chemin_index, "a", encoding="ascii") as f:
+                f.write("".join(f"{cle} {premier + i}\n" for i, cle in enumerate(nouveaux)))
+            self._relire_index()
+
+    def _compacte_ailleurs(self) -> bool:
+        """Vrai si l'index a été réécrit (compaction) depuis sa dernière lecture"""
+        try:
+            etat = self._chemin_index.stat()
+        except FileNotFoundError:
+            return False
+        return etat.st_ino != self._inode_index or etat.st_size < self._position_index
+
+    def _relire_index(self):
+        """Charge les lignes d'index ajoutées depuis la dernière lecture"""
+        if not self._chemin_index.exists():
+            return
+        if self._compacte_ailleurs():
+            etat = self._chemin_index.stat()
+            # Fichiers réécrits par une compaction (éventuellement d'un autre processus)
+            self._rangs, self._position_index, self._vecteurs = {}, 0, None
+            self._inode_index = etat.st_ino
+        with open(self._chemin_index, "r", encoding="ascii") as f:
+            f.seek(self._position_index)
+            for ligne in f:
+                if not ligne.endswith("\n"):
+                    break  # ligne en cours d'écriture par un autre processus
+                cle, rang = ligne.split()
+                self._rangs[cle] = int(rang)
+                self._position_index += len(ligne)
+
+    def _carte(self) -> np.ndarray:
+        """Memory-map des vecteurs, recréé quand le fichier a grandi"""
+        lignes = (self._chemin_vecteurs.stat().st_size // self._octets_ligne
+                  if self._chemin_vecteurs.exists() else 0)
+        if self._vecteurs is None or len(self._vecteurs) != lignes:
+            if lignes == 0:
+                return np.empty((0, self.dims), dtype=np.float32)
+            self._vecteurs = np.memmap(self._chemin_vecteurs, dtype=np.float32, mode="r",
+                                       shape=(lignes, self.dims))
+        return self._vecteurs
+
+    def _verrou_fichiers(self):
+        return VerrouFichier(self._chemin_verrou)
+
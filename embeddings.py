@@ -0,0 +1,177 @@
+"""Backends du modèle d'embedding des questions.
+
+- "torch": SentenceTransformer PyTorch fp32 (référence).
+- "onnx": export ONNX quantifié int8 (quantification dynamique), exécuté
+  par ONNX Runtime sur CPU. Nécessite `optimum[onnxruntime]`; l'export se
+  fait une fois avec `python embeddings.py --exporter`.
+
+Les deux backends produisent des vecteurs de EMBEDDING_DIMS dimensions,
+interchangeables avec ceux de l'index (voir verifier_parite).
+"""
+import argparse
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from embedding_store import StoreEmbeddings
+from retrieval import EMBEDDING_DIMS, EMBEDDING_MODEL, SNAPSHOT_DIR
+from text_utils import nettoyer_question
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_DIR = Path(os.getenv("EMBEDDING_ONNX_DIR", Path(__file__).parent / "models" / "camembert-onnx"))
+# Jeu d'instructions ciblé par la quantification ("avx2" couvre les instances CPU courantes)
+ONNX_QUANTIFICATION = os.getenv("EMBEDDING_ONNX_QUANTIFICATION", "avx2")
+# Cache persistant des embeddings (voir embedding_store.py), partagé par l'API et l'indexation
+EMBEDDINGS_CACHE = os.getenv("EMBEDDINGS_CACHE", "1") == "1"
+# Similarité cosinus minimale entre les vecteurs torch et onnx d'une même phrase
+SEUIL_PARITE = 0.99
+
+
+def _fichier_onnx(config: str = ONNX_QUANTIFICATION) -> str:
+    return f"onnx/model_qint8_{config}.onnx"
+
+
+class RepliBackend(Exception):
+    """Le modèle chargé n'utilise pas le backend sous lequel le cache range ses vecteurs"""
+
+    def __init__(self, backend: str):
+        super().__init__(f"Modèle d'embedding chargé avec le backend {backend}")
+        self.backend = backend
+
+
+def _identifiant_store(backend: str) -> str:
+    return f"{EMBEDDING_MODEL}@{backend}"
+
+
+def ouvrir_store(backend: str = EMBEDDING_BACKEND) -> Optional[StoreEmbeddings]:
+    """Cache persistant des vecteurs du modèle et du backend donnés (None si désactivé)"""
+    if not EMBEDDINGS_CACHE:
+        return None
+    try:
+        return StoreEmbeddings(_identifiant_store(backend), EMBEDDING_DIMS)
+    except Exception as e:
+        print(f"⚠️ Cache d'embeddings indisponible: {e}")
+        return None
+
+
+def backend_embedder(modele) -> str:
+    """Backend réellement utilisé par un modèle chargé (torch après un repli), tel qu'il le déclare"""
+    return getattr(modele, "backend", "torch")
+
+
+def verifier_backend(store: StoreEmbeddings, modele):
+    """Lève RepliBackend si `modele` ne produit pas les vecteurs du backend de `store`.
+
+    Le store est ouvert avant le chargement du modèle (les hits n'en ont pas
+    besoin): c'est au premier défaut qu'on apprend si le backend onnx s'est
+    replié sur torch, et ses vecteurs ne doivent pas être rangés sous "onnx".
+    """
+    backend = backend_embedder(modele)
+    if store.modele_id != _identifiant_store(backend):
+        raise RepliBackend(backend)
+    return modele
+
+
+def charger_embedder(backend: str = EMBEDDING_BACKEND, repli: bool = True):
+    """Charge le modèle d'embedding avec le backend demandé.
+
+    Le backend "onnx" se replie sur torch (avec un avertissement) si
+    l'export quantifié ou ONNX Runtime sont absents, sauf si `repli` est faux.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    modele = None
+    if backend == "onnx":
+        try:
+            modele = SentenceTransformer(
+                str(ONNX_DIR),
+                backend="onnx",
+                model_kwargs={"file_name": _fichier_onnx(), "provider": "CPUExecutionProvider"}
+            )
+        except Exception as e:
+            if not repli:
+                raise
+            print(f"⚠️ Backend ONNX indisponible ({e}): repli sur torch. "
+                  "Exporter le modèle avec `python embeddings.py --exporter`")
+    elif backend != "torch":
+        raise ValueError(f"Backend d'embedding inconnu: {backend}")
+
+    if modele is None:
+        modele = SentenceTransformer(EMBEDDING_MODEL)
+
+    dimension = modele.get_sentence_embedding_dimension()
+    if dimension != EMBEDDING_DIMS:
+        raise ValueError(f"Dimension d'embedding {dimension} différente de l'index ({EMBEDDING_DIMS})")
+    return modele
+
+
+def exporter_onnx(dossier: Path = ONNX_DIR, config: str = ONNX_QUANTIFICATION) -> Path:
+    """Exporte le modèle en ONNX puis en version quantifiée int8 dans `dossier`"""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    dossier = Path(dossier)
+    modele = SentenceTransformer(EMBEDDING_MODEL, backend="onnx")
+    modele.save(str(dossier))
+    export_dynamic_quantized_onnx_model(modele, config, str(dossier))
+    print(f"💾 Modèle ONNX quantifié exporté: {dossier / _fichier_onnx(config)}")
+    return dossier
+
+
+def questions_indexees(dossier: Path = SNAPSHOT_DIR, nom: str = "fiscality") -> List[str]:
+    """Questions de la base indexée, lues dans le snapshot exporté par index.py"""
+    chemin = Path(dossier) / f"{nom}.json.gz"
+    if not chemin.exists():
+        raise FileNotFoundError(f"Snapshot absent ({chemin}): lancer `python index.py --snapshot-only`")
+    with gzip.open(chemin, "rt", encoding="utf-8") as f:
+        return [doc["question"] for doc in json.load(f) if doc.get("question")]
+
+
+def verifier_parite(reference, candidat, phrases: List[str], batch_size: int = 32) -> Dict[str, float]:
+    """Compare deux backends sur les mêmes phrases.
+
+    - cosinus_min / cosinus_moyen: similarité entre les deux vecteurs d'une même phrase;
+    - ecart_max_similarites: plus grand écart entre les matrices de similarités des deux backends;
+    - accord_top1: part des phrases dont le plus proche voisin est le même.
+    """
+    import numpy as np
+
+    a = reference.encode(phrases, batch_size=batch_size, normalize_embeddings=True)
+    b = candidat.encode(phrases, batch_size=batch_size, normalize_embeddings=True)
+    cosinus = np.sum(a * b, axis=1)
+    sim_a, sim_b = a @ a.T, b @ b.T
+    np.fill_diagonal(sim_a, -1)
+    np.fill_diagonal(sim_b, -1)
+    return {
+        "cosinus_min": float(cosinus.min()),
+        "cosinus_moyen": float(cosinus.mean()),
+        "ecart_max_similarites": float(np.abs(sim_a - sim_b).max()),
+        "accord_top1": float(np.mean(sim_a.argmax(axis=1) == sim_b.argmax(axis=1))),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export et contrôle du backend ONNX")
+    parser.add_argument("--exporter", action="store_true", help="Exporte le modèle ONNX quantifié")
+    parser.add_argument("--parite", action="store_true", help="Compare les backends torch et onnx")
+    parser.add_argument("--compacter", action="store_true", help="Compacte le cache persistant des embeddings")
+    parser.add_argument("--max-entrees", type=int, default=None,
+                        help="Avec --compacter: ne garde que les N entrées les plus récentes")
+    args = parser.parse_args()
+
+    if args.exporter:
+        exporter_onnx()
+    if args.parite:
+        questions = [nettoyer_question(q) for q in questions_indexees()]
+        resultat = verifier_parite(charger_embedder("torch"), charger_embedder("onnx", repli=False), questions)
+        print(resultat)
+        if resultat["cosinus_min"] < SEUIL_PARITE:
+            raise SystemExit(f"❌ Parité insuffisante (cosinus min < {SEUIL_PARITE})")
+        print("✅ Parité torch/onnx vérifiée")
+    if args.compacter:
+        store = ouvrir_store()
+        if store is None:
+            raise SystemExit("❌ Cache d'embeddings désactivé (EMBEDDINGS_CACHE=0)")
+        liberes = store.compacter(args.max_entrees)
+        print(f"✅ Cache compacté: {store.stats()['entrees']} entrées, {liberes / 1024 / 1024:.1f} Mo libérés")
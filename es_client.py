@@ -0,0 +1,122 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import Any, Awaitable, Optional
+
+from dotenv import load_dotenv
+from elasticsearch import AsyncElasticsearch
+
+load_dotenv()
+
+ES_URL = os.getenv(
+    "ELASTICSEARCH_URL",
+    "https://my-elasticsearch-project-beb3d2.es.us-east-1.aws.elastic.cloud:443"
+)
+# Connexions HTTP gardées ouvertes (keep-alive) vers le cluster, partagées par toutes les requêtes
+ES_MAX_CONNEXIONS = int(os.getenv("ES_MAX_CONNEXIONS", "20"))
+ES_TIMEOUT = float(os.getenv("ES_TIMEOUT", "30"))
+
+# Client unique du processus et boucle asyncio à laquelle il est lié
+_lock = threading.Lock()
+_client: Optional[AsyncElasticsearch] = None
+_boucle: Optional[asyncio.AbstractEventLoop] = None
+_initialise = False
+
+
+def _creer_client() -> AsyncElasticsearch:
+    return AsyncElasticsearch(
+        ES_URL,
+        api_key=os.getenv("ELASTIC_API_KEY"),
+        verify_certs=True,
+        ssl_show_warn=True,
+        request_timeout=ES_TIMEOUT,
+        max_retries=2,
+        retry_on_timeout=True,
+        connections_per_node=ES_MAX_CONNEXIONS,
+        http_compress=True
+    )
+
+
+async def ouvrir() -> Optional[AsyncElasticsearch]:
+    """Crée le client partagé sur la boucle courante et vérifie la connexion.
+
+    Un seul essai par processus: les appels suivants renvoient le même
+    client, ou None si Elasticsearch était injoignable.
+    """
+    global _client, _boucle, _initialise
+    if _initialise:
+        return _client
+    _initialise = True
+
+    client = _creer_client()
+    try:
+        if not await client.ping():
+            raise ConnectionError("Échec de la connexion Elasticsearch")
+    except Exception as e:
+        error_msg = f"❌ Erreur d'initialisation Elasticsearch: {str(e)}"
+
+        # Suggestions spécifiques selon l'erreur
+        if "SSL" in str(e):
+            error_msg += "\n💡 Conseil: Vérifiez votre certificat SSL ou utilisez verify_certs=False en développement"
+        elif "authentication" in str(e):
+            error_msg += "\n💡 Conseil: Vérifiez votre clé API dans .env"
+
+        print(error_msg)
+        await client.close()
+        return None
+
+    _client, _boucle = client, asyncio.get_running_loop()
+    print(f"✅ Connexion Elasticsearch établie ({ES_MAX_CONNEXIONS} connexions max)")
+    return _client
+
+
+def obtenir_client() -> Optional[AsyncElasticsearch]:
+    """Client partagé pour du code synchrone.
+
+    Dans l'API le client a déjà été ouvert sur la boucle d'uvicorn. Hors de
+    l'API (CLI, scripts), une boucle dédiée est démarrée dans un thread.
+    """
+    with _lock:
+        if not _initialise:
+            boucle = asyncio.new_event_loop()
+            threading.Thread(target=boucle.run_forever, name="elasticsearch", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(ouvrir(), boucle).result()
+            if _client is None:
+                boucle.call_soon_threadsafe(boucle.stop)
+    return _client
+
+
+def executer(appel: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Exécute un appel du client partagé depuis un thread de travail et attend son résultat.
+
+    L'appel s'exécute sur la boucle du client: les requêtes de tous les
+    threads se partagent les mêmes connexions.
+    """
+    if _boucle is None:
+        appel.close()
+        raise ConnectionError("Client Elasticsearch non initialisé")
+    if _dans_boucle(_boucle):
+        appel.close()
+        raise RuntimeError("Appel bloquant depuis la boucle du client: utiliser await")
+    futur = asyncio.run_coroutine_threadsafe(appel, _boucle)
+    try:
+        return futur.result(timeout)
+    except concurrent.futures.TimeoutError:
+        futur.cancel()
+        raise
+
+
+async def fermer():
+    """Ferme les connexions du client partagé (arrêt de l'API)"""
+    global _client, _boucle, _initialise
+    client, _client, _boucle, _initialise = _client, None, None, False
+    if client is not None:
+        await client.close()
+
+
+def _dans_boucle(boucle: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is boucle
+    except RuntimeError:
+        return False
@@ -1,7 +1,16 @@
 import os
+import argparse
 from elasticsearch import Elasticsearch, helpers, NotFoundError
 from dotenv import load_dotenv
+import hashlib
 import json
+import time
+from collections import deque
+
+from embeddings import RepliBackend, charger_embedder, ouvrir_store, verifier_backend
+from jsonstream import lire_documents
+from retrieval import EMBEDDING_DIMS, sauvegarder_snapshot
+from text_utils import nettoyer_question, normaliser_question
 
 # Chargement des variables d'environnement
 load_dotenv()
@@ -53,7 +62,14 @@ FISCALITY_MAPPING = {
                     "keyword": {"type": "keyword"}
                 }
             },
+            "question_vector": {
+                "type": "dense_vector",
+                "dims": EMBEDDING_DIMS,
+                "index": True,
+                "similarity": "cosine"
+            },
             "reponse": {"type": "text", "analyzer": "french_analyzer"},
+            "content_hash": {"type": "keyword", "index": False},
             "date_creation": {"type": "date"},
             "tags": {"type": "keyword"},
             "language": {"type": "keyword"},
@@ -68,27 +84,102 @@ FISCALITY_MAPPING = {
     }
 }
 
+# Alias interrogé par l'assistant, et préfixe des index physiques versionnés
+ALIAS = "fiscality"
+PREFIXE_VERSION = f"{ALIAS}_v"
+# Réglages pendant le chargement (pas de réplique ni de refresh), puis en production
+REGLAGES_CHARGEMENT = {"number_of_replicas": 0, "refresh_interval": "-1"}
+REGLAGES_PRODUCTION = {
+    "number_of_replicas": FISCALITY_MAPPING["settings"]["number_of_replicas"],
+    "refresh_interval": None  # valeur par défaut d'Elasticsearch
+}
+
+def versions_existantes():
+    """Numéros des index fiscality_v{n} existants, du plus ancien au plus récent"""
+    index = es.indices.get(index=f"{PREFIXE_VERSION}*", expand_wildcards="open,closed")
+    return sorted(int(nom[len(PREFIXE_VERSION):]) for nom in index
+                  if nom[len(PREFIXE_VERSION):].isdigit())
+
+def index_actif():
+    """Index physique derrière l'alias (None si l'alias n'existe pas encore)"""
+    if not es.indices.exists_alias(name=ALIAS):
+        return None
+    return next(iter(es.indices.get_alias(name=ALIAS)))
+
 def init_index():
-    """Initialise l'index avec gestion des erreurs"""
+    """Crée la version suivante de l'index, réglée pour un chargement rapide.
+
+    L'index en service n'est pas touché: les requêtes continuent d'être
+    servies par l'alias pendant toute la reconstruction.
+    """
     try:
-        # Suppression si l'index existe déjà
-        if es.indices.exists(index="fiscality"):
-            es.indices.delete(index="fiscality")
-            print("♻️ Ancien index supprimé")
-        
-        # Création du nouvel index
-        es.indices.create(
-            index="fiscality",
-            body=FISCALITY_MAPPING,
-            ignore=400  # Ignore l'erreur si l'index existe déjà
-        )
-        print("✅ Index 'fiscality' créé avec succès")
-        return True
+        versions = versions_existantes()
+        nom = f"{PREFIXE_VERSION}{(versions[-1] if versions else 0) + 1}"
+        corps = {
+            **FISCALITY_MAPPING,
+            "settings": {**FISCALITY_MAPPING["settings"], **REGLAGES_CHARGEMENT}
+        }
+        es.indices.create(index=nom, body=corps)
+        print(f"✅ Index '{nom}' créé (chargement sans réplique ni refresh)")
+        return nom
     except Exception as e:
         print(f"❌ Erreur lors de l'initialisation de l'index: {str(e)}")
+        return None
+
+def finaliser_index(index, attendus):
+    """Rétablit réplicas et refresh, puis vérifie l'index avant sa mise en service"""
+    try:
+        es.indices.put_settings(index=index, settings={"index": REGLAGES_PRODUCTION})
+        es.indices.refresh(index=index)
+        # "yellow": les répliques peuvent rester non assignées sur un cluster à un nœud
+        es.cluster.health(index=index, wait_for_status="yellow", timeout="60s")
+        compte = es.count(index=index)["count"]
+        if compte != attendus:
+            raise ValueError(f"{compte} documents dans l'index, {attendus} attendus")
+        print(f"✅ Index '{index}' prêt ({compte} documents)")
+        return True
+    except Exception as e:
+        print(f"❌ Index '{index}' non finalisé: {str(e)}")
         return False
 
-def prepare_document(doc):
+def basculer_alias(index):
+    """Fait pointer l'alias sur `index` en une seule opération atomique"""
+    ancien = index_actif()
+    actions = []
+    if ancien is not None:
+        actions.append({"remove": {"index": ancien, "alias": ALIAS}})
+    elif es.indices.exists(index=ALIAS):
+        # Migration: l'ancien index physique 'fiscality' est remplacé par l'alias
+        actions.append({"remove_index": {"index": ALIAS}})
+    actions.append({"add": {"index": index, "alias": ALIAS}})
+    es.indices.update_aliases(actions=actions)
+    print(f"🔀 Alias '{ALIAS}': {ancien or '-'} → {index}")
+    return ancien
+
+def rollback():
+    """Rebascule l'alias sur la version précédant l'index actif"""
+    actif = index_actif()
+    if actif is None:
+        raise RuntimeError(f"Aucun alias '{ALIAS}' à restaurer")
+    numero = int(actif[len(PREFIXE_VERSION):])
+    precedentes = [v for v in versions_existantes() if v < numero]
+    if not precedentes:
+        raise RuntimeError(f"Aucune version antérieure à '{actif}'")
+    precedent = f"{PREFIXE_VERSION}{precedentes[-1]}"
+    es.indices.open(index=precedent)
+    basculer_alias(precedent)
+    return precedent
+
+def nettoyer_versions(garder=2):
+    """Supprime les anciennes versions au-delà des `garder` plus récentes (jamais l'index actif)"""
+    actif = index_actif()
+    for version in versions_existantes()[:-garder]:
+        nom = f"{PREFIXE_VERSION}{version}"
+        if nom != actif:
+            es.indices.delete(index=nom)
+            print(f"🗑️ Ancienne version supprimée: {nom}")
+
+def prepare_document(doc, index=ALIAS):
     """Transforme la structure JSON en document Elasticsearch"""
     doc_source = {
         "type": doc.get("type", "qa_technique"),
@@ -106,30 +197,41 @@ def prepare_document(doc):
     
     # Nettoyage des champs vides
     return {k: v for k, v in {
-        "_index": "fiscality",
+        "_index": index,
         "_source": doc_source
     }.items() if v is not None}
-def validate_document(doc):
+def identifiant_document(question):
+    """_id stable d'une Q/R: empreinte de la question normalisée (casse, accents, ponctuation finale)"""
+    return hashlib.sha1(normaliser_question(question).encode("utf-8")).hexdigest()
+
+def empreinte_contenu(source):
+    """Empreinte du contenu indexé (hors embedding), pour détecter les documents modifiés"""
+    return hashlib.sha1(json.dumps(source, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def validate_document(doc, index=ALIAS):
     """Validation robuste des documents"""
     if not isinstance(doc, dict):
         raise ValueError("Le document doit être un dictionnaire")
     
     # Format Q/R direct
     if "question" in doc and "reponse" in doc:
-        return {
-            "_index": "fiscality",
-            "_source": {
-                "question": str(doc["question"]),
-                "reponse": str(doc["reponse"]),
-                "tags": doc.get("tags", []),
-                # "date_creation": doc.get("date_creation", datetime.now().isoformat()),
-                "metadata": {
-                    "certifie_par": doc.get("certifie_par", "DGI Sénégal"),
-                    "reference_legale": doc.get("references", []),
-                    "source": doc.get("source", "base_interne")
-                }
+        source = {
+            "question": str(doc["question"]),
+            "reponse": str(doc["reponse"]),
+            "tags": doc.get("tags", []),
+            # "date_creation": doc.get("date_creation", datetime.now().isoformat()),
+            "metadata": {
+                "certifie_par": doc.get("certifie_par", "DGI Sénégal"),
+                "reference_legale": doc.get("references", []),
+                "source": doc.get("source", "base_interne")
             }
         }
+        source["content_hash"] = empreinte_contenu(source)
+        return {
+            "_index": index,
+            "_id": identifiant_document(source["question"]),
+            "_source": source
+        }
     
     # Format conversationnel
     elif "messages" in doc:
@@ -138,55 +240,307 @@ def validate_document(doc):
     
     raise ValueError(f"Format de document non reconnu: {json.dumps(doc, indent=2)}")
 
-def index_documents():
-    """Indexation avec validation améliorée"""
-    data_file = "/Users/thiarakante/Documents/project copie/data/qa_format_optimise.json"
-    
+# Fichier source de la base de connaissances (tableau JSON ou NDJSON, éventuellement .gz)
+DATA_FILE = os.getenv("QA_DATA_FILE", "/Users/thiarakante/Documents/project copie/data/qa_format_optimise.json")
+# Réglages par défaut de l'ingestion
+TAILLE_CHUNK = 500
+MAX_CHUNK_MO = 10
+THREADS_BULK = 4
+MAX_RETRIES = 5
+TAILLE_LOT_EMBEDDINGS = 256
+# Documents en échec détaillés à l'écran (tous sont écrits dans le rapport)
+ECHECS_AFFICHES = 10
+# Documents en échec au-delà desquels une reconstruction n'est pas mise en service
+ECHECS_TOLERES = int(os.getenv("ECHECS_TOLERES", "0"))
+
+class Vectoriseur:
+    """Embeddings des questions (même modèle que l'assistant), via le cache persistant.
+
+    Seules les questions absentes du cache sont encodées, et le modèle
+    n'est chargé qu'au premier défaut: une réindexation sans nouvelle
+    question ne charge pas le modèle.
+    """
+
+    def __init__(self, model=None, batch_size=64, show_progress_bar=True):
+        self.model = model
+        self.batch_size = batch_size
+        self.show_progress_bar = show_progress_bar
+        self.store = ouvrir_store()
+
+    def encoder(self, questions):
+        store = self.store
+        if store is None:
+            return self._calculer(questions)
+        try:
+            return store.encoder(questions, lambda manquantes: self._calculer(manquantes, store))
+        except RepliBackend as e:
+            # Vecteurs rangés sous le backend réellement chargé (repli onnx → torch)
+            print(f"⚠️ {e}: cache d'embeddings {e.backend} utilisé")
+            self.store = ouvrir_store(e.backend)
+            return self.encoder(questions)
+
+    def _calculer(self, questions, store=None):
+        self.model = self.model or charger_embedder()
+        if store is not None:
+            verifier_backend(store, self.model)
+        return self.model.encode(questions, batch_size=self.batch_size, normalize_embeddings=True,
+                                 show_progress_bar=self.show_progress_bar)
+
+    def bilan(self) -> str:
+        if self.store is None:
+            return "cache d'embeddings désactivé"
+        stats = self.store.stats()
+        return (f"cache d'embeddings: {stats['hits']} hits, {stats['misses']} calculés "
+                f"(taux {stats['taux_hits']:.0%}, {stats['entrees']} entrées)")
+
+def ajouter_embeddings(actions, batch_size=64, model=None, show_progress_bar=True, vectoriseur=None):
+    """Ajoute l'embedding des questions aux actions, en un seul passage par lots"""
+    vectoriseur = vectoriseur or Vectoriseur(model, batch_size, show_progress_bar)
+    questions = [nettoyer_question(a["_source"]["question"]) for a in actions]
+    vecteurs = vectoriseur.encoder(questions)
+    for action, vecteur in zip(actions, vecteurs):
+        action["_source"]["question_vector"] = vecteur.tolist()
+    return actions
+
+def actions_en_flux(data_file, index, stats, taille_lot=TAILLE_LOT_EMBEDDINGS, garder=None):
+    """Documents validés et vectorisés au fil de la lecture, par lots de `taille_lot`.
+
+    `garder(action)` peut écarter un document avant le calcul de son embedding.
+    """
+    vectoriseur = Vectoriseur(show_progress_bar=False)
+    lot = []
+    for position, doc in enumerate(lire_documents(data_file)):
+        try:
+            action = validate_document(doc, index)
+        except ValueError as e:
+            print(f"⚠️ Document {position} ignoré: {str(e)[:200]}")
+            stats["ignores"] += 1
+            continue
+        if garder is not None and not garder(action):
+            stats["inchanges"] += 1
+            continue
+        lot.append(action)
+        if len(lot) >= taille_lot:
+            yield from ajouter_embeddings(lot, vectoriseur=vectoriseur)
+            lot = []
+    if lot:
+        yield from ajouter_embeddings(lot, vectoriseur=vectoriseur)
+    print(f"🧮 {vectoriseur.bilan()}")
+
+def _statut(resultat):
+    return next(iter(resultat.values())).get("status")
+
+def _envoyer(actions, threads, chunk_size, max_chunk_bytes):
+    """Envoie les actions en bulk; produit (succès, action, résultat) dans l'ordre d'envoi.
+
+    Un thread: streaming_bulk; plusieurs: parallel_bulk (résultats ordonnés,
+    un chunk par thread). Aucun nouvel essai ici: voir envoyer_avec_reprises.
+    """
+    envoyees = deque()
+
+    def suivre(flux):
+        for action in flux:
+            envoyees.append(action)
+            yield action
+
+    options = dict(chunk_size=chunk_size, max_chunk_bytes=max_chunk_bytes,
+                   raise_on_error=False, raise_on_exception=False)
+    if threads <= 1:
+        resultats = helpers.streaming_bulk(es, suivre(actions), max_retries=0, **options)
+    else:
+        resultats = helpers.parallel_bulk(es, suivre(actions), thread_count=threads,
+                                          queue_size=threads, **options)
+    for succes, resultat in resultats:
+        yield succes, envoyees.popleft(), resultat
+
+def envoyer_avec_reprises(actions, threads=THREADS_BULK, chunk_size=TAILLE_CHUNK,
+                          max_chunk_bytes=MAX_CHUNK_MO * 1024 * 1024, max_retries=MAX_RETRIES):
+    """_envoyer, puis nouvel envoi des documents rejetés par saturation (429) avec backoff exponentiel"""
+    rejetees = []
+    for tentative in range(max_retries + 1):
+        if tentative:
+            if not rejetees:
+                return
+            attente = min(2 ** tentative, 60)
+            print(f"🔁 {len(rejetees)} documents rejetés (429): nouvel essai {tentative}/{max_retries} dans {attente}s")
+            time.sleep(attente)
+            actions, rejetees = rejetees, []
+        for succes, action, resultat in _envoyer(actions, threads, chunk_size, max_chunk_bytes):
+            if not succes and _statut(resultat) == 429 and tentative < max_retries:
+                rejetees.append(action)
+                continue
+            yield succes, action, resultat
+
+def index_documents(index=ALIAS, data_file=DATA_FILE, chunk_size=TAILLE_CHUNK, max_chunk_mo=MAX_CHUNK_MO,
+                    threads=THREADS_BULK, max_retries=MAX_RETRIES, rapport_echecs="echecs_indexation.ndjson",
+                    garder=None, echecs_toleres=None):
+    """Indexation en flux: lecture incrémentale, embeddings par lots, envoi bulk parallèle.
+
+    Retourne le nombre de documents distincts indexés (None en cas
+    d'échec, ou si plus de `echecs_toleres` documents ont été rejetés).
+    Les documents en échec sont écrits dans `rapport_echecs` (NDJSON).
+    `garder`: voir actions_en_flux.
+    """
+    stats = {"indexes": 0, "echecs": 0, "ignores": 0, "inchanges": 0}
+    ids_indexes = set()
+    debut = time.perf_counter()
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        if not isinstance(data, list):
-            raise ValueError("Le fichier doit contenir une liste de documents")
-        
-        actions = []
-        error_count = 0
-        
-        for doc in data:
-            try:
-                actions.append(validate_document(doc))
-            except ValueError as e:
-                print(f"⚠️ Document ignoré: {str(e)}")
-                error_count += 1
-            except Exception as e:
-                print(f"⚠️ Erreur inattendue: {str(e)}")
-                error_count += 1
-        
-        if not actions:
-            raise ValueError("Aucun document valide à indexer")
-        
-        success, _ = helpers.bulk(es, actions)
-        es.indices.refresh(index="fiscality")
-        
+        with open(rapport_echecs, "w", encoding="utf-8") as rapport:
+            resultats = envoyer_avec_reprises(actions_en_flux(data_file, index, stats, garder=garder), threads,
+                                              chunk_size, int(max_chunk_mo * 1024 * 1024), max_retries)
+            for succes, action, resultat in resultats:
+                if succes:
+                    stats["indexes"] += 1
+                    ids_indexes.add(action["_id"])
+                else:
+                    stats["echecs"] += 1
+                    detail = next(iter(resultat.values()))
+                    question = action["_source"].get("question")
+                    rapport.write(json.dumps({"question": question, "status": detail.get("status"),
+                                              "erreur": detail.get("error")}, ensure_ascii=False) + "\n")
+                    if stats["echecs"] <= ECHECS_AFFICHES:
+                        print(f"⚠️ Échec ({detail.get('status')}): {str(question)[:80]} → {detail.get('error')}")
+                total = stats["indexes"] + stats["echecs"]
+                if total % 5000 == 0:
+                    print(f"… {total} documents envoyés ({total / (time.perf_counter() - debut):.0f} docs/s)")
+
+        duree = time.perf_counter() - debut
         print(f"\n📊 Résultats:")
-        print(f"- Documents indexés: {success}")
-        print(f"- Erreurs: {error_count}")
+        print(f"- Documents indexés: {stats['indexes']}")
+        print(f"- Échecs: {stats['echecs']}" + (f" (détail: {rapport_echecs})" if stats["echecs"] else ""))
+        print(f"- Documents ignorés (invalides): {stats['ignores']}")
+        if garder is not None:
+            print(f"- Documents inchangés: {stats['inchanges']}")
+        print(f"- Débit: {stats['indexes'] / duree:.0f} docs/s ({duree:.1f}s)")
+        if echecs_toleres is not None and stats["echecs"] > echecs_toleres:
+            print(f"❌ {stats['echecs']} documents en échec (au plus {echecs_toleres} tolérés)")
+            return None
+        return len(ids_indexes)
         
     except Exception as e:
         print(f"❌ Erreur majeure: {str(e)}")
+        return None
+
+def empreintes_indexees(index=ALIAS):
+    """{_id: content_hash} des documents de l'index (sans charger les réponses ni les vecteurs)"""
+    return {
+        hit["_id"]: hit["_source"].get("content_hash")
+        for hit in helpers.scan(es, index=index, query={"query": {"match_all": {}}},
+                                _source=["content_hash"])
+    }
+
+def synchroniser(index=ALIAS, data_file=DATA_FILE, chunk_size=TAILLE_CHUNK, max_chunk_mo=MAX_CHUNK_MO,
+                 threads=THREADS_BULK, max_retries=MAX_RETRIES):
+    """Synchronisation incrémentale de l'index en service avec le fichier source.
+
+    Seuls les documents nouveaux ou modifiés (empreinte différente) sont
+    vectorisés et réindexés sous leur _id stable; ceux qui ont disparu du
+    fichier sont supprimés; les autres ne sont pas touchés.
+    """
+    existants = empreintes_indexees(index)
+    vus = set()
+
+    def garder(action):
+        vus.add(action["_id"])
+        return existants.get(action["_id"]) != action["_source"]["content_hash"]
+
+    indexes = index_documents(index, data_file, chunk_size, max_chunk_mo, threads, max_retries, garder=garder)
+    if indexes is None:
+        # Lecture interrompue: `vus` est incomplet, aucune suppression
+        return False
+
+    disparus = existants.keys() - vus
+    suppressions = ({"_op_type": "delete", "_index": index, "_id": _id} for _id in disparus)
+    supprimes = 0
+    for succes, action, resultat in envoyer_avec_reprises(suppressions, threads, chunk_size,
+                                                          int(max_chunk_mo * 1024 * 1024), max_retries):
+        # 404: déjà supprimé
+        if succes or _statut(resultat) == 404:
+            supprimes += 1
+        else:
+            print(f"⚠️ Suppression échouée ({action['_id']}): {next(iter(resultat.values())).get('error')}")
+    es.indices.refresh(index=index)
+    print(f"🔄 Synchronisation: {indexes} ajoutés ou modifiés, {supprimes} supprimés, "
+          f"{len(vus) - indexes} inchangés")
+    return True
+
+def reconstruire_index(garder=2, echecs_toleres=ECHECS_TOLERES, **options_ingestion):
+    """Construit une nouvelle version en arrière-plan puis la met en service par l'alias.
+
+    En cas d'échec, y compris plus de `echecs_toleres` documents rejetés
+    (index partiel), la nouvelle version est supprimée et l'alias reste
+    sur l'index en service.
+    """
+    nouvel_index = init_index()
+    if nouvel_index is None:
+        return False
+    indexes = index_documents(nouvel_index, echecs_toleres=echecs_toleres, **options_ingestion)
+    if not indexes or not finaliser_index(nouvel_index, indexes):
+        es.indices.delete(index=nouvel_index, ignore_unavailable=True)
+        print(f"↩️ Reconstruction abandonnée: '{nouvel_index}' supprimé, alias inchangé")
+        return False
+    basculer_alias(nouvel_index)
+    nettoyer_versions(garder)
+    return True
+
+def export_snapshot(index=ALIAS):
+    """Exporte l'index dans le snapshot compact lu par le moteur local de app.py"""
+    try:
+        documents, vecteurs = [], []
+        for hit in helpers.scan(es, index=index, query={"query": {"match_all": {}}}):
+            source = hit["_source"]
+            vecteurs.append(source.pop("question_vector", None))
+            documents.append({"_id": hit["_id"], **source})
+
+        # La matrice n'est utile que si tous les documents ont un embedding
+        embeddings = vecteurs if documents and all(v is not None for v in vecteurs) else None
+        sauvegarder_snapshot(documents, embeddings)
+        print(f"💾 Snapshot exporté: {len(documents)} documents"
+              f"{' avec embeddings' if embeddings else ''}")
+    except Exception as e:
+        print(f"❌ Erreur lors de l'export du snapshot: {str(e)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexation de la base fiscale")
+    parser.add_argument("--snapshot-only", action="store_true",
+                        help="Exporte uniquement le snapshot local de l'index existant")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Remet l'alias sur la version précédente de l'index")
+    parser.add_argument("--garder", type=int, default=2,
+                        help="Nombre de versions de l'index conservées pour un rollback")
+    parser.add_argument("--fichier", default=DATA_FILE,
+                        help="Base de connaissances: tableau JSON ou NDJSON (.gz accepté)")
+    parser.add_argument("--chunk-size", type=int, default=TAILLE_CHUNK, help="Documents par requête bulk")
+    parser.add_argument("--max-chunk-mo", type=float, default=MAX_CHUNK_MO, help="Taille max d'une requête bulk (Mo)")
+    parser.add_argument("--threads", type=int, default=THREADS_BULK, help="Requêtes bulk en parallèle")
+    parser.add_argument("--max-retries", type=int, default=MAX_RETRIES,
+                        help="Nouveaux essais des documents rejetés (429)")
+    parser.add_argument("--echecs-toleres", type=int, default=ECHECS_TOLERES,
+                        help="Documents en échec tolérés avant d'abandonner une reconstruction")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Met à jour l'index en service (nouveaux, modifiés, supprimés) sans reconstruction")
+    args = parser.parse_args()
+
     try:
         # Vérification connexion
         if not es.ping():
             raise ConnectionError("Échec de connexion Elasticsearch")
         print("✅ Connecté à Elasticsearch")
         
-        # Initialisation
-        init_index()
+        options_ingestion = dict(data_file=args.fichier, chunk_size=args.chunk_size, max_chunk_mo=args.max_chunk_mo,
+                                 threads=args.threads, max_retries=args.max_retries)
+        if args.rollback:
+            print(f"✅ Alias '{ALIAS}' restauré sur '{rollback()}'")
+        elif args.incremental and index_actif() is not None:
+            if not synchroniser(ALIAS, **options_ingestion):
+                raise RuntimeError("Synchronisation interrompue, aucune suppression effectuée")
+        elif not args.snapshot_only:
+            # Nouvelle version construite à côté de l'index en service, puis bascule de l'alias
+            if not reconstruire_index(args.garder, args.echecs_toleres, **options_ingestion):
+                raise RuntimeError("Reconstruction échouée, index en service conservé")
         
-        # Indexation
-        index_documents()
+        # Snapshot pour le mode sans Elasticsearch
+        export_snapshot()
         
     except Exception as e:
         print(f"🔥 Erreur critique: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,64 @@
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Iterator
+
+_ESPACES = " \t\r\n"
+
+
+def lire_documents(chemin: Path, taille_bloc: int = 1 << 20) -> Iterator[Any]:
+    """Lit un fichier JSON document par document, sans le charger en entier.
+
+    Formats acceptés (éventuellement compressés en .gz):
+    - tableau JSON `[{...}, {...}]`: chaque élément est renvoyé;
+    - NDJSON (un document par ligne) ou documents JSON concaténés.
+    La mémoire utilisée est de l'ordre d'un bloc plus un document.
+    """
+    ouvrir = gzip.open if str(chemin).endswith(".gz") else open
+    decodeur = json.JSONDecoder()
+    with ouvrir(chemin, "rt", encoding="utf-8") as f:
+        tampon, position, fin_fichier = "", 0, False
+        dans_tableau = None
+
+        def completer():
+            nonlocal tampon, position, fin_fichier
+            bloc = f.read(taille_bloc)
+            fin_fichier = not bloc
+            tampon = tampon[position:] + bloc
+            position = 0
+
+        while True:
+            # Séparateurs entre documents: espaces, virgules, crochets du tableau
+            while True:
+                while position < len(tampon) and tampon[position] in _ESPACES:
+                    position += 1
+                if position == len(tampon):
+                    if fin_fichier:
+                        return
+                    completer()
+                    continue
+                caractere = tampon[position]
+                if dans_tableau is None:
+                    dans_tableau = caractere == "["
+                    if dans_tableau:
+                        position += 1
+                        continue
+                if dans_tableau and caractere in ",]":
+                    position += 1
+                    continue
+                break
+
+            try:
+                document, suivant = decodeur.raw_decode(tampon, position)
+            except json.JSONDecodeError:
+                if fin_fichier:
+                    raise
+                # Document coupé par la fin du bloc: on lit la suite
+                completer()
+                continue
+            if suivant == len(tampon) and not fin_fichier and not isinstance(document, (dict, list, str)):
+                # Un nombre en fin de bloc peut être tronqué
+                completer()
+                continue
+            position = suivant
+            yield document
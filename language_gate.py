@@ -0,0 +1,112 @@
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+from langdetect.lang_detect_exception import ErrorCode, LangDetectException
+
+from matcher import ClassifieurFiscal
+from text_utils import normaliser_question
+
+# Langues chargées dans le détecteur: le français et celles avec lesquelles il est
+# confondu en pratique (langues latines, anglais, arabe, et celles qui absorbent le wolof)
+LANGUES_PROFILS = ("fr", "en", "es", "pt", "it", "de", "nl", "ro", "ca", "ar", "sw", "so", "tl", "id")
+
+# Mots-outils très fréquents et propres au français (ceux partagés avec l'espagnol,
+# l'italien, le portugais, le catalan ou l'allemand, comme « la », « de », « que »,
+# « il », « qui », « le », « quel », « ma », « mes », « sur » ou « des », sont exclus)
+MOTS_FRANCAIS = {
+    "les", "au", "aux", "une", "est", "sont", "et",
+    "je", "j", "nous", "vous", "elle", "votre", "notre",
+    "quels", "quelles", "comment", "pourquoi", "combien", "quand",
+    "quoi", "qu", "pour", "avec", "dans", "sans",
+    "dois", "doit", "faut", "peut", "puis", "payer", "obtenir", "faire", "cette", "ces",
+}
+_MOTS = re.compile(r"\w+")
+
+# Mots-outils anglais: leur présence désactive le chemin rapide
+MOTS_ANGLAIS = {"the", "is", "are", "what", "how", "why", "when", "where", "who", "to", "of",
+                "and", "my", "your", "can", "do", "does", "i", "you", "for", "with", "pay"}
+
+
+class FiltreLangue:
+    """Filtre « question en français ? » construit une fois au démarrage.
+
+    1. Chemin rapide: une question avec au moins un mot-outil propre au
+       français, sans marqueur anglais, et courte ou contenant du
+       vocabulaire fiscal (TVA, CFPNB...), est acceptée sans détection
+       statistique, de même qu'une requête faite uniquement de termes
+       fiscaux (« quitus fiscal »). Un terme fiscal parmi d'autres mots ne
+       suffit pas: « ¿Cuál es la TVA? » passe par le détecteur.
+    2. Sinon, détecteur langdetect à graine fixe (verdict déterministe),
+       restreint à LANGUES_PROFILS et chargé une seule fois.
+    3. Les verdicts sont mémorisés par question normalisée (LRU).
+    """
+
+    def __init__(self, classifieur: ClassifieurFiscal, langues: Iterable[str] = LANGUES_PROFILS,
+                 taille_memo: int = 4096, mots_max_chemin_rapide: int = 4, graine: int = 0):
+        self.classifieur = classifieur
+        self.taille_memo = taille_memo
+        self.mots_max_chemin_rapide = mots_max_chemin_rapide
+
+        self._factory = DetectorFactory()
+        self._factory.load_json_profile([
+            (Path(PROFILES_DIRECTORY) / langue).read_text(encoding="utf-8") for langue in langues
+        ])
+        self._factory.set_seed(graine)
+
+        self._lock = threading.Lock()
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+        self.compteurs = {"rapide": 0, "memo": 0, "detecteur": 0}
+
+    def detecter(self, texte: str) -> str:
+        """Code langue de `texte` ("fr", "en"...). Lève LangDetectException si indétectable"""
+        cle = normaliser_question(texte)
+        with self._lock:
+            langue = self._memo.get(cle)
+            if langue is not None:
+                self._memo.move_to_end(cle)
+                self.compteurs["memo"] += 1
+                return langue
+
+        langue = self._chemin_rapide(cle)
+        if langue is not None:
+            self.compteurs["rapide"] += 1
+        else:
+            langue = self._detecteur(texte)
+            self.compteurs["detecteur"] += 1
+
+        with self._lock:
+            self._memo[cle] = langue
+            if len(self._memo) > self.taille_memo:
+                self._memo.popitem(last=False)
+        return langue
+
+    def est_francais(self, texte: str) -> bool:
+        return self.detecter(texte) == "fr"
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.compteurs, "memo_taille": len(self._memo)}
+
+    def _chemin_rapide(self, cle: str) -> Optional[str]:
+        mots = set(_MOTS.findall(cle))
+        if not mots or mots & MOTS_ANGLAIS:
+            return None
+        fiscal = self.classifieur.analyser(cle)["fiscal"]
+        if mots & MOTS_FRANCAIS:
+            return "fr" if len(mots) <= self.mots_max_chemin_rapide or fiscal else None
+        # Sans mot-outil, seule une requête faite uniquement de termes fiscaux (« quitus fiscal ») est acceptée
+        termes = {mot for terme in fiscal for mot in _MOTS.findall(terme)}
+        if fiscal and all(mot in termes or mot[:-1] in termes for mot in mots):
+            return "fr"
+        return None
+
+    def _detecteur(self, texte: str) -> str:
+        detecteur = self._factory.create()
+        detecteur.append(texte)
+        langue = detecteur.detect()
+        if langue == "unknown":
+            raise LangDetectException(ErrorCode.CantDetectError, "No features in text.")
+        return langue
@@ -0,0 +1,171 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Set, Tuple
+
+from text_utils import replier_accents
+
+# Vocabulaire du domaine fiscal (sigles compris)
+MOTS_CLES_FISCAUX = {
+    "impôt", "impot", "taxe", "réglementations", "tva", "TVA", "CFPNB", "etax","imposable", "imposition", "dgi", "dgid", "droit fiscal",
+    "cfpnb", "PV", "pv", "PME", "quitus", "PCF", "fiscalité", "déclaration", "TOEM",
+    "CGU", "Patente", "récapitulatifs", "exonération", "remboursement",
+    "trop perçu", "délai", "quitus fiscal", "délai de paiement", "quittance",
+    "récépissé", "revenus", "formalisation", "contribution", "taxation",
+    "cadastre", "redevance", "contribution foncière", "taxe sur les véhicules",
+    "taxe sur les biens", "taxe sur les opérations", "taxe sur les produits",
+    "taxe sur les services", "droit d'enregistrement", "droits d'enregistrement",
+    "taxes d'enregistrement", "entreprise", "changement de statuts",
+    "taxes sur les salaires", "taxe sur les salaires", "taxe foncière",
+    "taxe professionnelle", "NINEA", "direct", "indirect", "réouverture",
+    "taxe sur la valeur ajoutée", "passeport", "taxe sur les boissons",
+    "réductions", "immatriculation", "propriétaire", "compte", "duplicata",
+    "IR", "IS", "patente", "douane", "régime fiscal", "code général des impôts",
+    "procédure", "acte administratif", "exonérations", "obligation fiscale",
+    "pénalité", "penalite", "amende", "contrôle fiscal", "démarrage des activités",
+    "homologation", "acte", "titre", "SIGTAS", "imposition", "bail",
+    "foncier bâti", "foncier non bâti", "TEOM", "vérification", "versement",
+    "trésor", "TVA déductible", "TVA collectée", "TVA non récupérable",
+    "non-assujetti", "assujetti", "centre des impôts", "régularisation",
+    "déductibilité", "déclaration mensuelle", "déclaration annuelle",
+    "numéro fiscal", "avis d'imposition", "bordereau de paiement", "numéro IFU",
+    "COFI", "fiscale", "fiscaux", "fiscal", "DGID", "impotsetdomaines", "dgi",
+    "direction générale des impôts","article", "articles", "code des impôts",
+    "code fiscal", "loi fiscale", "réglementation fiscale"
+}
+
+SALUTATIONS = {"bonjour", "salut", "hello", "bonsoir", "coucou", "hi", "salam", "yo", "bjr", "allo", "good morning", "good afternoon"}
+
+# Liste noire de sujets non fiscaux
+MOTS_HORS_DOMAINE = {
+    "président", "premier ministre", "ministre", "gouvernement",
+    "fifa", "politique", "élection", "parti", "sport", "football",
+    "biographie", "histoire", "culture", "religion","nourriture",
+    "voyage", "tourisme", "santé", "médecine", "éducation",
+    "loisirs", "cinéma", "musique", "art", "littérature",
+    "sciences", "technologie", "informatique", "programmation",
+    "environnement", "écologie", "climat", "nature", "animaux",
+    "philosophie", "psychologie", "sociologie", "anthropologie",
+    "carrière", "emploi", "recrutement", "formation", "stage",
+    "capitale", "monnaie", "économie", "marché"
+}
+
+# Sigles des impôts et taxes, avec leurs formes développées: une réponse certifiée doit porter sur les
+# mêmes impôts que la question (la TEOM n'est pas la TVA, même si les questions se ressemblent)
+SIGLES_FISCAUX = {
+    "TVA": ["tva", "taxe sur la valeur ajoutée"],
+    "IR": ["ir", "irpp", "impôt sur le revenu"],
+    "IS": ["is", "impôt sur les sociétés"],
+    "IMF": ["imf", "impôt minimum forfaitaire"],
+    "CGU": ["cgu", "contribution globale unique"],
+    "CFPB": ["cfpb", "contribution foncière des propriétés bâties"],
+    "CFPNB": ["cfpnb", "contribution foncière des propriétés non bâties"],
+    "CEL": ["cel", "contribution économique locale"],
+    "TEOM": ["teom", "toem", "taxe d'enlèvement des ordures ménagères"],
+    "TRIMF": ["trimf", "taxe représentative de l'impôt du minimum fiscal"],
+    "NINEA": ["ninea"],
+}
+
+# Formulations signalant une réponse inappropriée
+PHRASES_REJET = {
+    "je ne sais pas", "je ne connais pas", "premier ministre",
+    "président de", "ministre de", "dans le domaine", "hors sujet"
+}
+
+
+_MOTS = re.compile(r"\w+")
+
+
+def _plier(texte: str) -> str:
+    return replier_accents(texte.lower().replace("’", "'"))
+
+
+class ClassifieurFiscal:
+    """Reconnaît en un seul passage tous les termes connus d'un texte.
+
+    Le vocabulaire est indexé une fois par premier mot de chaque terme
+    (accents repliés, pluriel en -s/-x toléré). L'analyse découpe le texte
+    en mots, intersecte cet ensemble avec l'index, puis ne vérifie avec
+    frontières de mots que les expressions de plusieurs mots candidates.
+    Un terme d'un mot terminé par « * » reconnaît tout mot qui commence
+    ainsi (formes fléchies: « déclar* » pour déclare, déclarez, déclaration).
+    """
+
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        self.categories = list(categories)
+        self._categories_par_terme: Dict[str, Set[str]] = {}
+        self._termes_par_forme: Dict[str, Set[str]] = {}
+        # Expressions de plusieurs mots: mots requis et motif exact
+        self._expressions: Dict[str, Tuple[Tuple[str, ...], re.Pattern]] = {}
+        # Préfixes (termes « mot* »): peu nombreux, comparés à chaque mot du texte
+        self._prefixes: Dict[str, str] = {}
+
+        for categorie, mots in categories.items():
+            for mot in mots:
+                terme = _plier(mot)
+                self._categories_par_terme.setdefault(terme, set()).add(categorie)
+
+        for terme in self._categories_par_terme:
+            if terme.endswith("*"):
+                self._prefixes[terme[:-1]] = terme
+                continue
+            mots = _MOTS.findall(terme)
+            formes = {mots[0]}
+            if len(mots) == 1:
+                formes |= {mots[0] + "s", mots[0] + "x"}
+            else:
+                # Le motif commence par un littéral pour profiter de la recherche rapide de `re`
+                motif = re.compile(rf"{re.escape(terme)}[sx]?(?!\w)")
+                self._expressions[terme] = (tuple(mots[:-1]), motif)
+            for forme in formes:
+                self._termes_par_forme.setdefault(forme, set()).add(terme)
+        self._formes = frozenset(self._termes_par_forme)
+
+    def analyser(self, texte: str) -> Dict[str, Set[str]]:
+        """Retourne, pour chaque catégorie, l'ensemble des termes trouvés"""
+        resultat = {categorie: set() for categorie in self.categories}
+        texte = _plier(texte)
+        mots = set(_MOTS.findall(texte))
+        for forme in self._formes.intersection(mots):
+            for terme in self._termes_par_forme[forme]:
+                expression = self._expressions.get(terme)
+                if expression is not None and not _contient(texte, mots, *expression):
+                    continue
+                for categorie in self._categories_par_terme[terme]:
+                    resultat[categorie].add(terme)
+        for prefixe, terme in self._prefixes.items():
+            if any(mot.startswith(prefixe) for mot in mots):
+                for categorie in self._categories_par_terme[terme]:
+                    resultat[categorie].add(terme)
+        return resultat
+
+
+def _contient(texte: str, mots: Set[str], mots_requis: Tuple[str, ...], motif: re.Pattern) -> bool:
+    """Vérifie une expression de plusieurs mots (début aligné sur une frontière de mot)"""
+    if not mots.issuperset(mots_requis):
+        return False
+    for correspondance in motif.finditer(texte):
+        debut = correspondance.start()
+        if debut == 0 or not (texte[debut - 1].isalnum() or texte[debut - 1] == "_"):
+            return True
+    return False
+
+
+@lru_cache(maxsize=1)
+def classifieur_fiscal() -> ClassifieurFiscal:
+    """Classifieur partagé du domaine fiscal (construit une seule fois par processus)"""
+    return ClassifieurFiscal({
+        "fiscal": MOTS_CLES_FISCAUX,
+        "salutation": SALUTATIONS,
+        "hors_domaine": MOTS_HORS_DOMAINE,
+        "rejet": PHRASES_REJET,
+    })
+
+
+@lru_cache(maxsize=1)
+def classifieur_sigles() -> ClassifieurFiscal:
+    return ClassifieurFiscal(SIGLES_FISCAUX)
+
+
+def sigles_fiscaux(texte: str) -> Set[str]:
+    """Sigles des impôts cités dans un texte, sous forme abrégée ou développée"""
+    return {sigle for sigle, termes in classifieur_sigles().analyser(texte).items() if termes}
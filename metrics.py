@@ -0,0 +1,218 @@
+"""Métriques Prometheus et traces par requête des étapes du pipeline.
+
+`etape(nom)` (ou le décorateur `chronometre`) mesure une étape: la durée
+alimente l'histogramme `fiscal_etape_duree_secondes` et, si une requête
+est tracée (`tracer_requete`, posé par le middleware de l'API), la trace
+de cette requête. La trace suit la requête dans les threads du pool via
+contextvars; elle donne l'en-tête Server-Timing et, au-delà de
+TRACE_LENTE_MS, une ligne JSON dans les logs.
+
+Le coût par étape est de deux lectures d'horloge et une observation
+d'histogramme: l'instrumentation reste active en production. Avec
+plusieurs workers, définir PROMETHEUS_MULTIPROC_DIR (mode multiprocessus
+de prometheus_client).
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# Requêtes plus lentes que ce seuil (ms) journalisées avec le détail de leurs étapes (0: jamais)
+TRACE_LENTE_MS = float(os.getenv("TRACE_LENTE_MS", "3000"))
+# Endpoints dont la consommation LLM par requête est observée. Les sondes et la consultation n'appellent
+# jamais le LLM, le flux génère après la fermeture de sa trace et un lot regroupe de nombreuses questions
+ENDPOINTS_LLM = {"/api/ask"}
+
+_BUCKETS_DUREE = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DUREE_ETAPE = Histogram(
+    "fiscal_etape_duree_secondes", "Durée de chaque étape du pipeline", ["etape"], buckets=_BUCKETS_DUREE
+)
+DUREE_REQUETE = Histogram(
+    "fiscal_requete_duree_secondes", "Durée des requêtes HTTP", ["endpoint", "statut"], buckets=_BUCKETS_DUREE
+)
+SCORE_RECHERCHE = Histogram(
+    "fiscal_recherche_confiance", "Confiance du meilleur résultat de la recherche hybride", ["moteur"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0)
+)
+APPELS_LLM = Counter("fiscal_llm_appels_total", "Appels au LLM", ["type"])
+TOKENS_LLM = Counter("fiscal_llm_tokens_total", "Tokens consommés par le LLM", ["sens"])
+APPELS_LLM_REQUETE = Histogram(
+    "fiscal_llm_appels_par_requete", "Appels au LLM par requête", buckets=(0, 1, 2, 3, 4, 6, 8)
+)
+TOKENS_LLM_REQUETE = Histogram(
+    "fiscal_llm_tokens_par_requete", "Tokens LLM par requête", buckets=(0, 250, 500, 1000, 2000, 4000, 8000)
+)
+CACHES = Counter("fiscal_cache_total", "Consultations des caches (réponses, complétions LLM)", ["cache", "resultat"])
+REPONSES = Counter("fiscal_reponses_total", "Réponses servies, par chemin", ["source"])
+COALESCEES = Counter("fiscal_requetes_coalescees_total", "Requêtes servies par un calcul identique déjà en cours")
+ETAT_DISJONCTEUR = Gauge(
+    "fiscal_disjoncteur_etat", "État du disjoncteur d'une dépendance (0 fermé, 1 demi-ouvert, 2 ouvert)",
+    ["dependance"], multiprocess_mode="max"
+)
+OUVERTURES_DISJONCTEUR = Counter("fiscal_disjoncteur_ouvertures_total", "Ouvertures des disjoncteurs", ["dependance"])
+_CODES_ETAT = {"ferme": 0, "demi_ouvert": 1, "ouvert": 2}
+
+
+class Trace:
+    """Étapes et consommation LLM d'une requête"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.debut = time.perf_counter()
+        self.etapes: Dict[str, float] = {}
+        self.appels_llm = 0
+        self.tokens_llm = 0
+        self._lock = threading.Lock()  # étapes ajoutées depuis plusieurs threads (lots)
+
+    def ajouter(self, etape: str, duree: float):
+        with self._lock:
+            self.etapes[etape] = self.etapes.get(etape, 0.0) + duree
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{etape};dur={duree * 1e3:.1f}" for etape, duree in self.etapes.items())
+
+
+_trace_courante: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace_courante", default=None)
+# Vrai pendant une exécution de l'agent: ses appels LLM (outils compris) sont comptés par son callback
+_agent_en_cours: contextvars.ContextVar[bool] = contextvars.ContextVar("agent_en_cours", default=False)
+
+
+@contextmanager
+def etape(nom: str):
+    """Mesure le bloc comme étape `nom` du pipeline"""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        DUREE_ETAPE.labels(nom).observe(duree)
+        trace = _trace_courante.get()
+        if trace is not None:
+            trace.ajouter(nom, duree)
+
+
+def chronometre(nom: str):
+    """Décorateur: mesure chaque appel de la fonction comme étape `nom`"""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            with etape(nom):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorateur
+
+
+@contextmanager
+def tracer_requete(endpoint: str):
+    """Ouvre la trace d'une requête; les histogrammes par requête (ENDPOINTS_LLM) sont alimentés à la fermeture"""
+    trace = Trace(endpoint)
+    jeton = _trace_courante.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_courante.reset(jeton)
+        if endpoint in ENDPOINTS_LLM:
+            APPELS_LLM_REQUETE.observe(trace.appels_llm)
+            TOKENS_LLM_REQUETE.observe(trace.tokens_llm)
+        duree_ms = (time.perf_counter() - trace.debut) * 1e3
+        if TRACE_LENTE_MS and duree_ms > TRACE_LENTE_MS:
+            print(json.dumps({
+                "evenement": "requete_lente",
+                "endpoint": endpoint,
+                "duree_ms": round(duree_ms, 1),
+                "etapes_ms": {k: round(v * 1e3, 1) for k, v in trace.etapes.items()},
+                "appels_llm": trace.appels_llm,
+                "tokens_llm": trace.tokens_llm,
+            }, ensure_ascii=False))
+
+
+def compter_llm(type_appel: str, message=None, usage: Optional[Dict] = None):
+    """Compte un appel LLM et ses tokens (usage_metadata d'un message LangChain, ou `usage`).
+
+    Sans effet pendant une exécution de l'agent (`suivi_agent`), dont le
+    callback voit déjà tous les appels.
+    """
+    if not _agent_en_cours.get():
+        _compter_llm(type_appel, message, usage)
+
+
+def _compter_llm(type_appel: str, message=None, usage: Optional[Dict] = None):
+    APPELS_LLM.labels(type_appel).inc()
+    usage = usage or getattr(message, "usage_metadata", None) or {}
+    entree, sortie = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    if entree:
+        TOKENS_LLM.labels("entree").inc(entree)
+    if sortie:
+        TOKENS_LLM.labels("sortie").inc(sortie)
+    trace = _trace_courante.get()
+    if trace is not None:
+        with trace._lock:
+            trace.appels_llm += 1
+            trace.tokens_llm += entree + sortie
+
+
+def observer_score(moteur: str, confiance: float):
+    SCORE_RECHERCHE.labels(moteur).observe(confiance)
+
+
+def compter_cache(trouve: bool, cache: str = "reponses"):
+    CACHES.labels(cache, "hit" if trouve else "miss").inc()
+
+
+def compter_reponse(source: str):
+    REPONSES.labels(source).inc()
+
+
+def etat_disjoncteur(dependance: str, etat: str):
+    """Rappel de transition des disjoncteurs (circuit_breaker.Disjoncteur)"""
+    ETAT_DISJONCTEUR.labels(dependance).set(_CODES_ETAT[etat])
+    if etat == "ouvert":
+        OUVERTURES_DISJONCTEUR.labels(dependance).inc()
+
+
+@functools.lru_cache(maxsize=1)
+def _classe_suivi_llm():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class SuiviLLM(BaseCallbackHandler):
+        """Compte les appels LLM faits pendant l'agent (itérations ReAct et outils compris)"""
+
+        def on_llm_end(self, response, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            _compter_llm("agent", usage={
+                "input_tokens": usage.get("prompt_tokens", 0),
+                "output_tokens": usage.get("completion_tokens", 0),
+            })
+
+    return SuiviLLM
+
+
+@contextmanager
+def suivi_agent():
+    """Encadre une exécution de l'agent; donne le callback à passer à `agent.invoke(..., config=...)`.
+
+    Chaque appel LLM de l'exécution, y compris ceux faits par ses outils,
+    est compté une seule fois, comme appel "agent".
+    """
+    jeton = _agent_en_cours.set(True)
+    try:
+        yield _classe_suivi_llm()()
+    finally:
+        _agent_en_cours.reset(jeton)
+
+
+def exporter() -> bytes:
+    """Texte d'exposition Prometheus (agrégé entre workers en mode multiprocessus)"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registre = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registre)
+        return generate_latest(registre)
+    return generate_latest(REGISTRY)
+
@@ -0,0 +1,247 @@
+import gzip
+import heapq
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from text_utils import replier_accents
+
+# Modèle d'embedding partagé entre l'indexation (index.py) et la recherche (app.py)
+EMBEDDING_MODEL = "dangvantuan/sentence-camembert-base"
+EMBEDDING_DIMS = 768
+
+# Constante k de la Reciprocal Rank Fusion (valeur usuelle)
+RRF_K = 60
+
+def requete_bm25(query: str, size: int = 10) -> Dict:
+    """Requête lexicale historique sur question/réponse/tags"""
+    return {
+        "query": {
+            "bool": {
+                "must": [
+                    {
+                        "multi_match": {
+                            "query": query,
+                            "fields": ["question^3", "reponse^2", "tags"],
+                            "type": "best_fields"
+                        }
+                    }
+                ]
+            }
+        },
+        "size": size,
+        "_source": {"excludes": ["question_vector"]}
+    }
+
+
+def requete_knn(vecteur: List[float], k: int = 10, num_candidates: int = 50) -> Dict:
+    """Requête kNN sur l'embedding des questions"""
+    return {
+        "knn": {
+            "field": "question_vector",
+            "query_vector": vecteur,
+            "k": k,
+            "num_candidates": num_candidates
+        },
+        "size": k,
+        "_source": {"excludes": ["question_vector"]}
+    }
+
+
+def fusion_hybride(hits_bm25: List[Dict], hits_knn: List[Dict], query: str = "", k: int = RRF_K) -> List[Dict]:
+    """Fusionne les résultats lexicaux et sémantiques par Reciprocal Rank Fusion.
+
+    Le RRF ne sert qu'à ordonner: il mesure l'accord des classements, pas la
+    pertinence (le premier d'une liste seule vaut toujours 1). La `confiance`
+    de chaque résultat, dans [0, 1], est absolue: le cosinus kNN de la
+    question, ou à défaut la part des termes significatifs de `query`
+    présents dans la question du document (mots vides exclus). Un document
+    absent des voisins kNN ne dépasse pas le cosinus du dernier voisin.
+    """
+    fusion: Dict[str, Dict] = {}
+    for source, hits in (("bm25", hits_bm25), ("knn", hits_knn)):
+        for rang, hit in enumerate(hits or [], start=1):
+            doc = fusion.setdefault(hit["_id"], {"_id": hit["_id"], "_source": hit["_source"], "score_rrf": 0.0})
+            doc["score_rrf"] += 1.0 / (k + rang)
+            doc[f"score_{source}"] = hit["_score"]
+
+    termes = termes_significatifs(query)
+    cosinus_plancher = cosinus(hits_knn[-1]["_score"]) if hits_knn else None
+    resultats = sorted(fusion.values(), key=lambda d: d["score_rrf"], reverse=True)
+    for doc in resultats:
+        if "score_knn" in doc:
+            doc["cosinus"] = cosinus(doc["score_knn"])
+            doc["confiance"] = doc["cosinus"]
+        else:
+            doc["confiance"] = recouvrement(termes, doc["_source"])
+            if cosinus_plancher is not None:
+                doc["confiance"] = min(doc["confiance"], cosinus_plancher)
+    return resultats
+
+
+def cosinus(score: float) -> float:
+    """Cosinus d'un score kNN (Elasticsearch renvoie (1 + cosinus) / 2 pour la similarité "cosine")"""
+    return max(0.0, 2 * score - 1)
+
+
+def termes_significatifs(texte: str) -> Set[str]:
+    """Termes analysés d'un texte, sans les mots vides"""
+    return set(analyser(texte)) - _MOTS_VIDES
+
+
+def recouvrement(termes: Set[str], document: Dict) -> float:
+    """Part des `termes` présents dans la question et les tags d'un document"""
+    if not termes:
+        return 0.0
+    return len(termes & set(analyser(sujet_document(document)))) / len(termes)
+
+
+def sujet_document(document: Dict) -> str:
+    """Question et tags d'un document: ce sur quoi porte sa réponse"""
+    tags = document.get("tags") or []
+    return f"{document.get('question', '')} {' '.join(tags) if isinstance(tags, list) else tags}"
+
+
+# ---------------------------------------------------------------------------
+# Moteur de recherche embarqué (mode sans Elasticsearch)
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_DIR = Path(__file__).parent / "snapshot"
+
+_MOTS = re.compile(r"\w+")
+# Suffixes retirés par le raciniseur léger, du plus long au plus court
+_SUFFIXES = ("issement", "issements", "ements", "ement", "ations", "ation", "itions", "ition",
+             "ables", "able", "iques", "ique", "euses", "euse", "eurs", "eur", "ives", "ive",
+             "ités", "ité", "ées", "ée", "er", "és", "é", "es", "e")
+# Champs interrogés et leur poids (identiques à requete_bm25)
+_CHAMPS = {"question": 3.0, "reponse": 2.0, "tags": 1.0}
+
+
+def raciner(mot: str) -> str:
+    """Raciniseur léger du français (pluriels et suffixes courants)"""
+    if len(mot) > 5 and mot.endswith("aux"):
+        mot = mot[:-3] + "al"
+    elif len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    for suffixe in _SUFFIXES:
+        if mot.endswith(suffixe) and len(mot) - len(suffixe) >= 4:
+            return mot[:-len(suffixe)]
+    return mot
+
+
+def analyser(texte: str) -> List[str]:
+    """Équivalent local du french_analyzer: minuscules, racinisation, repli des accents"""
+    return [replier_accents(raciner(mot)) for mot in _MOTS.findall(texte.lower())]
+
+
+# Mots vides ignorés par la confiance lexicale (formulation de la question, pas son sujet)
+_MOTS_VIDES = frozenset(replier_accents(raciner(mot)) for mot in """
+a ai as au aux avec c ce ces cet cette comment d dans de des dois doit du elle elles en est et etre
+faire fait faut il ils j je juste l la le les leur leurs m ma mais me merci mes moi mon n ne nous on ou
+par pas peut peux plus pour pouvez qu quand que quel quelle quelles quels qui quoi s sa sans se ses
+son sont sur svp t ta te tes toi ton tu un une vos votre vous y bonjour dites savoir voudrais expliquer
+question sénégal
+""".split())
+
+
+class MoteurLocal:
+    """Index inversé BM25 en mémoire sur les documents question/reponse/tags.
+
+    Les résultats ont la forme des hits Elasticsearch (`_id`, `_score`,
+    `_source`) pour passer tels quels dans `fusion_hybride`. Si une matrice
+    d'embeddings est fournie, `rechercher` renvoie aussi les voisins kNN.
+    """
+
+    def __init__(self, documents: List[Dict], embeddings=None, k1: float = 1.2, b: float = 0.75):
+        self.documents = documents
+        self.embeddings = embeddings
+        self.k1 = k1
+        self.b = b
+        # terme -> champ -> [(indice document, fréquence)]
+        self._postings: Dict[str, Dict[str, List[Tuple[int, int]]]] = defaultdict(lambda: defaultdict(list))
+        self._longueurs = {champ: [0] * len(documents) for champ in _CHAMPS}
+        self._longueur_moyenne = {}
+
+        for i, doc in enumerate(documents):
+            for champ in _CHAMPS:
+                valeur = doc.get(champ) or ""
+                termes = analyser(" ".join(valeur) if isinstance(valeur, list) else str(valeur))
+                self._longueurs[champ][i] = len(termes)
+                for terme, tf in Counter(termes).items():
+                    self._postings[terme][champ].append((i, tf))
+        for champ, longueurs in self._longueurs.items():
+            self._longueur_moyenne[champ] = (sum(longueurs) / len(longueurs)) if longueurs else 0.0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def rechercher(self, query: str, vecteur=None, size: int = 10) -> Tuple[List[Dict], List[Dict]]:
+        """Retourne (hits BM25, hits kNN) au format Elasticsearch"""
+        hits_knn = self._knn(vecteur, size) if vecteur is not None and self.embeddings is not None else []
+        return self._bm25(query, size), hits_knn
+
+    def _bm25(self, query: str, size: int) -> List[Dict]:
+        n = len(self.documents)
+        # best_fields: on garde le meilleur champ pondéré par document
+        par_champ: Dict[str, Dict[int, float]] = {champ: defaultdict(float) for champ in _CHAMPS}
+        for terme in set(analyser(query)):
+            for champ, postings in self._postings.get(terme, {}).items():
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                moyenne = self._longueur_moyenne[champ] or 1.0
+                for i, tf in postings:
+                    norme = self.k1 * (1 - self.b + self.b * self._longueurs[champ][i] / moyenne)
+                    par_champ[champ][i] += _CHAMPS[champ] * idf * tf * (self.k1 + 1) / (tf + norme)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for champ_scores in par_champ.values():
+            for i, score in champ_scores.items():
+                scores[i] = max(scores[i], score)
+        meilleurs = heapq.nlargest(size, scores.items(), key=lambda item: item[1])
+        return [self._hit(i, score) for i, score in meilleurs]
+
+    def _knn(self, vecteur, size: int) -> List[Dict]:
+        import numpy as np
+
+        similarites = self.embeddings @ np.asarray(vecteur, dtype=self.embeddings.dtype)
+        size = min(size, len(similarites))
+        if size == 0:
+            return []
+        candidats = np.argpartition(-similarites, size - 1)[:size]
+        ordre = candidats[np.argsort(-similarites[candidats])]
+        # Même échelle que la similarité "cosine" d'Elasticsearch
+        return [self._hit(int(i), (1 + float(similarites[i])) / 2) for i in ordre]
+
+    def _hit(self, i: int, score: float) -> Dict:
+        doc = self.documents[i]
+        return {"_id": doc.get("_id", str(i)), "_score": score, "_source": doc}
+
+    @classmethod
+    def charger(cls, dossier: Path = SNAPSHOT_DIR, nom: str = "fiscality") -> Optional["MoteurLocal"]:
+        """Charge un snapshot exporté par index.py (None s'il n'existe pas)"""
+        chemin_docs = Path(dossier) / f"{nom}.json.gz"
+        if not chemin_docs.exists():
+            return None
+        with gzip.open(chemin_docs, "rt", encoding="utf-8") as f:
+            documents = json.load(f)
+
+        embeddings = None
+        chemin_vecteurs = Path(dossier) / f"{nom}.npy"
+        if chemin_vecteurs.exists():
+            import numpy as np
+            embeddings = np.load(chemin_vecteurs).astype(np.float32)
+        return cls(documents, embeddings)
+
+
+def sauvegarder_snapshot(documents: List[Dict], embeddings=None,
+                         dossier: Path = SNAPSHOT_DIR, nom: str = "fiscality"):
+    """Écrit le snapshot compact: documents en JSON gzip, embeddings en float16"""
+    dossier = Path(dossier)
+    dossier.mkdir(parents=True, exist_ok=True)
+    with gzip.open(dossier / f"{nom}.json.gz", "wt", encoding="utf-8") as f:
+        json.dump(documents, f, ensure_ascii=False, separators=(",", ":"))
+    if embeddings is not None:
+        import numpy as np
+        np.save(dossier / f"{nom}.npy", np.asarray(embeddings, dtype=np.float16))
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional
+
+import numpy as np
+
+
+@dataclass
+class _Entree:
+    reponse: str
+    slot: int
+    cree_le: float
+    octets: int
+    sujet: FrozenSet[str]
+
+
+class SemanticCache:
+    """Cache sémantique des réponses finales.
+
+    Les questions sont indexées par leur embedding normalisé: une nouvelle
+    question dont la similarité cosinus avec une question déjà servie dépasse
+    `seuil` reçoit la réponse en cache, à condition de porter sur le même
+    `sujet` (les sigles des impôts cités: la CFPB n'est pas la CFPNB).
+    Éviction LRU, expiration TTL et plafond mémoire (vecteurs + réponses).
+    """
+
+    def __init__(self, seuil: float = 0.92, max_entrees: int = 2000,
+                 ttl: float = 86400, max_octets: int = 64 * 1024 * 1024):
+        self.seuil = seuil
+        self.max_entrees = max_entrees
+        self.ttl = ttl
+        self.max_octets = max_octets
+
+        self._lock = threading.Lock()
+        self._entrees: "OrderedDict[str, _Entree]" = OrderedDict()
+        self._vecteurs: Optional[np.ndarray] = None
+        # Les lignes des slots libres restent à zéro: seules les `_lignes` premières sont parcourues
+        self._lignes = 0
+        self._slots_libres = list(range(max_entrees - 1, -1, -1))
+        self._cle_par_slot: Dict[int, str] = {}
+        self._octets = 0
+        self._generation = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entrees)
+
+    def rechercher(self, cle: str, vecteur: Optional[np.ndarray] = None,
+                   sujet: FrozenSet[str] = frozenset()) -> Optional[str]:
+        """Retourne la réponse en cache pour `cle` (exacte) ou son plus proche voisin de même sujet"""
+        with self._lock:
+            entree = self._entrees.get(cle)
+            if entree is None and vecteur is not None and self._entrees:
+                scores = self._vecteurs[:self._lignes] @ vecteur.astype(np.float32)
+                proches = np.flatnonzero(scores >= self.seuil)
+                for slot in proches[np.argsort(-scores[proches])]:
+                    voisin = self._cle_par_slot.get(int(slot))
+                    if voisin is not None and self._entrees[voisin].sujet == sujet:
+                        cle, entree = voisin, self._entrees[voisin]
+                        break
+
+            if entree is not None and entree.cree_le < time.monotonic() - self.ttl:
+                self._retirer(cle)
+                entree = None
+
+            if entree is None:
+                self.misses += 1
+                return None
+
+            self._entrees.move_to_end(cle)
+            self.hits += 1
+            return entree.reponse
+
+    def ajouter(self, cle: str, vecteur: np.ndarray, reponse: str, sujet: FrozenSet[str] = frozenset()):
+        """Ajoute (ou remplace) la réponse associée à une question"""
+        vecteur = vecteur.astype(np.float32)
+        with self._lock:
+            if self._vecteurs is None:
+                self._vecteurs = np.zeros((self.max_entrees, vecteur.shape[0]), dtype=np.float32)
+
+            if cle in self._entrees:
+                self._retirer(cle)
+
+            octets = len(reponse.encode("utf-8")) + len(cle) + vecteur.nbytes
+            if octets > self.max_octets:
+                return
+
+            self._purger_expirees()
+            while self._entrees and (not self._slots_libres or self._octets + octets > self.max_octets):
+                self._retirer(next(iter(self._entrees)))
+                self.evictions += 1
+
+            slot = self._slots_libres.pop()
+            self._vecteurs[slot] = vecteur
+            self._lignes = max(self._lignes, slot + 1)
+            self._cle_par_slot[slot] = cle
+            self._entrees[cle] = _Entree(reponse, slot, time.monotonic(), octets, frozenset(sujet))
+            self._octets += octets
+
+    def verifier_generation(self, generation) -> bool:
+        """Vide le cache si l'index de connaissances a changé depuis le dernier appel"""
+        with self._lock:
+            if generation == self._generation:
+                return False
+            perime = self._generation is not None
+            self._generation = generation
+        if perime:
+            self.clear()
+        return perime
+
+    def clear(self):
+        with self._lock:
+            self._entrees.clear()
+            self._cle_par_slot.clear()
+            if self._vecteurs is not None:
+                self._vecteurs[:self._lignes] = 0
+            self._lignes = 0
+            self._slots_libres = list(range(self.max_entrees - 1, -1, -1))
+            self._octets = 0
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entrees": len(self._entrees),
+            "octets": self._octets,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "taux_hit": self.hits / total if total else 0.0,
+        }
+
+    def _retirer(self, cle: str):
+        entree = self._entrees.pop(cle)
+        self._vecteurs[entree.slot] = 0
+        del self._cle_par_slot[entree.slot]
+        self._slots_libres.append(entree.slot)
+        self._octets -= entree.octets
+
+    def _purger_expirees(self):
+        limite = time.monotonic() - self.ttl
+        # L'ordre LRU n'est pas l'ordre de création: on parcourt toutes les entrées
+        for cle in [c for c, e in self._entrees.items() if e.cree_le < limite]:
+            self._retirer(cle)
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+
+def estimer_tokens(texte: str) -> int:
+    """Estimation grossière (≈ 4 caractères par token) suffisante pour borner un prompt"""
+    return len(texte) // 4 + 1
+
+
+class MemoireSession:
+    """Historique d'une session, borné par un budget de tokens (fenêtre glissante)"""
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self._messages: "deque[BaseMessage]" = deque()
+        self._tokens: "deque[int]" = deque()
+        self.tokens = 0
+        self.derniere_activite = time.monotonic()
+
+    def ajouter_echange(self, question: str, reponse: str):
+        # Import différé: langchain n'est chargé qu'au premier échange
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        # Un message seul ne peut pas dépasser la moitié du budget
+        limite = self.max_tokens * 2
+        for message in (HumanMessage(content=question[:limite]), AIMessage(content=reponse[:limite])):
+            tokens = estimer_tokens(message.content)
+            self._messages.append(message)
+            self._tokens.append(tokens)
+            self.tokens += tokens
+        while self.tokens > self.max_tokens and self._messages:
+            self._messages.popleft()
+            self.tokens -= self._tokens.popleft()
+        self.derniere_activite = time.monotonic()
+
+    def messages(self) -> List["BaseMessage"]:
+        self.derniere_activite = time.monotonic()
+        return list(self._messages)
+
+
+class StoreSessions:
+    """Mémoires de conversation par session, avec éviction LRU et expiration d'inactivité.
+
+    L'empreinte totale est plafonnée à `max_sessions × max_tokens_session`,
+    quel que soit le temps depuis le démarrage du processus.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_inactivite: float = 1800,
+                 max_tokens_session: int = 1000):
+        self.max_sessions = max_sessions
+        self.ttl_inactivite = ttl_inactivite
+        self.max_tokens_session = max_tokens_session
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, MemoireSession]" = OrderedDict()
+        self.evictions = 0
+
+    def obtenir(self, session_id: str) -> MemoireSession:
+        with self._lock:
+            self._purger_inactives()
+            memoire = self._sessions.get(session_id)
+            if memoire is None:
+                memoire = MemoireSession(self.max_tokens_session)
+                self._sessions[session_id] = memoire
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            return memoire
+
+    def a_historique(self, session_id: str) -> bool:
+        """Vrai si la session existe et contient déjà des échanges (sans la créer)"""
+        with self._lock:
+            memoire = self._sessions.get(session_id)
+            return memoire is not None and bool(memoire._messages)
+
+    def vider(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "tokens": sum(m.tokens for m in self._sessions.values()),
+                "evictions": self.evictions,
+            }
+
+    def _purger_inactives(self):
+        limite = time.monotonic() - self.ttl_inactivite
+        # Les sessions sont rangées de la moins à la plus récemment utilisée
+        while self._sessions:
+            session_id, memoire = next(iter(self._sessions.items()))
+            if memoire.derniere_activite >= limite:
+                break
+            del self._sessions[session_id]
+            self.evictions += 1
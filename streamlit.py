@@ -4,7 +4,9 @@ import re
 from bs4 import BeautifulSoup
 from typing import Tuple, List
 import base64
+import json
 import os
+import uuid
 
 
 
@@ -17,6 +19,7 @@ st.set_page_config(
 
 # Constantes
 API_URL = "https://sunufiscai-henb.onrender.com/api/ask"  # Correspond à l'endpoint @app.post("/api/ask")
+API_STREAM_URL = API_URL + "/stream"  # Variante Server-Sent Events
 SALUTATIONS = ["bonjour", "salut", "hello", "hi", "coucou", "yo", "salam"]
 
 def clean_response(text: str) -> str:
@@ -51,45 +54,62 @@ def call_api(question: str) -> Tuple[bool, str]:
         if any(salut in question.lower() for salut in SALUTATIONS if len(question.split()) <= 3):
             return True, "👋 Bonjour ! Je suis votre assistant fiscal. Posez-moi votre question sur les impôts, taxes ou réglementations fiscales sénégalaises."
 
-        # Création du payload selon le modèle QuestionRequest de l'API
+        # Création du payload selon le modèle QuestionRequest de l'API.
+        # Un identifiant par navigateur: la mémoire de conversation de l'API n'est pas partagée entre utilisateurs
+        session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
         payload = {
             "question": question,
-            "user_id": "streamlit_user"  # Optionnel mais conforme au modèle
+            "user_id": session_id,
+            "session_id": session_id
         }
 
         headers = {
             "Content-Type": "application/json",
-            "Accept": "application/json"
+            "Accept": "text/event-stream"
         }
 
         with requests.Session() as session:
-            # Changement crucial: utilisation de POST au lieu de GET
+            # Flux SSE: le délai de lecture s'applique entre deux événements,
+            # une réponse LLM longue ne fait donc plus expirer la requête
             response = session.post(
-                API_URL,
+                API_STREAM_URL,
                 json=payload,  # Envoi des données en JSON
                 headers=headers,
-                timeout=10
+                timeout=(10, 30),
+                stream=True
             )
             
             response.raise_for_status()
-            data = response.json()
 
-            if not isinstance(data, dict):
-                return False, f"⚠️ Format de réponse inattendu: {str(data)}"
-            
-            # Adaptation à la structure de QAItem
-            if "answer" in data:
-                return True, data["answer"]
-            elif "output" in data:  # Alternative selon la réponse de l'API
-                return True, data["output"]
-            else:
-                return False, f"⚠️ Réponse API incomplète: {str(data)}"
+            for event, data in read_sse_events(response):
+                # Adaptation à la structure de QAItem (événement final)
+                if event == "done":
+                    if not isinstance(data, dict) or "answer" not in data:
+                        return False, f"⚠️ Réponse API incomplète: {str(data)}"
+                    return True, data["answer"]
+
+            return False, "⚠️ Réponse API incomplète: flux interrompu"
 
     except requests.exceptions.RequestException as e:
         return False, f"🔌 Erreur de connexion à l'API: {str(e)}"
     except Exception as e:
         return False, f"⚠️ Erreur inattendue: {str(e)}"
 
+def read_sse_events(response):
+    """Décode un flux Server-Sent Events en couples (événement, données JSON)"""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
 # Initialisation de l'historique
 def init_history() -> List[Tuple[str, str]]:
     return [
@@ -210,6 +230,8 @@ with st.form(key="chat_form", clear_on_submit=True):
     with col2:
         if st.form_submit_button("Nouvelle discussion"):
             st.session_state.history = init_history()
+            # Nouvelle session côté API: la mémoire de la discussion précédente n'est plus utilisée
+            st.session_state.pop("session_id", None)
             st.rerun()
 
     if submitted and user_input:
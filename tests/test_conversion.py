@@ -0,0 +1,32 @@
+"""Tags de conversion.py: mots entiers, sans perdre les formes fléchies de l'ancienne détection par sous-chaînes."""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest
+
+from conversion import TAG_PAR_DEFAUT, extract_tags
+
+
+@pytest.mark.parametrize("question, tag", [
+    ("Comment fonctionne la fiscalité locale ?", "impôt"),
+    ("Quels sont les avantages fiscaux des PME ?", "impôt"),
+    ("Quelle pénalité fiscale en cas de retard ?", "impôt"),
+    ("Quand payer mes impôts ?", "impôt"),
+    ("Comment taxer une plus-value ?", "impôt"),
+    ("Je déclare mes revenus en ligne", "déclaration"),
+    ("Déclarez-vous la TVA chaque mois ?", "déclaration"),
+    ("Quelles déclarations pour une SARL ?", "déclaration"),
+    ("Quel est le taux de l'IS ?", "IS"),
+])
+def test_formes_flechies(question, tag):
+    assert tag in extract_tags(question, "")
+
+
+@pytest.mark.parametrize("question", [
+    "Où prendre un taxi à Dakar ?",
+    "Bonjour",
+])
+def test_sans_terme_fiscal(question):
+    assert extract_tags(question, "") == [TAG_PAR_DEFAUT]
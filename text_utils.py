@@ -0,0 +1,24 @@
+import re
+import unicodedata
+
+_ESPACES = re.compile(r"\s+")
+_DIACRITIQUES = re.compile("[\u0300-\u036f]")
+_PONCTUATION_FINALE = re.compile(r"[\s?!.…,;:]+$")
+
+
+def replier_accents(texte: str) -> str:
+    """Supprime les accents (é -> e, ç -> c) sans toucher au reste du texte"""
+    if texte.isascii():
+        return texte
+    return _DIACRITIQUES.sub("", unicodedata.normalize("NFKD", texte))
+
+
+def nettoyer_question(question: str) -> str:
+    """Minuscules, espaces et ponctuation finale normalisés (accents conservés pour l'embedding)"""
+    texte = _ESPACES.sub(" ", question.lower()).strip()
+    return _PONCTUATION_FINALE.sub("", texte)
+
+
+def normaliser_question(question: str) -> str:
+    """Forme canonique d'une question: nettoyée et sans accents (clé de cache, identifiant)"""
+    return replier_accents(nettoyer_question(question))
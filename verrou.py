@@ -0,0 +1,25 @@
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou entre processus
+    fcntl = None
+
+
+class VerrouFichier:
+    """Verrou exclusif entre processus (fcntl.flock) porté par un fichier"""
+
+    def __init__(self, chemin: Path):
+        self.chemin = chemin
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.chemin, "a")
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
@@ -0,0 +1,143 @@
+import asyncio
+import contextvars
+import functools
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+
+class PoolSaturee(Exception):
+    """Trop de requêtes en cours et en attente: la requête est refusée sans attendre"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Pool saturé, réessayer dans {retry_after}s")
+        self.retry_after = retry_after
+
+
+class DelaiFileDepasse(Exception):
+    """La requête a attendu une place plus longtemps que le délai autorisé"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Délai d'attente dépassé, réessayer dans {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PoolBorne:
+    """Exécute le pipeline synchrone de l'assistant hors de la boucle asyncio.
+
+    Au plus `max_concurrence` appels s'exécutent en parallèle et au plus
+    `max_file` attendent une place; au-delà la requête est refusée
+    immédiatement (PoolSaturee), et une attente plus longue que `delai_file`
+    est abandonnée (DelaiFileDepasse). `reserver` applique les mêmes règles
+    à un traitement asynchrone qui ne passe pas par un thread (flux LLM).
+    Doit être utilisé depuis une seule boucle asyncio.
+    """
+
+    def __init__(self, max_concurrence: int = 4, max_file: int = 16, delai_file: float = 10.0):
+        self.max_concurrence = max_concurrence
+        self.max_file = max_file
+        self.delai_file = delai_file
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrence, thread_name_prefix="assistant")
+        self._places = asyncio.Semaphore(max_concurrence)
+        self._admis = 0
+        self._en_cours = 0
+        # Durée moyenne (lissée) d'un appel, pour estimer Retry-After
+        self._duree_moyenne = 1.0
+        self.compteurs = {"traitees": 0, "saturees": 0, "expirees": 0}
+
+    async def executer(self, fonction: Callable, *args) -> Tuple[Any, float]:
+        """Exécute `fonction(*args)` dans le pool; retourne (résultat, attente en ms)"""
+        attente_ms = await self._admettre()
+        boucle = asyncio.get_running_loop()
+        try:
+            # Le contexte (contextvars) de la requête suit l'appel dans le thread
+            future = self._executor.submit(contextvars.copy_context().run, fonction, *args)
+        except BaseException:
+            self._rendre()
+            raise
+        # La place n'est rendue qu'à la fin réelle de l'appel: une requête annulée (client
+        # parti, délai) ne libère pas le thread, qui continue d'occuper sa place
+        future.add_done_callback(functools.partial(self._terminer, boucle, time.monotonic()))
+        return await asyncio.wrap_future(future), attente_ms
+
+    def _terminer(self, boucle: asyncio.AbstractEventLoop, debut: float, future):
+        """Fin d'un appel (thread du pool ou annulation avant démarrage): place rendue dans la boucle"""
+        duree = time.monotonic() - debut
+        reussi = not future.cancelled() and future.exception() is None
+
+        def rendre():
+            if reussi:
+                self._duree_moyenne = 0.8 * self._duree_moyenne + 0.2 * duree
+                self.compteurs["traitees"] += 1
+            self._rendre()
+
+        try:
+            boucle.call_soon_threadsafe(rendre)
+        except RuntimeError:
+            pass  # Boucle fermée (arrêt du serveur)
+
+    async def reserver(self) -> "Place":
+        """Réserve une place pour un traitement asynchrone (flux LLM), aux mêmes conditions qu'`executer`.
+
+        La place compte dans la concurrence et la file jusqu'à `Place.liberer()`.
+        """
+        return Place(self, await self._admettre())
+
+    async def _admettre(self) -> float:
+        """Admission et attente d'une place; retourne l'attente en ms"""
+        if self._admis >= self.max_concurrence + self.max_file:
+            self.compteurs["saturees"] += 1
+            raise PoolSaturee(self._retry_after())
+
+        self._admis += 1
+        debut = time.monotonic()
+        try:
+            await asyncio.wait_for(self._places.acquire(), timeout=self.delai_file)
+        except asyncio.TimeoutError:
+            self.compteurs["expirees"] += 1
+            erreur = DelaiFileDepasse(self._retry_after())
+            self._admis -= 1
+            raise erreur
+        except BaseException:
+            self._admis -= 1
+            raise
+        self._en_cours += 1
+        return (time.monotonic() - debut) * 1000
+
+    def _rendre(self):
+        self._en_cours -= 1
+        self._places.release()
+        self._admis -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.compteurs,
+            "en_cours": self._en_cours,
+            "en_file": self._admis - self._en_cours,
+            "max_concurrence": self.max_concurrence,
+            "max_file": self.max_file,
+            "duree_moyenne_s": round(self._duree_moyenne, 3),
+        }
+
+    def fermer(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _retry_after(self) -> int:
+        en_file = max(self._admis - self._en_cours, 0)
+        return max(1, math.ceil(self._duree_moyenne * (en_file + 1) / self.max_concurrence))
+
+
+class Place:
+    """Place réservée par `PoolBorne.reserver`; `liberer` peut être appelé plusieurs fois"""
+
+    def __init__(self, pool: PoolBorne, attente_ms: float):
+        self.attente_ms = attente_ms
+        self._pool = pool
+        self._liberee = False
+
+    def liberer(self):
+        if not self._liberee:
+            self._liberee = True
+            self._pool.compteurs["traitees"] += 1
+            self._pool._rendre()